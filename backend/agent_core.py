@@ -1,15 +1,17 @@
 import json
 import logging
-from typing import Dict, Any, Optional
-from llm_client import chat
-
-from pydantic import BaseModel, Field, root_validator, ValidationError
-from typing import Literal
+from typing import Dict, Any, Callable, List, Optional
+from llm_client import chat, achat, astream_chat
+from context_builder import build_context
+from tracing import span
+from structured_output import LLMPlan, PLAN, parse
 
 logger = logging.getLogger("agent_core")
 
 SYSTEM_PROMPT = """
 You are an autonomous financial advisor agent. You receive user input and the current session state (JSON).
+The session state is compact: `user_profile` holds only the fields already known, `missing_fields` lists the
+dotted paths still unknown, `conversation_summary` digests older turns and `recent_messages` holds the latest turns.
 
 Your output MUST be valid JSON with exactly the following fields:
 - action: one of 'CALL_TOOL', 'RESPOND', 'FINISH'
@@ -23,73 +25,153 @@ If the LLM cannot produce valid JSON, return a short, safe RESPOND text only.
 """
 
 
-class LLMPlan(BaseModel):
-    action: Literal["CALL_TOOL", "RESPOND", "FINISH"]
-    tool: Optional[str] = None
-    tool_args: Optional[Dict[str, Any]] = Field(default_factory=dict)
-    updated_profile_data: Optional[Dict[str, Any]] = Field(default_factory=dict)
-    response: Optional[str] = ""
+# Default replies for terminal tool output when neither the plan nor the tool supplies text
+QUESTIONS_READY = "I have a few more questions to understand your situation better."
+REPORT_READY = "Your financial report is ready."
+
+# Safe user-facing responses for failures; internal errors are never leaked to the user
+SERVICE_UNAVAILABLE = "The analysis service is temporarily unavailable. Please try again later."
+TOOL_FAILED = "A requested operation failed. Please try again."
+FOLLOWUP_FAILED = "The analysis service failed to produce a final response. Please try again."
 
-    @root_validator(skip_on_failure=True)
-    def check_tool_required_for_call(cls, values):
-        action = values.get("action")
-        tool = values.get("tool")
-        if action == "CALL_TOOL" and not tool:
-            raise ValueError("'tool' is required when action == CALL_TOOL")
-        return values
+
+def _error_result(response: str, **extra: Any) -> Dict[str, Any]:
+    return {"response": response, "updated_profile_data": {}, "status": "RESPOND", **extra}
 
 
 def validate_plan(content: str) -> Dict[str, Any]:
     """Validate raw LLM content and return a dict:
     {valid: bool, plan: Optional[LLMPlan], errors: Optional[str]}
     """
-    # Try to parse the LLM output as JSON. If that fails, attempt to extract
-    # a JSON object from the text (common when LLM adds commentary around JSON).
-    try:
-        parsed = json.loads(content)
-    except Exception as e:
-        # Attempt to salvage JSON embedded in surrounding text
-        try:
-            import re
+    # The JSON object is extracted even when the LLM wraps it in commentary or a code fence
+    result = parse(content, PLAN)
+    if result.value is not None:
+        return {"valid": True, "plan": result.value, "errors": None}
+    return {"valid": False, "plan": None, "errors": result.error, "raw": content if result.data is None else result.data}
 
-            m = re.search(r"(\{.*\})", content, re.DOTALL)
-            if m:
-                parsed = json.loads(m.group(1))
-            else:
-                return {"valid": False, "plan": None, "errors": f"Invalid JSON: {e}", "raw": content}
-        except Exception as e2:
-            return {"valid": False, "plan": None, "errors": f"Invalid JSON: {e}; extraction failed: {e2}", "raw": content}
 
-    try:
-        plan = LLMPlan.parse_obj(parsed)
-        return {"valid": True, "plan": plan, "errors": None}
-    except ValidationError as ve:
-        return {"valid": False, "plan": None, "errors": ve.json(), "raw": parsed}
+# Streaming callback: emit(event_name, data)
+Emit = Callable[[str, Dict[str, Any]], None]
+
+class ResponseTextStream:
+    """Incrementally extract the top-level `response` string from a plan JSON as it streams in.
+
+    `feed(chunk)` returns the newly decoded characters of the `response` value
+    that may be shown now (possibly empty), so user-facing text can be forwarded
+    token by token while the rest of the plan JSON is still arriving. Keys of
+    nested objects (e.g. inside `tool_args`) are ignored.
+
+    With `hold_tool_calls`, text is held back until the top-level `action` is
+    known and dropped for CALL_TOOL, whose user-facing text comes later.
+    """
+
+    def __init__(self, hold_tool_calls: bool = False):
+        self.hold_tool_calls = hold_tool_calls
+        self._buf = ""
+        self._i = 0
+        self._depth = 0
+        self._in_string = False
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._target: Optional[str] = None  # top-level key of the string being read
+        self._chars: List[str] = []
+        self._action: Optional[str] = None
+        self._text: List[str] = []
+        self.emitted = ""
+
+    @property
+    def text(self) -> str:
+        """All `response` text decoded so far, including text held back."""
+        return "".join(self._text)
+
+    def feed(self, chunk: str) -> str:
+        self._buf += chunk
+        self._scan()
+        if self.hold_tool_calls and (self._action is None or self._action == "CALL_TOOL"):
+            return ""
+        text = self.text
+        out = text[len(self.emitted):]
+        self.emitted = text
+        return out
+
+    def _scan(self) -> None:
+        buf, i = self._buf, self._i
+        while i < len(buf):
+            c = buf[i]
+            if self._in_string:
+                if c == '"':
+                    self._end_string()
+                    i += 1
+                    continue
+                if c == "\\":
+                    # Wait for the whole escape sequence before decoding it
+                    end = i + 6 if buf[i + 1:i + 2] == "u" else i + 2
+                    if end > len(buf):
+                        break
+                    try:
+                        self._char(json.loads(f'"{buf[i:end]}"'))
+                    except ValueError:
+                        pass
+                    i = end
+                    continue
+                self._char(c)
+            elif c == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._target = "" if self._expect_key else self._key
+                    self._chars = []
+            elif c in "{[":
+                self._depth += 1
+                self._expect_key = self._depth == 1 and c == "{"
+            elif c in "}]":
+                self._depth -= 1
+            elif c == "," and self._depth == 1:
+                self._expect_key = True
+            i += 1
+        self._i = i
+
+    def _char(self, c: str) -> None:
+        if self._depth != 1:
+            return
+        if self._target == "response":
+            self._text.append(c)
+        elif self._target in ("", "action"):
+            self._chars.append(c)
+
+    def _end_string(self) -> None:
+        self._in_string = False
+        if self._depth != 1:
+            return
+        if self._target == "":
+            self._key = "".join(self._chars)
+            self._expect_key = False
+        elif self._target == "action":
+            self._action = "".join(self._chars).strip().upper()
+        self._target = None
 
 
 class Agent:
     def __init__(self):
         self.system = SYSTEM_PROMPT
 
-    def handle(self, user_input: str, session_state: Dict[str, Any]) -> Dict[str, Any]:
-        # First pass: ask the LLM what to do
-        messages = [
+    def _plan_messages(self, context: str) -> List[Dict[str, Any]]:
+        return [
             {"role": "system", "content": self.system},
-            {"role": "user", "content": json.dumps({"session_state": session_state, "user_input": user_input})}
+            {"role": "user", "content": context}
         ]
 
-        try:
-            res = chat(messages)
-            content = res.get("content", "")
-        except Exception as e:
-            logger.exception("LLM chat failed")
-            # Do not leak internal errors to the user
-            return {"response": "The analysis service is temporarily unavailable. Please try again later.", "updated_profile_data": {}, "status": "RESPOND"}
+    def _followup_messages(self, context: str, tool_name: str, tool_output: Any) -> List[Dict[str, Any]]:
+        # Send tool_output back to LLM for final response
+        return self._plan_messages(context) + [
+            {"role": "assistant", "content": json.dumps({"tool": tool_name, "tool_output": tool_output})}
+        ]
 
+    def _resolve_plan(self, content: str) -> Dict[str, Any]:
+        """Validate the first-pass plan. Returns {"plan": LLMPlan} or {"result": fallback response}."""
         validated = validate_plan(content)
         if not validated["valid"]:
             # Fallback: return a safe RESPOND message with explanation
-            return {
+            return {"result": {
                 "response": (
                     "I didn't understand that — could you rephrase? "
                     "(Agent received non-JSON or malformed plan.)"
@@ -98,42 +180,177 @@ class Agent:
                 "status": "RESPOND",
                 "llm_raw": validated.get("raw"),
                 "llm_errors": validated.get("errors"),
-            }
+            }}
+        return {"plan": validated["plan"]}
+
+    def _direct_result(self, plan: LLMPlan, content: str) -> Dict[str, Any]:
+        # RESPOND or FINISH
+        return {"response": plan.response or content, "updated_profile_data": plan.updated_profile_data or {}, "status": plan.action, "tool_output": None}
 
-        plan: LLMPlan = validated["plan"]
+    def _terminal_result(self, plan: LLMPlan, tool_name: str, tool_output: Dict[str, Any]) -> Dict[str, Any]:
+        # The tool output is the answer; reply with the plan's text (or a short default) without a follow-up call
+        response = plan.response or tool_output.get("explanation")
+        if not response:
+            response = REPORT_READY if tool_output.get("report") else QUESTIONS_READY
+        return {"response": response, "updated_profile_data": plan.updated_profile_data or {}, "status": "RESPOND", "tool": tool_name, "tool_output": tool_output}
 
-        if plan.action == "CALL_TOOL":
-            tool_name = plan.tool
-            tool_args = plan.tool_args or {}
-            # Execute tool via langgraph_adapter (uses LangGraph if available)
-            try:
-                from langgraph_adapter import execute_tool
+    def _final_result(self, final_content: str, tool_output: Any) -> Dict[str, Any]:
+        final_validated = validate_plan(final_content)
+        if not final_validated["valid"]:
+            # Fallback: return raw final content as a response
+            logger.warning("Final plan not valid JSON: %s", final_validated.get("errors"))
+            return {"response": final_content, "updated_profile_data": {}, "status": "RESPOND", "tool_output": tool_output}
+
+        final_plan: LLMPlan = final_validated["plan"]
+        return {"response": final_plan.response or "", "updated_profile_data": final_plan.updated_profile_data or {}, "status": final_plan.action, "tool_output": tool_output}
+
+    def handle(self, user_input: str, session_state: Dict[str, Any], tool_outputs: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Plan, run a tool and follow up. `tool_outputs` maps tool names to
+        precomputed outputs used instead of executing those tools."""
+        # Build the compact context once; the follow-up call reuses it
+        with span("agent"):
+            context, metrics = build_context(session_state, user_input)
+            result = self._handle(session_state, context, tool_outputs)
+        result["prompt_metrics"] = metrics
+        return result
+
+    def _handle(self, session_state: Dict[str, Any], context: str, tool_outputs: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        # First pass: ask the LLM what to do
+        try:
+            with span("agent.plan"):
+                res = chat(self._plan_messages(context))
+            content = res.get("content", "")
+        except Exception as e:
+            logger.exception("LLM chat failed")
+            # Do not leak internal errors to the user
+            return _error_result(SERVICE_UNAVAILABLE)
+
+        resolved = self._resolve_plan(content)
+        if "result" in resolved:
+            return resolved["result"]
+        plan: LLMPlan = resolved["plan"]
+
+        if plan.action != "CALL_TOOL":
+            return self._direct_result(plan, content)
+
+        tool_name = plan.tool
+        tool_args = plan.tool_args or {}
+        # Execute tool via langgraph_adapter (uses LangGraph if available)
+        try:
+            from langgraph_adapter import execute_tool, is_terminal
+            if tool_outputs and tool_name in tool_outputs:
+                tool_output = tool_outputs[tool_name]
+            else:
                 tool_output = execute_tool(tool_name, tool_args or {}, session_state)
-            except Exception as e:
-                logger.exception("Tool execution failed: %s", tool_name)
-                return {"response": "A requested operation failed. Please try again.", "updated_profile_data": {}, "status": "RESPOND"}
-
-            # Send tool_output back to LLM for final response
-            followup = [
-                {"role": "system", "content": self.system},
-                {"role": "user", "content": json.dumps({"session_state": session_state, "user_input": user_input})},
-                {"role": "assistant", "content": json.dumps({"tool": tool_name, "tool_output": tool_output})}
-            ]
-            try:
-                final = chat(followup)
-                final_content = final.get("content", "")
-            except Exception:
-                logger.exception("LLM follow-up failed after tool %s", tool_name)
-                return {"response": "The analysis service failed to produce a final response. Please try again.", "updated_profile_data": {}, "status": "RESPOND", "tool_output": tool_output}
-            final_validated = validate_plan(final_content)
-            if not final_validated["valid"]:
-                # Fallback: return raw final content as a response
-                logger.warning("Final plan not valid JSON: %s", final_validated.get("errors"))
-                return {"response": final_content, "updated_profile_data": {}, "status": "RESPOND", "tool_output": tool_output}
-
-            final_plan: LLMPlan = final_validated["plan"]
-            return {"response": final_plan.response or "", "updated_profile_data": final_plan.updated_profile_data or {}, "status": final_plan.action, "tool_output": tool_output}
-
-        else:
-            # RESPOND or FINISH
-            return {"response": plan.response or content, "updated_profile_data": plan.updated_profile_data or {}, "status": plan.action, "tool_output": None}
+        except Exception as e:
+            logger.exception("Tool execution failed: %s", tool_name)
+            return _error_result(TOOL_FAILED)
+
+        if is_terminal(tool_name, tool_output):
+            return self._terminal_result(plan, tool_name, tool_output)
+
+        try:
+            with span("agent.followup"):
+                final = chat(self._followup_messages(context, tool_name, tool_output))
+            final_content = final.get("content", "")
+        except Exception:
+            logger.exception("LLM follow-up failed after tool %s", tool_name)
+            return _error_result(FOLLOWUP_FAILED, tool=tool_name, tool_output=tool_output)
+        return {**self._final_result(final_content, tool_output), "tool": tool_name}
+
+    async def ahandle(
+        self,
+        user_input: str,
+        session_state: Dict[str, Any],
+        emit: Optional[Emit] = None,
+        tool_outputs: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Async counterpart of `handle`; awaits the LLM and tool calls instead of blocking.
+
+        With `emit`, LLM calls are streamed and progress is reported as events:
+        `token` ({"text"}) for user-facing response text, `plan` ({"action", "tool"}),
+        `tool_start` ({"tool"}) and `tool_end` ({"tool", "terminal"}).
+        """
+        with span("agent"):
+            context, metrics = build_context(session_state, user_input)
+            result = await self._ahandle(session_state, context, emit, tool_outputs)
+        result["prompt_metrics"] = metrics
+        return result
+
+    async def _achat(self, messages: List[Dict[str, Any]], emit: Optional[Emit], stream: Optional[ResponseTextStream] = None) -> Dict[str, Any]:
+        if emit is None:
+            return await achat(messages)
+        stream = stream or ResponseTextStream()
+
+        def on_token(chunk: str) -> None:
+            text = stream.feed(chunk)
+            if text:
+                emit("token", {"text": text})
+
+        return await astream_chat(messages, on_token=on_token)
+
+    @staticmethod
+    def _streamed(result: Dict[str, Any], emit: Optional[Emit], stream: Optional[ResponseTextStream] = None) -> Dict[str, Any]:
+        """Emit whatever part of the final response text has not been streamed yet."""
+        if emit is not None:
+            sent = stream.emitted if stream is not None else ""
+            response = result.get("response") or ""
+            if response.startswith(sent) and len(response) > len(sent):
+                emit("token", {"text": response[len(sent):]})
+        return result
+
+    async def _ahandle(
+        self,
+        session_state: Dict[str, Any],
+        context: str,
+        emit: Optional[Emit] = None,
+        tool_outputs: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        # Plan text is only streamed for RESPOND/FINISH; a tool call's reply comes later
+        plan_stream = ResponseTextStream(hold_tool_calls=True)
+        try:
+            with span("agent.plan"):
+                res = await self._achat(self._plan_messages(context), emit, plan_stream)
+            content = res.get("content", "")
+        except Exception:
+            logger.exception("LLM chat failed")
+            return _error_result(SERVICE_UNAVAILABLE)
+
+        resolved = self._resolve_plan(content)
+        if "result" in resolved:
+            return resolved["result"]
+        plan: LLMPlan = resolved["plan"]
+        if emit is not None:
+            emit("plan", {"action": plan.action, "tool": plan.tool})
+
+        if plan.action != "CALL_TOOL":
+            return self._streamed(self._direct_result(plan, content), emit, plan_stream)
+
+        tool_name = plan.tool
+        if emit is not None:
+            emit("tool_start", {"tool": tool_name})
+        try:
+            from langgraph_adapter import aexecute_tool, is_terminal
+            if tool_outputs and tool_name in tool_outputs:
+                tool_output = tool_outputs[tool_name]
+            else:
+                tool_output = await aexecute_tool(tool_name, plan.tool_args or {}, session_state)
+        except Exception:
+            logger.exception("Tool execution failed: %s", tool_name)
+            return _error_result(TOOL_FAILED)
+
+        terminal = is_terminal(tool_name, tool_output)
+        if emit is not None:
+            emit("tool_end", {"tool": tool_name, "terminal": terminal})
+        if terminal:
+            return self._streamed(self._terminal_result(plan, tool_name, tool_output), emit)
+
+        final_stream = ResponseTextStream()
+        try:
+            with span("agent.followup"):
+                final = await self._achat(self._followup_messages(context, tool_name, tool_output), emit, final_stream)
+            final_content = final.get("content", "")
+        except Exception:
+            logger.exception("LLM follow-up failed after tool %s", tool_name)
+            return _error_result(FOLLOWUP_FAILED, tool=tool_name, tool_output=tool_output)
+        return self._streamed({**self._final_result(final_content, tool_output), "tool": tool_name}, emit, final_stream)
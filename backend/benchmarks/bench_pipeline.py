@@ -0,0 +1,231 @@
+"""Offline end-to-end benchmark of the agent pipeline.
+
+Runs against the deterministic mock LLM provider (`mock_llm`), so it needs no
+network access or API keys. The response cache is disabled by default so every
+request exercises the full path. Storage goes to a temporary DATA_DIR.
+
+Targets:
+- chat:       POST /chat through the ASGI app (one session per concurrent user)
+- agent:      Agent.ahandle
+- analysis:   analysis_agent (async)
+- strategist: StrategistAgent.analyze_decision (sync workflow, run in threads)
+
+For each target it reports p50/p95/p99 latency, throughput and errors, plus
+process peak RSS (and the tracemalloc peak with --trace-memory).
+
+Example (from the backend directory):
+    python benchmarks/bench_pipeline.py --requests 200 --concurrency 16 \\
+        --latency-ms 50 --jitter-ms 20 --check chat.p95_ms<=400 --check agent.rps>=50
+
+Each --check is `<target>.<metric><=<value>` or `>=`; any failed check makes the
+script exit with status 1, which is what CI keys off.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERSONAS_PATH = os.path.join(BACKEND_DIR, "..", "arthSaathiApp", "data", "personas.json")
+TARGETS = ("chat", "agent", "analysis", "strategist")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with a mock LLM")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated subset of: " + ", ".join(TARGETS))
+    parser.add_argument("--requests", type=int, default=100, help="requests per target")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mock LLM base latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="mock LLM uniform jitter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--json", dest="json_path", help="write results as JSON to this path")
+    parser.add_argument("--check", action="append", default=[], help="threshold, e.g. chat.p95_ms<=400")
+    return parser.parse_args()
+
+
+def configure_env(args: argparse.Namespace) -> None:
+    # Must run before any backend module is imported
+    os.environ["LLM_PROVIDER"] = "mock"
+    os.environ["MOCK_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["MOCK_LLM_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["MOCK_LLM_SEED"] = str(args.seed)
+    os.environ["LLM_CACHE_ENABLED"] = "1" if args.cache else "0"
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="arthsaathi-bench-"))
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    except Exception:
+        return 0.0
+
+
+async def run_target(call: Callable[[int], Awaitable[Any]], requests: int, concurrency: int, trace_memory: bool) -> Dict[str, Any]:
+    import tracemalloc
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    if trace_memory:
+        tracemalloc.start()
+    wall = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - wall
+    traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+
+    latencies.sort()
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        "rps": round(requests / wall, 2) if wall else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if traced_peak is not None:
+        result["tracemalloc_peak_mb"] = round(traced_peak / (1024 * 1024), 2)
+    return result
+
+
+def build_targets(concurrency: int) -> Dict[str, Callable[[int], Awaitable[Any]]]:
+    import httpx
+
+    import main_api
+    from agent_core import Agent
+    from tools import aanalysis_agent
+
+    def default_session() -> Dict[str, Any]:
+        return {
+            "user_profile": {
+                "income": {"amount": None, "stability": None, "notes": ""},
+                "debt": {"has_debt": None, "details": [], "status": "incomplete"},
+                "assets": {"savings": None, "investments": [], "liquidity": None},
+                "goals": {"short_term": None, "long_term": None},
+                "psychology": {"risk_tolerance": None, "spending_habits": None},
+            },
+            "messages": [],
+        }
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main_api.app), base_url="http://bench")
+    sessions: Dict[int, str] = {}
+
+    async def chat(i: int) -> None:
+        # Requests are spread over `concurrency` users, each carrying on its own conversation
+        user = i % concurrency
+        payload = {"user_input": f"My monthly income is around {20000 + i} rupees", "session_id": sessions.get(user)}
+        r = await client.post("/chat", json=payload)
+        r.raise_for_status()
+        sessions[user] = r.json()["session_id"]
+
+    agent = Agent()
+
+    async def run_agent(i: int) -> None:
+        await agent.ahandle(f"I earn {20000 + i} a month", default_session())
+
+    async def analysis(i: int) -> None:
+        profile = default_session()["user_profile"]
+        profile["income"]["amount"] = 20000 + i
+        await aanalysis_agent({"profile": profile, "rounds": 1})
+
+    cases = []
+    with open(PERSONAS_PATH, "r", encoding="utf-8") as f:
+        for persona in json.load(f)["personas"]:
+            for event in persona.get("events", []):
+                for choice in event.get("choices", []):
+                    cases.append((persona, event, choice))
+    strategist = main_api.get_strategist()
+
+    async def run_strategist(i: int) -> None:
+        persona, event, choice = cases[i % len(cases)]
+        await asyncio.to_thread(strategist.analyze_decision, persona["id"], persona, event["event_id"], event, choice["id"])
+
+    return {"chat": chat, "agent": run_agent, "analysis": analysis, "strategist": run_strategist}
+
+
+def evaluate_checks(results: Dict[str, Dict[str, Any]], checks: List[str]) -> List[str]:
+    failures = []
+    for check in checks:
+        m = re.fullmatch(r"(\w+)\.(\w+)\s*(<=|>=)\s*([\d.]+)", check.strip())
+        if not m:
+            failures.append(f"invalid check: {check}")
+            continue
+        target, metric, op, limit = m.group(1), m.group(2), m.group(3), float(m.group(4))
+        value = results.get(target, {}).get(metric)
+        if value is None:
+            failures.append(f"{check}: no such result")
+        elif (op == "<=" and value > limit) or (op == ">=" and value < limit):
+            failures.append(f"{check}: got {value}")
+    return failures
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    targets = build_targets(args.concurrency)
+    results: Dict[str, Dict[str, Any]] = {}
+    for name in [t.strip() for t in args.targets.split(",") if t.strip()]:
+        if name not in targets:
+            raise SystemExit(f"unknown target: {name}")
+        # One untimed warm-up call (client construction, graph compilation, imports)
+        await targets[name](0)
+        results[name] = await run_target(targets[name], args.requests, args.concurrency, args.trace_memory)
+    return results
+
+
+def main() -> None:
+    args = parse_args()
+    configure_env(args)
+    results = asyncio.run(main_async(args))
+
+    fmt = "{:<11} {:>8} {:>9} {:>9} {:>9} {:>9} {:>7} {:>9}"
+    print(f"mock LLM latency={args.latency_ms}ms jitter={args.jitter_ms}ms concurrency={args.concurrency} cache={'on' if args.cache else 'off'}")
+    print(fmt.format("target", "requests", "p50 ms", "p95 ms", "p99 ms", "rps", "errors", "rss MB"))
+    for name, r in results.items():
+        print(fmt.format(name, r["requests"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["rps"], r["errors"], r["peak_rss_mb"]))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+    failures = evaluate_checks(results, args.check)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Micro-benchmark of structured-output extraction.
+
+Compares the previous approach (`json.loads`, then a greedy `\\{.*\\}` regex
+over the whole completion) with `structured_output.extract_json` on typical and
+adversarial LLM outputs: clean JSON, fenced JSON, JSON wrapped in prose,
+malformed output, a ~1 MB completion and runs of unmatched braces (where the
+regex backtracks quadratically).
+
+Example (from the backend directory):
+    python benchmarks/bench_structured_output.py --repeat 20
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_output import PLAN, extract_json, parse  # noqa: E402
+
+PLAN_JSON = json.dumps({"action": "RESPOND", "tool": None, "tool_args": {}, "updated_profile_data": {"income": {"amount": 30000}}, "response": "Thanks! {noted}"})
+
+
+def greedy_extract(text: str) -> Optional[Any]:
+    try:
+        return json.loads(text)
+    except Exception:
+        m = re.search(r"(\{.*\})", text, re.DOTALL)
+        if not m:
+            return None
+        try:
+            return json.loads(m.group(1))
+        except Exception:
+            return None
+
+
+def build_cases(size_kb: int, braces: int) -> Dict[str, str]:
+    filler = "The user mentioned rent, groceries and fuel costs. " * (size_kb * 1024 // 52)
+    return {
+        "clean": PLAN_JSON,
+        "fenced": f"```json\n{PLAN_JSON}\n```",
+        "prose": f"Sure, here is the plan: {PLAN_JSON} Let me know if {{anything}} else is needed.",
+        "malformed": '{"action": "RESPOND", "response": "cut off mid-sent',
+        "long_prose": f"{filler}{PLAN_JSON}{filler}",
+        "unmatched_braces": "{" * braces + " no closing brace",
+        "unmatched_then_json": "{ " * braces + PLAN_JSON,
+    }
+
+
+def time_call(fn: Callable[[str], Any], text: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Structured-output extraction benchmark")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--size-kb", type=int, default=1024, help="size of the long_prose case")
+    parser.add_argument("--braces", type=int, default=5000, help="unmatched braces in the adversarial cases")
+    args = parser.parse_args()
+
+    fmt = "{:<20} {:>10} {:>12} {:>12} {:>8} {:>8}"
+    print(fmt.format("case", "chars", "greedy ms", "linear ms", "greedy", "linear"))
+    for name, text in build_cases(args.size_kb, args.braces).items():
+        greedy_ms = time_call(greedy_extract, text, args.repeat)
+        linear_ms = time_call(extract_json, text, args.repeat)
+        found = lambda value: "ok" if value is not None else "none"  # noqa: E731
+        print(fmt.format(name, len(text), f"{greedy_ms:.3f}", f"{linear_ms:.3f}", found(greedy_extract(text)), found(extract_json(text))))
+
+    validate_ms = time_call(lambda t: parse(t, PLAN), PLAN_JSON, max(args.repeat, 1000))
+    print(f"\nparse+validate LLMPlan (precompiled adapter): {validate_ms * 1000:.1f} µs/call")
+
+
+if __name__ == "__main__":
+    main()
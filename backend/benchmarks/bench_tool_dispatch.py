@@ -0,0 +1,66 @@
+"""Micro-benchmark: per-call overhead of tool dispatch.
+
+Compares, for each cheap (non-LLM) tool:
+- direct:   calling the tool function through `call_tool`
+- graph:    `execute_tool` through the compiled, cached LangGraph graph
+- rebuild:  building and compiling a graph on every call (the old behaviour)
+
+Run from the backend directory:
+    python benchmarks/bench_tool_dispatch.py [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import langgraph_adapter as la  # noqa: E402
+
+CASES = {
+    "profile_store_get": {},
+    "profile_store_update": {"income": {"amount": 25000}},
+    "calculator": {"op": "sum", "numbers": [1, 2, 3]},
+    "question_generator": {"topic": "savings", "structured": True},
+    "report_generator": {"income": {"amount": 25000}},
+}
+
+
+def _per_call_us(fn, iterations: int) -> float:
+    for _ in range(min(50, iterations)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    if la.get_tool_graph() is None:
+        print("LangGraph is not available (or TOOL_DISPATCH=direct); only direct dispatch can be measured.")
+
+    session = {"user_profile": {"income": {"amount": 20000}}}
+    rows = []
+    for tool, tool_args in CASES.items():
+        direct = _per_call_us(lambda: la.call_tool(tool, tool_args, session), args.iterations)
+        graph = rebuild = None
+        if la.get_tool_graph() is not None:
+            graph = _per_call_us(lambda: la.execute_tool(tool, tool_args, session), args.iterations)
+            state = {"tool": tool, "args": tool_args, "session_state": session}
+            rebuild = _per_call_us(lambda: la.build_tool_graph().invoke(state), max(1, args.iterations // 20))
+        rows.append((tool, direct, graph, rebuild))
+
+    fmt = "{:<22} {:>12} {:>12} {:>14} {:>16}"
+    print(fmt.format("tool", "direct (us)", "graph (us)", "rebuild (us)", "graph overhead"))
+    for tool, direct, graph, rebuild in rows:
+        cell = lambda v: "-" if v is None else f"{v:.1f}"  # noqa: E731
+        overhead = "-" if graph is None else f"{graph - direct:.1f} us"
+        print(fmt.format(tool, cell(direct), cell(graph), cell(rebuild), overhead))
+
+
+if __name__ == "__main__":
+    main()
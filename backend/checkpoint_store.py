@@ -0,0 +1,270 @@
+"""SQLite checkpoint saver for LangGraph workflows (StrategistAgent runs).
+
+With a checkpointer, LangGraph saves the workflow state after every superstep
+and the outputs of each finished node as "pending writes". A run that fails or
+is stopped part-way can then be resumed from its last checkpoint with
+`invoke(None, config)`: finished nodes are not run again, so their LLM calls
+are not repeated (e.g. `analysis_report` survives a failed insights call).
+
+`SqliteCheckpointSaver` implements `BaseCheckpointSaver` on a WAL-mode database
+under `storage.DATA_DIR` (CHECKPOINT_DB_PATH), with one connection per thread as
+in `sqlite_store`. Channel values are stored inline with each checkpoint; the
+strategist state is small and a run has only a few checkpoints. Threads are
+deleted when their run completes, and checkpoints older than CHECKPOINT_TTL_S
+(abandoned runs) are pruned every CHECKPOINT_PRUNE_EVERY saves.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from storage import DATA_DIR
+
+STRATEGIST_CHECKPOINTS = os.environ.get("STRATEGIST_CHECKPOINTS", "1") == "1"
+CHECKPOINT_DB_PATH = os.environ.get("CHECKPOINT_DB_PATH") or os.path.join(DATA_DIR, "checkpoints.db")
+CHECKPOINT_TTL_S = float(os.environ.get("CHECKPOINT_TTL_S", str(24 * 3600)))
+CHECKPOINT_PRUNE_EVERY = int(os.environ.get("CHECKPOINT_PRUNE_EVERY", "500"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id     TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_id     TEXT,
+    type          TEXT NOT NULL,
+    checkpoint    BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata      BLOB NOT NULL,
+    created_at    REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id     TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id       TEXT NOT NULL,
+    idx           INTEGER NOT NULL,
+    channel       TEXT NOT NULL,
+    type          TEXT NOT NULL,
+    value         BLOB NOT NULL,
+    task_path     TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_checkpoints_created_at ON checkpoints (created_at);
+"""
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    def __init__(self, path: str = CHECKPOINT_DB_PATH, ttl_s: float = CHECKPOINT_TTL_S):
+        super().__init__()
+        self.path = path
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        self._guard = threading.Lock()
+        self._puts_since_prune = 0
+        self._stats = {"checkpoints": 0, "writes": 0, "threads_deleted": 0, "pruned": 0, "runs": 0, "resumed": 0, "completed": 0, "failed": 0}
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+        self.prune()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads (parallel branches run on a pool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._guard:
+            self._stats[key] += n
+
+    def _tuple(self, row: Tuple[Any, ...]) -> CheckpointTuple:
+        thread_id, ns, checkpoint_id, parent_id, ctype, checkpoint, mtype, metadata = row
+        writes = self._conn().execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((ctype, checkpoint)),
+            metadata=self.serde.loads_typed((mtype, metadata)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}} if parent_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((wtype, value))) for task_id, channel, wtype, value in writes],
+        )
+
+    _COLUMNS = "thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            row = self._conn().execute(
+                f"SELECT {self._COLUMNS} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, ns, checkpoint_id),
+            ).fetchone()
+        else:
+            # Checkpoint ids are time-ordered, so the largest is the latest
+            row = self._conn().execute(
+                f"SELECT {self._COLUMNS} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, ns),
+            ).fetchone()
+        return self._tuple(row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(f"SELECT {self._COLUMNS} FROM checkpoints {where} ORDER BY checkpoint_id DESC", params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                return
+            item = self._tuple(row)
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield item
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        ctype, cblob = self.serde.dumps_typed(checkpoint)
+        mtype, mblob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, ns, checkpoint["id"], config["configurable"].get("checkpoint_id"), ctype, cblob, mtype, mblob, time.time()),
+            )
+        self._count("checkpoints")
+        with self._guard:
+            self._puts_since_prune += 1
+            due = self._puts_since_prune >= CHECKPOINT_PRUNE_EVERY
+        if due:
+            self.prune()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            wtype, blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, wtype, blob, task_path))
+        sql = "INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        with self._conn() as conn:
+            # Regular writes keep their first value; special ones (errors, interrupts; negative idx) are replaced
+            conn.executemany("INSERT OR IGNORE " + sql, [r for r in rows if r[4] >= 0])
+            conn.executemany("INSERT OR REPLACE " + sql, [r for r in rows if r[4] < 0])
+        self._count("writes", len(rows))
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        self._count("threads_deleted")
+
+    def prune(self) -> int:
+        """Delete every thread whose latest checkpoint is older than the TTL; returns threads removed."""
+        cutoff = time.time() - self.ttl_s
+        with self._conn() as conn:
+            stale = [r[0] for r in conn.execute("SELECT thread_id FROM checkpoints GROUP BY thread_id HAVING MAX(created_at) < ?", (cutoff,))]
+            for thread_id in stale:
+                conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        with self._guard:
+            self._puts_since_prune = 0
+            self._stats["pruned"] += len(stale)
+        return len(stale)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+    def record_run(self, outcome: str) -> None:
+        """Count a workflow run outcome: "runs", "resumed", "completed" or "failed"."""
+        self._count(outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._guard:
+            out: Dict[str, Any] = dict(self._stats)
+        try:
+            out["open_threads"] = self._conn().execute("SELECT COUNT(DISTINCT thread_id) FROM checkpoints").fetchone()[0]
+        except Exception:
+            out["open_threads"] = None
+        return out
+
+
+_default_saver: Optional[SqliteCheckpointSaver] = None
+_default_lock = threading.Lock()
+
+
+def default_saver() -> Optional[SqliteCheckpointSaver]:
+    """Process-wide saver, or None when STRATEGIST_CHECKPOINTS=0."""
+    global _default_saver
+    if not STRATEGIST_CHECKPOINTS:
+        return None
+    with _default_lock:
+        if _default_saver is None:
+            _default_saver = SqliteCheckpointSaver()
+        return _default_saver
+
+
+def checkpoint_stats() -> Dict[str, Any]:
+    saver = _default_saver
+    return saver.stats() if saver is not None else {"enabled": STRATEGIST_CHECKPOINTS}
@@ -0,0 +1,138 @@
+"""Compact prompt context for `Agent.handle`.
+
+Instead of dumping the whole session (including every message) into each
+prompt, the agent sends:
+- the `user_profile` sections that hold data, plus the dotted paths of fields
+  that are still empty;
+- a rolling summary of older messages, kept in `session["context_summary"]`
+  and extended incrementally as messages age out of the recent window;
+- the last N messages verbatim;
+all trimmed to fit a token budget. Token counts are estimated at ~4 characters
+per token, which is close enough for budgeting.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, List, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("AGENT_CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_RECENT_MESSAGES = int(os.environ.get("AGENT_CONTEXT_RECENT_MESSAGES", "6"))
+SUMMARY_MAX_CHARS = int(os.environ.get("AGENT_CONTEXT_SUMMARY_CHARS", "800"))
+SUMMARY_SNIPPET_CHARS = 80
+MESSAGE_MAX_CHARS = 500
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "prompt_tokens_est": 0, "max_prompt_tokens_est": 0, "trimmed": 0}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def compact_profile(profile: Dict[str, Any], prefix: str = "") -> Tuple[Dict[str, Any], List[str]]:
+    """Split a profile into its filled-in part and the dotted paths of empty fields."""
+    filled: Dict[str, Any] = {}
+    missing: List[str] = []
+    for key, value in (profile or {}).items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and value:
+            sub_filled, sub_missing = compact_profile(value, f"{path}.")
+            if sub_filled:
+                filled[key] = sub_filled
+            missing.extend(sub_missing)
+        elif _is_empty(value):
+            missing.append(path)
+        else:
+            filled[key] = value
+    return filled, missing
+
+
+def _snippet(message: Dict[str, Any], limit: int) -> str:
+    text = " ".join(str(message.get("content", "")).split())
+    if len(text) > limit:
+        text = text[: limit - 1] + "…"
+    return f"{message.get('role', '?')}: {text}"
+
+
+def update_summary(session_state: Dict[str, Any], upto: int) -> str:
+    """Extend the rolling summary so it covers messages[:upto]; returns the summary text.
+
+    Only messages not yet covered are digested, so the cost per turn is constant.
+    The oldest part of the summary is dropped once it exceeds SUMMARY_MAX_CHARS.
+    """
+    messages = session_state.get("messages", []) or []
+    summary = session_state.get("context_summary") or {"covered": 0, "text": ""}
+    covered = summary.get("covered", 0)
+    if upto < covered:
+        # History was shortened; rebuild from scratch
+        covered, summary = 0, {"covered": 0, "text": ""}
+    if upto > covered:
+        digest = " | ".join(_snippet(m, SUMMARY_SNIPPET_CHARS) for m in messages[covered:upto] if isinstance(m, dict) and m.get("content"))
+        text = " | ".join(t for t in (summary["text"], digest) if t)
+        if len(text) > SUMMARY_MAX_CHARS:
+            text = "…" + text[-(SUMMARY_MAX_CHARS - 1):]
+        summary = {"covered": upto, "text": text}
+        session_state["context_summary"] = summary
+    return summary["text"]
+
+
+def build_context(session_state: Dict[str, Any], user_input: str, budget: int = None) -> Tuple[str, Dict[str, Any]]:
+    """Return (prompt payload JSON, metrics) for the agent's user message.
+
+    The payload keeps the `{"session_state": ..., "user_input": ...}` shape the
+    system prompt describes, with a compact session_state.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    messages = [m for m in (session_state.get("messages", []) or []) if isinstance(m, dict)]
+    window_start = max(0, len(messages) - CONTEXT_RECENT_MESSAGES)
+    summary = update_summary(session_state, window_start)
+    filled, missing = compact_profile(session_state.get("user_profile", {}))
+    recent = [{"role": m.get("role"), "content": str(m.get("content", ""))[:MESSAGE_MAX_CHARS]} for m in messages[window_start:]]
+
+    def render() -> str:
+        state: Dict[str, Any] = {"user_profile": filled, "missing_fields": missing}
+        if summary:
+            state["conversation_summary"] = summary
+        if recent:
+            state["recent_messages"] = recent
+        return json.dumps({"session_state": state, "user_input": user_input}, ensure_ascii=False)
+
+    payload = render()
+    trimmed = False
+    # Over budget: drop the oldest recent messages first, then the summary
+    while estimate_tokens(payload) > budget and recent:
+        recent.pop(0)
+        trimmed = True
+        payload = render()
+    if estimate_tokens(payload) > budget and summary:
+        summary = ""
+        trimmed = True
+        payload = render()
+
+    tokens = estimate_tokens(payload)
+    metrics = {
+        "prompt_chars": len(payload),
+        "prompt_tokens_est": tokens,
+        "budget": budget,
+        "recent_messages": len(recent),
+        "summarized_messages": window_start,
+        "missing_fields": len(missing),
+        "trimmed": trimmed,
+    }
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["prompt_tokens_est"] += tokens
+        _stats["max_prompt_tokens_est"] = max(_stats["max_prompt_tokens_est"], tokens)
+        _stats["trimmed"] += int(trimmed)
+    return payload, metrics
+
+
+def context_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["avg_prompt_tokens_est"] = round(out["prompt_tokens_est"] / out["requests"], 1) if out["requests"] else 0.0
+    return out
@@ -0,0 +1,360 @@
+"""Persistent background job queue for long-running work (strategist analyses).
+
+Jobs are rows of a SQLite database under `storage.DATA_DIR` (JOBS_DB_PATH), so
+queued work survives restarts and every API worker process, as well as
+standalone workers (`python jobs.py worker`), can share one queue:
+- `submit` inserts a `queued` job and returns its id;
+- a dispatcher thread claims queued jobs atomically (BEGIN IMMEDIATE) and runs
+  them on a pool of JOB_WORKERS threads; JOB_WORKERS=0 only enqueues, leaving
+  the work to other processes;
+- running jobs are heartbeated; a job whose worker stopped heartbeating for
+  JOB_LEASE_S, or whose handler raised `RetryableJobError`, is requeued (up to
+  JOB_MAX_ATTEMPTS runs) or failed; any other exception fails the job;
+- `cancel` drops a queued job at once and asks a running one to stop: handlers
+  get a `should_stop()` callable to check between steps;
+- finished jobs are kept for JOB_RESULT_TTL_S and at most JOB_MAX_FINISHED of
+  them, oldest purged first.
+
+Handlers are registered by kind in HANDLERS as "module:function" and imported on
+first use; a handler takes (payload, should_stop) and returns a JSON result.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from storage import DATA_DIR
+
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH") or os.path.join(DATA_DIR, "jobs.db")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_POLL_S = float(os.environ.get("JOB_POLL_S", "1.0"))
+JOB_LEASE_S = float(os.environ.get("JOB_LEASE_S", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "2"))
+JOB_RESULT_TTL_S = float(os.environ.get("JOB_RESULT_TTL_S", str(24 * 3600)))
+JOB_MAX_FINISHED = int(os.environ.get("JOB_MAX_FINISHED", "1000"))
+
+HANDLERS = {
+    "strategist.analyze": "strategist_agent:run_analysis_job",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id           TEXT PRIMARY KEY,
+    kind             TEXT NOT NULL,
+    status           TEXT NOT NULL,
+    payload          TEXT NOT NULL,
+    result           TEXT,
+    error            TEXT,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker           TEXT,
+    created_at       REAL NOT NULL,
+    started_at       REAL,
+    heartbeat_at     REAL,
+    finished_at      REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at);
+"""
+
+logger = logging.getLogger("jobs")
+
+
+class UnknownJobKind(ValueError):
+    """Raised by `submit` for a kind without a registered handler."""
+
+
+class RetryableJobError(RuntimeError):
+    """Raised by a handler for a transient failure; the job is run again while attempts remain.
+
+    `result` (e.g. a partial report) is stored if the job fails for good.
+    """
+
+    def __init__(self, message: str, result: Any = None):
+        super().__init__(message)
+        self.result = result
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _resolve(kind: str) -> Callable[[Dict[str, Any], Callable[[], bool]], Any]:
+    module, _, name = HANDLERS[kind].partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class JobQueue:
+    def __init__(self, path: str = JOBS_DB_PATH, workers: int = JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._guard = threading.Lock()
+        self._running: Set[str] = set()
+        self._cancelled: Set[str] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._stats = {"submitted": 0, "claimed": 0, "done": 0, "failed": 0, "cancelled": 0, "requeued": 0, "purged": 0}
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._guard:
+            self._stats[key] += n
+
+    # --- Client API ---
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in HANDLERS:
+            raise UnknownJobKind(kind)
+        job_id = uuid.uuid4().hex
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, _dumps(payload), time.time()),
+            )
+        self._count("submitted")
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row, include_result) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        if status:
+            rows = self._conn().execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)).fetchall()
+        else:
+            rows = self._conn().execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(r, include_result=False) for r in rows]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job now, or ask a running one to stop; returns the job, None if unknown."""
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (now, job_id),
+            )
+            if cur.rowcount:
+                self._count("cancelled")
+            else:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,))
+        with self._guard:
+            if job_id in self._running:
+                self._cancelled.add(job_id)
+        return self.get(job_id, include_result=False)
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row, include_result: bool) -> Dict[str, Any]:
+        job = {k: row[k] for k in ("job_id", "kind", "status", "attempts", "error", "created_at", "started_at", "finished_at")}
+        job["cancel_requested"] = bool(row["cancel_requested"])
+        if include_result and row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        return job
+
+    # --- Workers ---
+
+    def start(self) -> None:
+        """Start the dispatcher and worker threads (no-op when JOB_WORKERS=0 or already started)."""
+        if self.workers <= 0 or self._dispatcher is not None:
+            return
+        self._stopping.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop claiming jobs; running jobs finish (or are requeued after their lease if the process exits)."""
+        if self._dispatcher is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._dispatcher.join()
+        self._pool.shutdown(wait=wait)
+        self._dispatcher = self._pool = None
+
+    def _dispatch_loop(self) -> None:
+        last_maintenance = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() - last_maintenance >= min(JOB_LEASE_S / 3, 60):
+                    self._maintain()
+                    last_maintenance = time.monotonic()
+                while len(self._running) < self.workers and not self._stopping.is_set():
+                    job = self._claim()
+                    if job is None:
+                        break
+                    self._pool.submit(self._run, job)
+            except Exception:
+                logger.exception("Job dispatcher error")
+            self._wake.wait(JOB_POLL_S)
+            self._wake.clear()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? WHERE job_id = ?",
+                (self.worker_id, now, now, row["job_id"]),
+            )
+        with self._guard:
+            self._running.add(row["job_id"])
+        self._count("claimed")
+        return row
+
+    def _run(self, row: sqlite3.Row) -> None:
+        job_id = row["job_id"]
+
+        def should_stop() -> bool:
+            return job_id in self._cancelled
+
+        status, result, error = "done", None, None
+        try:
+            result = _resolve(row["kind"])(json.loads(row["payload"]), should_stop)
+        except RetryableJobError as e:
+            status, result, error = "failed", e.result, str(e) or type(e).__name__
+            # `row` was read before the claim counted this attempt
+            if row["attempts"] + 1 < JOB_MAX_ATTEMPTS:
+                status, result = "queued", None
+            if not should_stop():
+                logger.warning("Job %s (%s) failed%s: %s", job_id, row["kind"], ", retrying" if status == "queued" else "", error)
+        except Exception as e:
+            status, error = "failed", str(e) or type(e).__name__
+            if not should_stop():
+                logger.warning("Job %s (%s) failed: %s", job_id, row["kind"], error)
+        if should_stop():
+            status, result, error = "cancelled", None, None
+        try:
+            with self._conn() as conn:
+                if status == "queued":
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', worker = NULL, error = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                        (error, job_id, self.worker_id),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                        (status, _dumps(result) if result is not None else None, error, time.time(), job_id, self.worker_id),
+                    )
+            self._count("requeued" if status == "queued" else status)
+        except Exception:
+            logger.exception("Failed to record result of job %s", job_id)
+        finally:
+            with self._guard:
+                self._running.discard(job_id)
+                self._cancelled.discard(job_id)
+            self._wake.set()
+
+    def _maintain(self) -> None:
+        """Heartbeat our running jobs, pick up cancellations, requeue abandoned jobs and purge old results."""
+        now = time.time()
+        with self._guard:
+            running = list(self._running)
+        with self._conn() as conn:
+            if running:
+                marks = ",".join("?" * len(running))
+                conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND job_id IN ({marks})", (now, self.worker_id, *running))
+                cancelled = [r[0] for r in conn.execute(f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({marks})", running)]
+                with self._guard:
+                    self._cancelled.update(cancelled)
+            stale = now - JOB_LEASE_S
+            requeued = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ? AND attempts < ? AND cancel_requested = 0",
+                (stale, JOB_MAX_ATTEMPTS),
+            ).rowcount
+            conn.execute(
+                "UPDATE jobs SET status = CASE cancel_requested WHEN 1 THEN 'cancelled' ELSE 'failed' END, "
+                "error = CASE cancel_requested WHEN 1 THEN NULL ELSE 'worker lost' END, finished_at = ? "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (now, stale),
+            )
+            purged = conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - JOB_RESULT_TTL_S,)).rowcount
+            purged += conn.execute(
+                "DELETE FROM jobs WHERE job_id IN (SELECT job_id FROM jobs WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                (JOB_MAX_FINISHED,),
+            ).rowcount
+        if requeued:
+            self._count("requeued", requeued)
+            self._wake.set()
+        if purged:
+            self._count("purged", purged)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._guard:
+            out: Dict[str, Any] = dict(self._stats)
+            out["running_here"] = len(self._running)
+        out["workers"] = self.workers if self._dispatcher is not None else 0
+        try:
+            rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            out["by_status"] = {r[0]: r[1] for r in rows}
+        except Exception:
+            out["by_status"] = {}
+        return out
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue, creating its database on first use."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
+
+
+def job_stats() -> Dict[str, Any]:
+    queue = _job_queue
+    return queue.stats() if queue is not None else {"workers": 0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Background job worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="run jobs from the shared queue until interrupted")
+    worker.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1))
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        queue = JobQueue(workers=args.workers)
+        queue.start()
+        logger.info("Worker %s running %d job threads on %s", queue.worker_id, args.workers, queue.path)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            queue.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 """Adapter to optionally integrate LangGraph for tool orchestration.
 
-This module exposes `execute_tool(tool_name, args, session_state)` which will:
-- If `langgraph` is available and a basic expected API exists, register tools as nodes and
-  execute through LangGraph.
-- Otherwise, fall back to direct function calls (the existing `TOOLS` registry).
+This module exposes `execute_tool(tool_name, args, session_state)` (and the async
+`aexecute_tool`). When `langgraph` is installed, every tool in `TOOLS` is a node
+of a single `StateGraph` that is compiled once at import time and reused for
+every call; an entry router picks the node by tool name, and `profile_store_*`
+nodes receive the caller's `session_state` through the graph state. Without
+LangGraph (or with `TOOL_DISPATCH=direct`) tools are called directly from the
+`TOOLS` registry.
 
 The adapter is defensive: it never raises ImportError if LangGraph isn't installed.
 """
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 import logging
+import os
+import threading
+
+from tracing import span
 
 try:
-    import langgraph
+    from typing import TypedDict
+    from langgraph.graph import StateGraph, START, END
+    from langchain_core.runnables import RunnableLambda
     HAS_LANGGRAPH = True
 except Exception:
     HAS_LANGGRAPH = False
@@ -23,6 +32,7 @@ from tools import (
     question_generator,
     report_generator,
     analysis_agent,
+    aanalysis_agent,
 )
 
 TOOLS = {
@@ -34,9 +44,111 @@ TOOLS = {
     "analysis_agent": analysis_agent,
 }
 
+# Tools that call the LLM expose native async variants used by `aexecute_tool`.
+ASYNC_TOOLS = {
+    "analysis_agent": aanalysis_agent,
+}
+
+# Tools whose output is already the client-facing answer when it carries one of
+# these keys. The agent returns such output directly instead of asking the LLM
+# to narrate it in a follow-up call.
+TERMINAL_TOOLS = {
+    "analysis_agent": ("next_questions", "questions", "report"),
+    "question_generator": ("questions", "question"),
+    "report_generator": ("report",),
+}
+
+# Tools that read the profile get the session's `user_profile` as args["profile"]
+SESSION_PROFILE_TOOLS = {"report_generator"}
+
+# "graph" routes calls through the compiled LangGraph graph when available; "direct" skips it
+TOOL_DISPATCH = os.environ.get("TOOL_DISPATCH", "graph").lower()
+
 logger = logging.getLogger("langgraph_adapter")
 
 
+def is_terminal(tool_name: str, tool_output: Any) -> bool:
+    """True if `tool_output` needs no follow-up LLM call before it reaches the client."""
+    keys = TERMINAL_TOOLS.get(tool_name)
+    if not keys or not isinstance(tool_output, dict) or tool_output.get("error"):
+        return False
+    return any(tool_output.get(k) for k in keys)
+
+
+def call_tool(tool_name: str, args: Dict[str, Any], session_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Call a tool function directly; errors are returned as {"error": ...}."""
+    try:
+        if tool_name.startswith("profile_store_"):
+            if tool_name == "profile_store_get":
+                return TOOLS[tool_name](session_state)
+            return TOOLS[tool_name](session_state, args)
+        if tool_name in SESSION_PROFILE_TOOLS:
+            # The session profile is authoritative, not whatever the LLM passed
+            args = {**args, "profile": session_state.get("user_profile") or {}}
+        return TOOLS[tool_name](args)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def acall_tool(tool_name: str, args: Dict[str, Any], session_state: Dict[str, Any]) -> Dict[str, Any]:
+    if tool_name not in ASYNC_TOOLS:
+        return call_tool(tool_name, args, session_state)
+    try:
+        return await ASYNC_TOOLS[tool_name](args)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# --- Compiled tool graph ---
+
+if HAS_LANGGRAPH:
+    class ToolState(TypedDict, total=False):
+        tool: str
+        args: Dict[str, Any]
+        session_state: Dict[str, Any]
+        output: Any
+
+
+def _tool_node(tool_name: str):
+    def run(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {"output": call_tool(tool_name, state.get("args") or {}, state["session_state"])}
+
+    async def arun(state: Dict[str, Any]) -> Dict[str, Any]:
+        return {"output": await acall_tool(tool_name, state.get("args") or {}, state["session_state"])}
+
+    return RunnableLambda(run, afunc=arun, name=tool_name)
+
+
+def build_tool_graph():
+    """Compile one graph with a node per tool, entered through a router on `state["tool"]`."""
+    graph = StateGraph(ToolState)
+    for name in TOOLS:
+        graph.add_node(name, _tool_node(name))
+        graph.add_edge(name, END)
+    graph.add_conditional_edges(START, lambda state: state["tool"], {name: name for name in TOOLS})
+    return graph.compile()
+
+
+_tool_graph = None
+_tool_graph_lock = threading.Lock()
+
+
+def get_tool_graph():
+    """Return the compiled tool graph, or None when LangGraph is unavailable or disabled."""
+    global _tool_graph
+    if not HAS_LANGGRAPH or TOOL_DISPATCH != "graph":
+        return None
+    if _tool_graph is None:
+        with _tool_graph_lock:
+            if _tool_graph is None:
+                try:
+                    _tool_graph = build_tool_graph()
+                except Exception as e:
+                    logger.warning(f"Failed to compile LangGraph tool graph, using direct calls: {e}")
+                    _tool_graph = False
+    return _tool_graph or None
+
+
 def execute_tool(tool_name: str, args: Dict[str, Any], session_state: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a tool by name. Use LangGraph if available; otherwise fallback.
 
@@ -45,36 +157,37 @@ def execute_tool(tool_name: str, args: Dict[str, Any], session_state: Dict[str,
     if tool_name not in TOOLS:
         return {"error": f"Unknown tool: {tool_name}"}
 
-    if HAS_LANGGRAPH:
-        try:
-            # Minimal best-effort integration: try to use a high-level execution API.
-            # LangGraph APIs may vary; this uses a simple pattern if available.
-            if hasattr(langgraph, "Graph"):
-                g = langgraph.Graph()
-                # Register a single node that calls our function
-                def node_fn(payload):
-                    return TOOLS[tool_name](session_state, payload) if tool_name.startswith("profile_store_") else TOOLS[tool_name](payload)
-
-                # Some langgraph versions accept add_node(name, func)
-                try:
-                    g.add_node(tool_name, node_fn)
-                    res = g.run(tool_name, args)
-                    return res
-                except Exception:
-                    # Fallback to direct call if add_node/run not supported
-                    pass
+    with span("tool", tool=tool_name):
+        graph = get_tool_graph()
+        if graph is not None:
+            try:
+                return graph.invoke({"tool": tool_name, "args": args or {}, "session_state": session_state})["output"]
+            except Exception as e:
+                logger.warning(f"LangGraph execution failed, falling back: {e}")
 
-            # If Graph API not present or failed, try a generic executor
-            if hasattr(langgraph, "execute"):
-                return langgraph.execute(tool_name, args)
+        # Fallback: direct call
+        return call_tool(tool_name, args or {}, session_state)
 
-        except Exception as e:
-            logger.warning(f"LangGraph execution failed, falling back: {e}")
 
-    # Fallback: direct call
-    try:
-        if tool_name.startswith("profile_store_"):
-            return TOOLS[tool_name](session_state, args)
-        return TOOLS[tool_name](args)
-    except Exception as e:
-        return {"error": str(e)}
+async def aexecute_tool(tool_name: str, args: Dict[str, Any], session_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of `execute_tool`.
+
+    LLM-backed tools are awaited natively (through the graph's async path); the
+    remaining tools are cheap, in-memory functions and go through `execute_tool`.
+    """
+    if tool_name not in ASYNC_TOOLS:
+        return execute_tool(tool_name, args, session_state)
+
+    with span("tool", tool=tool_name):
+        graph = get_tool_graph()
+        if graph is not None:
+            try:
+                state = await graph.ainvoke({"tool": tool_name, "args": args or {}, "session_state": session_state})
+                return state["output"]
+            except Exception as e:
+                logger.warning(f"LangGraph execution failed, falling back: {e}")
+        return await acall_tool(tool_name, args or {}, session_state)
+
+
+# Compile at import so the first request does not pay for it
+get_tool_graph()
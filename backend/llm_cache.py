@@ -0,0 +1,230 @@
+"""Content-addressed cache for LLM responses.
+
+Entries are keyed by a SHA-256 of the model, call parameters and the normalized
+message list, so identical prompts (same persona/event/choice templates, same
+default onboarding profile) are answered without a provider round-trip.
+
+Two tiers:
+- an in-memory LRU bounded by entry count;
+- an optional on-disk tier under `storage.DATA_DIR/llm_cache`, bounded by entry
+  count and evicted oldest-first.
+
+Disk reads and writes happen outside the cache lock; async callers use
+`aget`/`aput`, which run them in a worker thread. Every entry carries its own
+expiry time. Hit/miss/eviction counters are exposed through `stats()`.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from storage import DATA_DIR
+
+logger = logging.getLogger("llm_cache")
+
+CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL", "3600"))
+CACHE_DISK_ENABLED = os.environ.get("LLM_CACHE_DISK", "0") == "1"
+CACHE_DISK_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_DISK_MAX_ENTRIES", "10000"))
+CACHE_DIR = os.path.join(DATA_DIR, "llm_cache")
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[List[str]]:
+    return [[str(m.get("role", "")), " ".join(str(m.get("content", "")).split())] for m in messages]
+
+
+def cache_key(model: str, params: Dict[str, Any], messages: List[Dict[str, Any]]) -> str:
+    """Return the content address for a model call."""
+    payload = json.dumps(
+        {"model": model, "params": params, "messages": _normalize_messages(messages)},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL_SECONDS,
+        disk_dir: Optional[str] = None,
+        max_disk_entries: int = CACHE_DISK_MAX_ENTRIES,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> expiry for the disk tier, ordered oldest-written first
+        self._disk_index: Optional["OrderedDict[str, float]"] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "evictions": 0, "expired": 0, "disk_evictions": 0}
+
+    # --- disk tier ---
+    # File I/O runs outside `_lock`; the lock only guards the in-memory tier,
+    # the disk index and the counters, so a slow disk never blocks memory hits.
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _ensure_disk_index(self) -> None:
+        with self._lock:
+            if self._disk_index is not None:
+                return
+        found = []
+        try:
+            for root, _dirs, files in os.walk(self.disk_dir):
+                for fn in files:
+                    if fn.endswith(".json"):
+                        p = os.path.join(root, fn)
+                        found.append((os.path.getmtime(p), fn[:-5]))
+        except Exception:
+            pass
+        found.sort()
+        with self._lock:
+            if self._disk_index is None:
+                # Expiry is read lazily from the file; index only tracks write order
+                self._disk_index = OrderedDict((k, 0.0) for _, k in found)
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        """Look `key` up on disk and promote a hit to memory; counts the hit or miss."""
+        self._ensure_disk_index()
+        with self._lock:
+            indexed = key in self._disk_index
+        entry = None
+        if indexed:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except Exception:
+                with self._lock:
+                    self._disk_index.pop(key, None)
+        if entry is not None and entry.get("expires_at", 0) <= time.time():
+            with self._lock:
+                self._stats["expired"] += 1
+            self._disk_remove(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits_disk"] += 1
+            self._memory_put(key, entry["value"], entry["expires_at"])
+        return entry["value"]
+
+    def _disk_put(self, key: str, value: Any, expires_at: float) -> None:
+        self._ensure_disk_index()
+        p = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            tmp = f"{p}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except Exception as e:
+            logger.debug("Failed to write LLM cache entry %s: %s", key, e)
+            return
+        evicted = []
+        with self._lock:
+            index = self._disk_index
+            index.pop(key, None)
+            index[key] = expires_at
+            while len(index) > self.max_disk_entries:
+                evicted.append(index.popitem(last=False)[0])
+            self._stats["disk_evictions"] += len(evicted)
+        for old in evicted:
+            self._disk_remove(old, indexed=False)
+
+    def _disk_remove(self, key: str, indexed: bool = True) -> None:
+        if indexed:
+            with self._lock:
+                if self._disk_index is not None:
+                    self._disk_index.pop(key, None)
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    # --- public API ---
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        """Memory-tier lookup; a miss is only counted here when there is no disk tier."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits_memory"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expired"] += 1
+            if not self.disk_dir:
+                self._stats["misses"] += 1
+            return None
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        if value is None and self.disk_dir:
+            value = self._disk_get(key)
+        return value
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Like `get`, with the disk read in a worker thread so the event loop is not blocked."""
+        value = self._memory_get(key)
+        if value is None and self.disk_dir:
+            value = await asyncio.to_thread(self._disk_get, key)
+        return value
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+        if self.disk_dir:
+            self._disk_put(key, value, expires_at)
+
+    async def aput(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Like `put`, with the disk write in a worker thread."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._disk_put, key, value, expires_at)
+
+    def _memory_put(self, key: str, value: Any, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            self._ensure_disk_index()
+            with self._lock:
+                keys = list(self._disk_index.keys())
+            for key in keys:
+                self._disk_remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["disk_entries"] = len(self._disk_index) if self._disk_index is not None else None
+        hits = out["hits_memory"] + out["hits_disk"]
+        total = hits + out["misses"]
+        out["hit_rate"] = round(hits / total, 4) if total else 0.0
+        return out
+
+
+response_cache = ResponseCache(disk_dir=CACHE_DIR if CACHE_DISK_ENABLED else None)
@@ -1,71 +1,469 @@
+import asyncio
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from dotenv import load_dotenv
 load_dotenv()
 
+from llm_cache import CACHE_ENABLED, cache_key, response_cache
+from llm_scheduler import DeadlineExceeded, scheduler
+from singleflight import SingleFlight
+from tracing import span
+
+# Provider imports are resolved once at import time rather than on every call
+try:
+    from langchain.schema import HumanMessage, SystemMessage, AIMessage
+except Exception:
+    HumanMessage = SystemMessage = AIMessage = None
+
+try:
+    from langchain_groq import ChatGroq
+except Exception:
+    ChatGroq = None
+
+logger = logging.getLogger("llm_client")
+
+
+# "groq" (default) or "mock" (deterministic local stand-in with injectable latency, see mock_llm)
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "groq").lower()
+
 
 def _get_model():
     # Prefer explicit model via env, default to Groq Llama instant model
     return os.environ.get("AGENT_MODEL", "llama-3.1-8b-instant")
 
 
-def chat(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+# --- Process-wide client registry ---
+# Provider clients are built once per (model, temperature, api key) and reused for
+# every call. All of them share one bounded, keep-alive HTTP connection pool so
+# repeated calls skip client construction and the TLS handshake.
+
+POOL_MAX_CONNECTIONS = int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.environ.get("LLM_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+# Per-attempt HTTP timeout; retries and overall deadlines are handled by `llm_scheduler`
+REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT_S", "60"))
+# Completion size assumed when reserving token budget before a call
+EXPECTED_COMPLETION_TOKENS = int(os.environ.get("LLM_EXPECTED_COMPLETION_TOKENS", "256"))
+
+_UNAVAILABLE = object()
+_registry: Dict[Tuple[str, float, Optional[str]], Any] = {}
+_registry_lock = threading.Lock()
+_http_clients: Dict[str, Any] = {}
+_stats = {"created": 0, "reused": 0}
+
+
+def _shared_http_clients() -> Dict[str, Any]:
+    """Return the shared sync/async httpx clients, creating them on first use."""
+    if not _http_clients:
+        try:
+            import httpx
+        except Exception:
+            return {}
+        limits = httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        )
+        _http_clients["http_client"] = httpx.Client(limits=limits)
+        _http_clients["http_async_client"] = httpx.AsyncClient(limits=limits)
+    return _http_clients
+
+
+def _build_provider_llm(model_name: str, temperature: float, api_key: Optional[str] = None):
+    """Return a provider-backed LangChain ChatGroq instance, or None if unavailable."""
+    if LLM_PROVIDER == "mock":
+        from mock_llm import MockChatModel
+
+        return MockChatModel(model_name)
+    if ChatGroq is None or HumanMessage is None:
+        return None
+
+    kwargs: Dict[str, Any] = dict(_shared_http_clients())
+    if api_key is not None:
+        kwargs["groq_api_key"] = api_key
+    return ChatGroq(
+        model=model_name,
+        temperature=temperature,
+        max_tokens=None,
+        reasoning_format="parsed",
+        timeout=REQUEST_TIMEOUT,
+        max_retries=0,
+        **kwargs,
+    )
+
+
+def get_llm(model: Optional[str] = None, temperature: float = 0, api_key: Optional[str] = None):
+    """Return the shared provider client for `model`/`temperature`, or None if unavailable.
+
+    Clients are cached for the lifetime of the process; a provider that is not
+    installed or cannot be configured (e.g. no API key) is remembered as
+    unavailable so construction is not retried per call.
+    """
+    key = (model or _get_model(), float(temperature), api_key)
+    with _registry_lock:
+        llm = _registry.get(key)
+        if llm is _UNAVAILABLE:
+            return None
+        if llm is not None:
+            _stats["reused"] += 1
+            return llm
+        try:
+            llm = _build_provider_llm(key[0], key[1], api_key)
+        except Exception as e:
+            logger.warning("LLM provider unavailable for model %s: %s", key[0], e)
+            llm = None
+        _registry[key] = _UNAVAILABLE if llm is None else llm
+        if llm is not None:
+            _stats["created"] += 1
+        return llm
+
+
+def client_stats() -> Dict[str, Any]:
+    """Report registry size, client creation/reuse counters and HTTP pool usage."""
+    with _registry_lock:
+        clients = sum(1 for v in _registry.values() if v is not _UNAVAILABLE)
+        stats: Dict[str, Any] = {"clients": clients, "created": _stats["created"], "reused": _stats["reused"]}
+    pool: Dict[str, Any] = {
+        "max_connections": POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": POOL_MAX_KEEPALIVE,
+        "keepalive_expiry": POOL_KEEPALIVE_EXPIRY,
+    }
+    for name, client in _http_clients.items():
+        # httpx does not expose pool size publicly; read it defensively
+        conns = getattr(getattr(getattr(client, "_transport", None), "_pool", None), "connections", None)
+        pool[f"{name}_open_connections"] = len(conns) if conns is not None else None
+    stats["pool"] = pool
+    stats["coalescing"] = {"enabled": COALESCE_ENABLED, **_inflight.stats()}
+    stats["scheduler"] = scheduler.stats()
+    return stats
+
+
+def _to_lc_messages(messages: List[Dict[str, Any]]) -> list:
+    lc_messages = []
+    for m in messages:
+        role = m.get("role")
+        content = m.get("content", "")
+        if role == "system":
+            lc_messages.append(SystemMessage(content=content))
+        elif role == "user":
+            lc_messages.append(HumanMessage(content=content))
+        else:
+            lc_messages.append(AIMessage(content=content))
+    return lc_messages
+
+
+def _cache_key_for(messages: List[Dict[str, Any]], model: Optional[str], temperature: float, cache: Optional[bool]) -> Optional[str]:
+    """Cache key for the call, or None when caching is disabled for it.
+
+    `cache=None` caches only deterministic (temperature 0) calls: a cached sample
+    at a higher temperature would be replayed for every later call.
+    """
+    if cache is None:
+        cache = float(temperature) == 0
+    if not (cache and CACHE_ENABLED):
+        return None
+    return cache_key(model or _get_model(), {"temperature": float(temperature)}, messages)
+
+
+def _lookup_cache(messages: List[Dict[str, Any]], model: Optional[str], temperature: float, cache: Optional[bool]):
+    """Return (key, cached_content); key is None when caching is disabled for the call."""
+    key = _cache_key_for(messages, model, temperature, cache)
+    return key, response_cache.get(key) if key is not None else None
+
+
+async def _alookup_cache(messages: List[Dict[str, Any]], model: Optional[str], temperature: float, cache: Optional[bool]):
+    key = _cache_key_for(messages, model, temperature, cache)
+    return key, await response_cache.aget(key) if key is not None else None
+
+
+# Concurrent identical prompts share one upstream call (see `singleflight`)
+COALESCE_ENABLED = os.environ.get("LLM_COALESCE_ENABLED", "1") == "1"
+_inflight = SingleFlight()
+
+
+def _flight_key(messages: List[Dict[str, Any]], model: Optional[str], temperature: float, fallback: bool) -> str:
+    return cache_key(model or _get_model(), {"temperature": float(temperature), "fallback": fallback}, messages)
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised instead of the local fallback answer when a call is made with `fallback=False`."""
+
+
+def _fallback_or_raise(messages: List[Dict[str, Any]], fallback: bool, error: Optional[BaseException]) -> Dict[str, Any]:
+    if not fallback:
+        raise LLMUnavailable(str(error) if error else "no LLM provider available") from error
+    return _fallback_chat(messages)
+
+
+def _shared(res: Dict[str, Any], shared: bool) -> Dict[str, Any]:
+    # Every caller gets its own dict; waiters are marked as coalesced
+    return {**res, "coalesced": True} if shared else dict(res)
+
+
+def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    # ~4 characters per token for the prompt, plus the expected completion
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 1 + EXPECTED_COMPLETION_TOKENS
+
+
+def _settle(estimated: int, usage: Optional[Dict[str, Any]]) -> None:
+    if usage:
+        scheduler.settle(estimated, usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+
+
+def _provider_result(text: str, usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"content": text}
+    if usage:
+        out["usage"] = {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+    return out
+
+
+def _annotate(s, res: Dict[str, Any]) -> None:
+    # Record cache hits and provider token usage on the call's span
+    usage = res.get("usage") or {}
+    if res.get("coalesced"):
+        # The shared upstream call's tokens are already counted by its leader
+        usage = {}
+    s.set(cache_hit=int(bool(res.get("cached"))), coalesced=int(bool(res.get("coalesced"))), **usage)
+
+
+def chat(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    temperature: float = 0,
+    api_key: Optional[str] = None,
+    cache: Optional[bool] = None,
+    priority: str = "interactive",
+    fallback: bool = True,
+) -> Dict[str, Any]:
     """Send chat messages to the configured LLM and return a dict with 'content'.
 
     This wrapper uses the LangChain Groq/Llama chat wrapper when available.
     If the provider is not installed or an unexpected error occurs, a lightweight
     deterministic fallback is used to allow local development and hackathon runs.
+    With `fallback=False` the call raises `LLMUnavailable` instead, for callers
+    that must not mistake the heuristic answer for a model response.
+    Provider clients come from the shared `get_llm` registry; provider responses
+    are stored in the response cache (see `llm_cache`): by default only for
+    temperature 0, `cache=True`/`False` forces it on or off.
+    Provider responses include `usage` (prompt/completion tokens) when reported.
+    Concurrent calls with an identical prompt share one upstream call; the
+    waiters' results carry `coalesced: True`. Provider calls are admitted by
+    `llm_scheduler` under the given `priority` ("interactive" or "batch").
+    """
+    with span("llm", model=model or _get_model()) as s:
+        if COALESCE_ENABLED:
+            res = _shared(*_inflight.do(
+                _flight_key(messages, model, temperature, fallback),
+                lambda: _chat(messages, model, temperature, api_key, cache, priority, fallback),
+            ))
+        else:
+            res = _chat(messages, model, temperature, api_key, cache, priority, fallback)
+        _annotate(s, res)
+        return res
+
+
+async def achat(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    temperature: float = 0,
+    api_key: Optional[str] = None,
+    cache: Optional[bool] = None,
+    priority: str = "interactive",
+    fallback: bool = True,
+) -> Dict[str, Any]:
+    """Async counterpart of `chat`.
+
+    Awaits the provider's native async API so the event loop is free while the
+    request is in flight. Providers without an async API are run in a worker
+    thread; the local fallback is cheap and runs inline.
     """
-    model_name = _get_model()
+    with span("llm", model=model or _get_model()) as s:
+        if COALESCE_ENABLED:
+            res = _shared(*await _inflight.ado(
+                _flight_key(messages, model, temperature, fallback),
+                lambda: _achat(messages, model, temperature, api_key, cache, priority, fallback),
+            ))
+        else:
+            res = await _achat(messages, model, temperature, api_key, cache, priority, fallback)
+        _annotate(s, res)
+        return res
 
+
+async def astream_chat(
+    messages: List[Dict[str, Any]],
+    on_token: Optional[Callable[[str], Any]] = None,
+    model: Optional[str] = None,
+    temperature: float = 0,
+    api_key: Optional[str] = None,
+    cache: Optional[bool] = None,
+    priority: str = "interactive",
+    fallback: bool = True,
+) -> Dict[str, Any]:
+    """Like `achat`, but calls `on_token(text)` with each content chunk as the provider streams it.
+
+    Returns the same dict as `achat` once the response is complete. Cached and
+    fallback responses arrive as a single chunk.
+    """
+    with span("llm", model=model or _get_model(), stream=1) as s:
+        res = await _astream_chat(messages, on_token, model, temperature, api_key, cache, priority, fallback)
+        _annotate(s, res)
+        return res
+
+
+def _chat(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    temperature: float = 0,
+    api_key: Optional[str] = None,
+    cache: Optional[bool] = None,
+    priority: str = "interactive",
+    fallback: bool = True,
+) -> Dict[str, Any]:
+    key, cached = _lookup_cache(messages, model, temperature, cache)
+    if cached is not None:
+        return {"content": cached, "cached": True}
+
+    error: Optional[BaseException] = None
     # First attempt: provider-backed LangChain ChatGroq
     try:
-        from langchain.schema import HumanMessage, SystemMessage, AIMessage
-        try:
-            from langchain_groq import ChatGroq
-        except Exception:
-            ChatGroq = None
-
-        if ChatGroq is not None:
-            llm = ChatGroq(
-                model=model_name,
-                temperature=0,
-                max_tokens=None,
-                reasoning_format="parsed",
-                timeout=None,
-                max_retries=2,
-            )
-
-            lc_messages = []
-            for m in messages:
-                role = m.get("role")
-                content = m.get("content", "")
-                if role == "system":
-                    lc_messages.append(SystemMessage(content=content))
-                elif role == "user":
-                    lc_messages.append(HumanMessage(content=content))
-                else:
-                    lc_messages.append(AIMessage(content=content))
-
-            if hasattr(llm, "predict_messages"):
-                res = llm.predict_messages(lc_messages)
-                text = getattr(res, "content", None) or str(res)
-            elif hasattr(llm, "chat"):
-                resp = llm.chat(messages=[{"role": m.get("role"), "content": m.get("content")} for m in messages])
-                text = resp.get("text") if isinstance(resp, dict) else str(resp)
-            elif hasattr(llm, "predict"):
-                prompt = "\n".join(f"[{m.get('role')}] {m.get('content')}" for m in messages)
-                resp = llm.predict(prompt)
-                text = resp if isinstance(resp, str) else str(resp)
-            else:
+        llm = get_llm(model, temperature, api_key)
+
+        if llm is not None:
+            lc_messages = _to_lc_messages(messages)
+            estimated = _estimate_tokens(messages)
+
+            def invoke():
+                if hasattr(llm, "predict_messages"):
+                    res = llm.predict_messages(lc_messages)
+                    return getattr(res, "content", None) or str(res), getattr(res, "usage_metadata", None)
+                if hasattr(llm, "chat"):
+                    resp = llm.chat(messages=[{"role": m.get("role"), "content": m.get("content")} for m in messages])
+                    return (resp.get("text") if isinstance(resp, dict) else str(resp)), None
+                if hasattr(llm, "predict"):
+                    prompt = "\n".join(f"[{m.get('role')}] {m.get('content')}" for m in messages)
+                    resp = llm.predict(prompt)
+                    return (resp if isinstance(resp, str) else str(resp)), None
                 raise RuntimeError("ChatGroq instance does not expose a usable predict/chat method")
 
-            return {"content": text}
+            # Admission control, rate budgets and retries live in the scheduler
+            text, usage = scheduler.run(invoke, priority, estimated)
+            _settle(estimated, usage)
 
-    except Exception:
+            if key is not None:
+                response_cache.put(key, text)
+            return _provider_result(text, usage)
+
+    except DeadlineExceeded as e:
+        logger.warning("LLM call rejected by scheduler: %s", e)
+        error = e
+    except Exception as e:
         # If provider isn't available or errors occur, fall back to local heuristic LLM
-        pass
+        error = e
+
+    return _fallback_or_raise(messages, fallback, error)
+
+
+async def _achat(
+    messages: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    temperature: float = 0,
+    api_key: Optional[str] = None,
+    cache: Optional[bool] = None,
+    priority: str = "interactive",
+    fallback: bool = True,
+) -> Dict[str, Any]:
+    key, cached = await _alookup_cache(messages, model, temperature, cache)
+    if cached is not None:
+        return {"content": cached, "cached": True}
+
+    error = None
+    try:
+        llm = get_llm(model, temperature, api_key)
+
+        if llm is not None:
+            lc_messages = _to_lc_messages(messages)
+
+            if hasattr(llm, "ainvoke"):
+                estimated = _estimate_tokens(messages)
+                res = await scheduler.arun(lambda: llm.ainvoke(lc_messages), priority, estimated)
+                text = getattr(res, "content", None) or str(res)
+                usage = getattr(res, "usage_metadata", None)
+                _settle(estimated, usage)
+                if key is not None:
+                    await response_cache.aput(key, text)
+                return _provider_result(text, usage)
+
+            return await asyncio.to_thread(_chat, messages, model, temperature, api_key, cache, priority, fallback)
+
+    except DeadlineExceeded as e:
+        logger.warning("LLM call rejected by scheduler: %s", e)
+        error = e
+    except Exception as e:
+        error = e
+
+    return _fallback_or_raise(messages, fallback, error)
+
+
+async def _astream_chat(
+    messages: List[Dict[str, Any]],
+    on_token: Optional[Callable[[str], Any]] = None,
+    model: Optional[str] = None,
+    temperature: float = 0,
+    api_key: Optional[str] = None,
+    cache: Optional[bool] = None,
+    priority: str = "interactive",
+    fallback: bool = True,
+) -> Dict[str, Any]:
+    key, cached = await _alookup_cache(messages, model, temperature, cache)
+    if cached is not None:
+        if on_token is not None:
+            on_token(cached)
+        return {"content": cached, "cached": True}
+
+    error = None
+    try:
+        llm = get_llm(model, temperature, api_key)
+
+        if llm is not None and hasattr(llm, "astream"):
+            parts: List[str] = []
+            usage = None
+            estimated = _estimate_tokens(messages)
+            # Streams hold a provider slot for their whole duration and are not retried
+            async with scheduler.aslot(priority, estimated):
+                async for chunk in llm.astream(_to_lc_messages(messages)):
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    text = getattr(chunk, "content", None) or ""
+                    if text:
+                        parts.append(text)
+                        if on_token is not None:
+                            on_token(text)
+            _settle(estimated, usage)
+            text = "".join(parts)
+            if key is not None:
+                await response_cache.aput(key, text)
+            return _provider_result(text, usage)
+
+        if llm is not None:
+            res = await _achat(messages, model, temperature, api_key, cache, priority, fallback)
+            if on_token is not None:
+                on_token(res.get("content", ""))
+            return res
+
+    except DeadlineExceeded as e:
+        logger.warning("LLM call rejected by scheduler: %s", e)
+        error = e
+    except Exception as e:
+        error = e
+
+    res = _fallback_or_raise(messages, fallback, error)
+    if on_token is not None:
+        on_token(res.get("content", ""))
+    return res
+
 
+def _fallback_chat(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
     # --- Local fallback LLM (for development/hackathon) ---
     try:
         import json as _json
@@ -0,0 +1,356 @@
+"""Admission control in front of the LLM provider.
+
+Every provider call made by `llm_client` goes through the process-wide
+`scheduler`, which enforces:
+- a bounded number of concurrent provider calls; when all slots are busy,
+  waiters are served by priority class (`interactive` before `batch`), FIFO
+  within a class;
+- token-bucket budgets for requests per minute and tokens per minute
+  (estimated before the call, corrected with the provider's reported usage);
+- a per-call deadline covering queueing, rate waits, retries and the call
+  itself; work that cannot finish in time is rejected with `DeadlineExceeded`
+  instead of piling up. Blocking calls run on a worker thread so `run` can stop
+  waiting at the deadline; the slot stays taken until the abandoned call returns;
+- retries of transient failures (rate limits, 5xx, timeouts, connection
+  errors) with full-jitter exponential backoff. The provider client itself is
+  built with `max_retries=0` so retries are not multiplied.
+
+Cache hits and coalesced waiters never reach the scheduler.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from tracing import span
+
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_RPM = float(os.environ.get("LLM_RATE_RPM", "0"))  # 0 = unlimited
+LLM_RATE_TPM = float(os.environ.get("LLM_RATE_TPM", "0"))  # 0 = unlimited
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE_MS = float(os.environ.get("LLM_BACKOFF_BASE_MS", "250"))
+LLM_BACKOFF_CAP_MS = float(os.environ.get("LLM_BACKOFF_CAP_MS", "4000"))
+
+# Priority classes: lower value is served first; deadline in seconds per class
+PRIORITIES = {"interactive": 0, "batch": 1}
+DEADLINES = {
+    "interactive": float(os.environ.get("LLM_DEADLINE_INTERACTIVE_S", "30")),
+    "batch": float(os.environ.get("LLM_DEADLINE_BATCH_S", "120")),
+}
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    """The call could not be admitted or completed before its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient provider errors: rate limits, 5xx, timeouts and connection failures."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return any(k in name for k in ("RateLimit", "Timeout", "Connection")) or isinstance(error, (TimeoutError, ConnectionError))
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute / 60` tokens per second.
+
+    `reserve` takes tokens immediately (the balance may go negative) and returns
+    how long the caller must wait for them, so concurrent callers queue in
+    arrival order without polling.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, max_wait: float) -> Optional[float]:
+        """Reserve `amount` tokens; returns the wait in seconds, or None (nothing reserved) if it exceeds `max_wait`."""
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            # A request larger than the whole bucket only has to wait for a full bucket
+            amount = min(amount, self.capacity)
+            wait = max(0.0, (amount - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= amount
+            return wait
+
+    def refund(self, amount: float) -> None:
+        if self.rate <= 0 or not amount:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class _Waiter:
+    __slots__ = ("granted", "cancelled", "event", "loop", "future")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.granted = False
+        self.cancelled = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class PrioritySlots:
+    """Counting semaphore whose waiters are served by (priority, arrival order); usable from threads and coroutines."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._free = slots
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+
+    def _try_acquire(self, priority: int, waiter: _Waiter) -> bool:
+        with self._lock:
+            # `release` hands slots to live waiters before freeing them, so a free
+            # slot means everyone still queued has already given up
+            if self._free > 0:
+                self._waiters.clear()
+                self._free -= 1
+                return True
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Give up waiting; returns True if the slot was granted in the meantime (caller then owns it)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            return False
+
+    def acquire(self, priority: int, timeout: float) -> bool:
+        waiter = _Waiter()
+        if self._try_acquire(priority, waiter):
+            return True
+        waiter.event.wait(max(0.0, timeout))
+        return self._abandon(waiter)
+
+    async def aacquire(self, priority: int, timeout: float) -> bool:
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._try_acquire(priority, waiter):
+            return True
+        try:
+            await asyncio.wait_for(waiter.future, max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled while queued: hand back a slot we may have been granted
+            if self._abandon(waiter):
+                self.release()
+            raise
+        return self._abandon(waiter)
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.cancelled:
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            self._free += 1
+
+    def queued(self) -> int:
+        with self._lock:
+            return sum(1 for _, _, w in self._waiters if not w.cancelled)
+
+    def in_use(self) -> int:
+        with self._lock:
+            return self.slots - self._free
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_RATE_RPM,
+        tokens_per_minute: float = LLM_RATE_TPM,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base_ms: float = LLM_BACKOFF_BASE_MS,
+        backoff_cap_ms: float = LLM_BACKOFF_CAP_MS,
+    ):
+        self.slots = PrioritySlots(max_concurrency)
+        # Blocking calls run here; the slots bound how many are in flight
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="llm-call")
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_ms / 1000.0
+        self.backoff_cap = backoff_cap_ms / 1000.0
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "completed": 0, "failed": 0, "retries": 0, "deadline_exceeded": 0}
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def _deadline_at(self, priority: str, deadline: Optional[float]) -> float:
+        return time.monotonic() + (deadline if deadline is not None else DEADLINES.get(priority, DEADLINES["interactive"]))
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _reserve_rate(self, tokens: int, deadline_at: float) -> float:
+        """Reserve request/token budget; returns the wait, or raises DeadlineExceeded."""
+        remaining = deadline_at - time.monotonic()
+        wait_requests = self.requests.reserve(1, remaining)
+        if wait_requests is None:
+            raise DeadlineExceeded("request rate budget exhausted")
+        wait_tokens = self.tokens.reserve(tokens, remaining)
+        if wait_tokens is None:
+            self.requests.refund(1)
+            raise DeadlineExceeded("token rate budget exhausted")
+        return max(wait_requests, wait_tokens)
+
+    def _rejected(self, message: str) -> DeadlineExceeded:
+        self._count("deadline_exceeded")
+        return DeadlineExceeded(message)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token budget once the provider reports actual usage."""
+        if actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def run(self, fn: Callable[[], Any], priority: str = "interactive", tokens: int = 0, deadline: Optional[float] = None) -> Any:
+        """Run a blocking provider call `fn` under admission control, retrying transient failures.
+
+        The call runs on a worker thread; if it does not return before the deadline,
+        `DeadlineExceeded` is raised and the call's eventual result is discarded.
+        """
+        deadline_at = self._deadline_at(priority, deadline)
+        level = PRIORITIES.get(priority, 0)
+        attempt = 0
+        while True:
+            with span("llm_queue", priority=priority):
+                if not self.slots.acquire(level, deadline_at - time.monotonic()):
+                    raise self._rejected("no provider slot before deadline")
+            future = None
+            try:
+                try:
+                    wait = self._reserve_rate(tokens, deadline_at)
+                except DeadlineExceeded as e:
+                    raise self._rejected(str(e))
+                if wait:
+                    time.sleep(wait)
+                self._count("admitted")
+                future = self._pool.submit(contextvars.copy_context().run, fn)
+                # The slot is freed when the call returns, even if we stopped waiting for it
+                future.add_done_callback(lambda _: self.slots.release())
+                try:
+                    result = future.result(timeout=max(0.0, deadline_at - time.monotonic()))
+                except Exception as e:
+                    if not future.done():
+                        self._count("failed")
+                        raise self._rejected("provider call did not finish before deadline")
+                    delay = self.backoff(attempt)
+                    if not is_retryable(e) or attempt >= self.max_retries or time.monotonic() + delay >= deadline_at:
+                        self._count("failed")
+                        raise
+                else:
+                    self._count("completed")
+                    return result
+            finally:
+                if future is None:
+                    self.slots.release()
+            self._count("retries")
+            time.sleep(delay)
+            attempt += 1
+
+    async def arun(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        priority: str = "interactive",
+        tokens: int = 0,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """Async counterpart of `run`; the call itself is also bounded by the remaining deadline."""
+        deadline_at = self._deadline_at(priority, deadline)
+        attempt = 0
+        while True:
+            async with self.aslot(priority, tokens, deadline_at=deadline_at):
+                try:
+                    result = await asyncio.wait_for(fn(), max(0.0, deadline_at - time.monotonic()))
+                    self._count("completed")
+                    return result
+                except asyncio.TimeoutError:
+                    self._count("failed")
+                    raise self._rejected("provider call did not finish before deadline")
+                except Exception as e:
+                    delay = self.backoff(attempt)
+                    if not is_retryable(e) or attempt >= self.max_retries or time.monotonic() + delay >= deadline_at:
+                        self._count("failed")
+                        raise
+            self._count("retries")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @asynccontextmanager
+    async def aslot(
+        self,
+        priority: str = "interactive",
+        tokens: int = 0,
+        deadline: Optional[float] = None,
+        deadline_at: Optional[float] = None,
+    ) -> AsyncIterator[None]:
+        """Hold one admitted provider slot for the duration of the block (used for streaming calls)."""
+        if deadline_at is None:
+            deadline_at = self._deadline_at(priority, deadline)
+        with span("llm_queue", priority=priority):
+            if not await self.slots.aacquire(PRIORITIES.get(priority, 0), deadline_at - time.monotonic()):
+                raise self._rejected("no provider slot before deadline")
+        try:
+            try:
+                wait = self._reserve_rate(tokens, deadline_at)
+            except DeadlineExceeded as e:
+                raise self._rejected(str(e))
+            if wait:
+                await asyncio.sleep(wait)
+            self._count("admitted")
+            yield
+        finally:
+            self.slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        out["in_flight"] = self.slots.in_use()
+        out["queued"] = self.slots.queued()
+        out["max_concurrency"] = self.slots.slots
+        out["requests_per_minute"] = self.requests.rate * 60
+        out["tokens_per_minute"] = self.tokens.rate * 60
+        return out
+
+
+scheduler = LLMScheduler()
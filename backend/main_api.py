@@ -1,11 +1,39 @@
+import asyncio
+import json
+import os
 import uvicorn
 import logging
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 from uuid import uuid4
 from agent_core import Agent
-from storage import save_session, save_report, load_session, load_all_sessions
+from llm_client import client_stats
+from llm_cache import response_cache
+from jobs import get_job_queue, job_stats
+from checkpoint_store import checkpoint_stats
+from context_builder import context_stats
+from question_planner import (
+    ASKED_KEY,
+    QUESTION_PLANNER_BATCH,
+    QUESTION_PLANNER_ENABLED,
+    catalog_questions,
+    match_reply,
+    parse_answers,
+    plan,
+    planner_stats,
+    record_direct_turn,
+    reply,
+)
+from report_engine import REPORT_HASH_KEY, content_hash, report_stats
+from projection_engine import MAX_PATHS
+from profile_patch import apply_update, delta, pending_patches, profile_stats, profile_version, record_response
+from storage import VersionConflict, aload_profile_patches, asave_report
+from session_cache import SessionCache
+from session_lock import LockTimeout, session_locks
+from tracing import TIMING_HEADER, render_prometheus, span, start_trace
 
 # Configure logger
 logger = logging.getLogger("main_api")
@@ -15,19 +43,46 @@ handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(me
 if not logger.handlers:
     logger.addHandler(handler)
 
-app = FastAPI(title="Financial Advisor Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background job workers run for the lifetime of the app
+    queue = get_job_queue()
+    queue.start()
+    try:
+        yield
+    finally:
+        queue.stop(wait=False)
+
+
+app = FastAPI(title="Financial Advisor Agent", lifespan=lifespan)
 agent = Agent()
 
-# Optionally pre-load sessions (not required) - storage is canonical
-try:
-    SESSIONS: Dict[str, Dict[str, Any]] = load_all_sessions()
-except Exception:
-    SESSIONS = {}
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Collect per-stage spans for each request; optionally return them as a Server-Timing header."""
+    trace = start_trace()
+    with span("http") as s:
+        response = await call_next(request)
+        # Label by route template rather than raw path to keep metric cardinality bounded
+        s.labels["route"] = getattr(request.scope.get("route"), "path", "unmatched")
+    if TIMING_HEADER or request.headers.get("x-timing") == "1":
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+# Sessions are loaded lazily per request through a bounded write-through cache;
+# storage is canonical and nothing is read at startup.
+session_cache = SessionCache()
 
 
 class ChatRequest(BaseModel):
-    user_input: str
+    user_input: str = ""
     session_id: Optional[str] = None
+    # Structured answers keyed by question `key` (e.g. {"income.amount": "30k"}); parsed without the LLM
+    answers: Optional[Dict[str, Any]] = None
+    # Profile version the client already holds; when set, `updated_profile` is returned as a delta
+    profile_version: Optional[int] = None
 
 
 class ChatResponse(BaseModel):
@@ -36,6 +91,35 @@ class ChatResponse(BaseModel):
     updated_profile: Dict[str, Any]
     new_questions: Optional[List[Dict[str, Any]]] = None
     finished: Optional[bool] = False
+    # Answers from the request that could not be parsed, keyed by question key
+    answer_errors: Optional[Dict[str, str]] = None
+    profile_version: int = 0
+    # True when `updated_profile` only holds the values changed since the requested version;
+    # deep-merge it into the client's copy (dicts merge, other values replace)
+    profile_delta: bool = False
+
+
+class DecisionItem(BaseModel):
+    persona_id: str
+    persona_data: Dict[str, Any]
+    event_id: str
+    event_data: Dict[str, Any]
+    selected_choice_id: str
+    simulation_paths: Optional[int] = Field(0, ge=0, le=MAX_PATHS)
+    # `run_id` of a failed analysis to resume from its last checkpoint
+    run_id: Optional[str] = None
+
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[DecisionItem]
+    max_concurrency: Optional[int] = 8
+
+
+def get_strategist():
+    """Return the process-wide StrategistAgent, building its workflow on first use."""
+    from strategist_agent import shared_agent
+
+    return shared_agent()
 
 
 def normalize_questions(qs: Any) -> List[Dict[str, Any]]:
@@ -58,13 +142,102 @@ def normalize_questions(qs: Any) -> List[Dict[str, Any]]:
     return out
 
 
+async def _apply_tool_output(sid: str, session: Dict[str, Any], tool_output: Any):
+    """Merge profile updates, pick up questions and save any report from a tool's output.
+
+    Returns (new_questions, finished).
+    """
+    new_questions = None
+    finished = False
+    if not isinstance(tool_output, dict):
+        return new_questions, finished
+
+    logger.info("Tool output keys=%s", list(tool_output.keys()))
+    apply_update(session, tool_output.get("updated_profile"))
+    if tool_output.get("next_questions"):
+        new_questions = normalize_questions(tool_output.get("next_questions"))
+    if tool_output.get("questions"):
+        new_questions = normalize_questions(tool_output.get("questions"))
+    if tool_output.get("report"):
+        # Reports are saved only when their content changed since the last save
+        report_hash = tool_output.get("report_hash") or content_hash(tool_output.get("report"))
+        if report_hash != session.get(REPORT_HASH_KEY):
+            try:
+                with span("chat.report_save"):
+                    await asave_report(sid, tool_output)
+                session[REPORT_HASH_KEY] = report_hash
+            except Exception:
+                logger.debug("Failed to save report for %s", sid)
+        finished = True
+    return new_questions, finished
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
+    return await _run_chat(req)
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Server-Sent Events variant of `/chat`.
+
+    Events, in order: `session` ({"session_id"}), `plan`, `tool_start`, `token`
+    ({"text"}, user-facing response text as it is generated), `tool_end`,
+    `questions`, and finally `final` with the same payload `/chat` returns.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, data: Dict[str, Any]) -> None:
+        queue.put_nowait((event, data))
+
+    async def run() -> None:
+        try:
+            resp = await _run_chat(req, emit)
+            emit("final", resp.model_dump())
+        except HTTPException as e:
+            emit("error", {"detail": e.detail})
+        except Exception:
+            logger.exception("Streaming chat failed")
+            emit("error", {"detail": "Internal error processing request."})
+        finally:
+            queue.put_nowait(None)
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                event, data = item
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def _run_chat(req: ChatRequest, emit=None) -> ChatResponse:
+    """Handle one chat turn; `emit(event, data)` receives progress events when streaming."""
     sid = req.session_id or str(uuid4())
+    if emit is not None:
+        emit("session", {"session_id": sid})
 
-    # Load session on every request; storage is the source of truth
+    # One turn at a time per session, across coroutines and worker processes
     try:
-        session = load_session(sid)
+        async with session_locks.hold(sid):
+            return await _run_turn(sid, req, emit)
+    except LockTimeout:
+        logger.warning("Timed out waiting for the lock on session %s", sid)
+        raise HTTPException(status_code=409, detail="This session is still processing a previous message. Please retry.")
+
+
+async def _run_turn(sid: str, req: ChatRequest, emit=None) -> ChatResponse:
+    # Load session through the write-through cache; storage is the source of truth
+    try:
+        with span("chat.session_load"):
+            session = await session_cache.aget(sid)
     except Exception as e:
         logger.warning("Failed to load session %s: %s", sid, e)
         session = {}
@@ -82,70 +255,108 @@ def chat(req: ChatRequest):
             "messages": [],
         }
         try:
-            save_session(sid, session)
+            await session_cache.aput(sid, session)
         except Exception:
             logger.debug("Failed to persist new session %s", sid)
 
+    # Structured answers, or a bare reply to the last planner question, are parsed locally.
+    # A turn that only answers catalog questions skips the agent (and its LLM call).
+    user_input = req.user_input
+    answers = dict(req.answers or {})
+    if QUESTION_PLANNER_ENABLED and not answers and user_input.strip():
+        answers = match_reply(user_input.strip(), session.get(ASKED_KEY)) or {}
+        direct = bool(answers)
+    else:
+        direct = bool(answers) and not user_input.strip()
+    answered: Dict[str, Any] = {}
+    answer_errors = None
+    if answers:
+        answered, answer_errors, unknown = parse_answers(answers)
+        apply_update(session, answered)
+        if unknown:
+            # Answers to questions the LLM asked are passed on to the agent
+            direct = False
+            user_input = f"{user_input}\nAnswers: {json.dumps(unknown, ensure_ascii=False)}".strip()
+        if not user_input.strip():
+            user_input = "; ".join(f"{k}: {v}" for k, v in answers.items())
+
+    # Plan before the agent: while onboarding, analysis_agent is answered by the planner
+    # instead of a provider call
+    planned = plan(session.get("user_profile", {})) if QUESTION_PLANNER_ENABLED else None
+    planned_version = profile_version(session)
+    tool_outputs = {"analysis_agent": {"next_questions": planned.questions}} if planned and planned.questions else None
+    if tool_outputs and not user_input.strip():
+        # An empty onboarding turn (e.g. the first one) just gets the next questions
+        direct = True
+
     # Ask the agent what to do
     try:
-        result = agent.handle(req.user_input, session)
-        logger.info("Agent returned status=%s", result.get("status"))
+        if direct:
+            record_direct_turn()
+            result = {"response": "", "status": "RESPOND", "updated_profile_data": {}}
+        else:
+            result = await agent.ahandle(user_input, session, emit, tool_outputs)
+        logger.info("Agent returned status=%s prompt_metrics=%s", result.get("status"), result.get("prompt_metrics"))
         logger.debug("Agent result: %s", result)
     except Exception as e:
         logger.exception("Agent handling failed: %s", e)
-        return ChatResponse(session_id=sid, response="Internal error processing request.", updated_profile=session.get("user_profile", {}))
+        return ChatResponse(
+            session_id=sid,
+            response="Internal error processing request.",
+            updated_profile=session.get("user_profile", {}),
+            profile_version=profile_version(session),
+        )
 
     # Merge any profile updates suggested by the agent
-    updated = result.get("updated_profile_data", {}) or {}
-    if isinstance(updated, dict) and updated:
-        session["user_profile"].update(updated)
+    apply_update(session, result.get("updated_profile_data"))
 
     # Handle any tool output returned by the agent
-    tool_output = result.get("tool_output")
-    new_questions = None
-    finished = False
-
-    if isinstance(tool_output, dict):
-        logger.info("Agent tool_output keys=%s", list(tool_output.keys()))
-        if "questions" in tool_output:
-            new_questions = normalize_questions(tool_output.get("questions"))
-        if "next_questions" in tool_output:
-            new_questions = normalize_questions(tool_output.get("next_questions"))
-        if "report" in tool_output:
-            try:
-                save_report(sid, tool_output)
-            except Exception:
-                logger.debug("Failed to save report for %s", sid)
-            finished = True
+    new_questions, finished = await _apply_tool_output(sid, session, result.get("tool_output"))
 
-    # If agent didn't provide follow-ups and not finished, call analysis_agent automatically
-    if not new_questions and not finished:
+    # Until the profile is complete enough, the planner's catalog questions are asked (a rejected
+    # answer's question first); run analysis_agent only after that, and not twice in a turn
+    if planned is not None and not finished:
+        if profile_version(session) != planned_version:
+            # The agent or a tool changed the profile; re-plan without counting the turn twice
+            planned = plan(session.get("user_profile", {}), count=False)
+        if not planned.needs_analysis:
+            rejected = list(answer_errors or {})
+            asked = {q.get("key") for q in new_questions or []}
+            if rejected or not asked & set(planned.missing):
+                new_questions = catalog_questions(rejected) + [q for q in planned.questions if q["key"] not in rejected]
+                new_questions = new_questions[:QUESTION_PLANNER_BATCH]
+    if not new_questions and not finished and (planned is None or planned.needs_analysis) and result.get("tool") != "analysis_agent":
         try:
-            from langgraph_adapter import execute_tool
+            from langgraph_adapter import aexecute_tool
 
-            analysis_out = execute_tool("analysis_agent", {"profile": session.get("user_profile", {}), "rounds": 1}, session)
-            logger.info("analysis_agent returned type=%s", type(analysis_out))
+            with span("chat.analysis"):
+                analysis_out = await aexecute_tool("analysis_agent", {"profile": session.get("user_profile", {}), "rounds": 1}, session)
             logger.debug("analysis_out=%s", analysis_out)
-            if isinstance(analysis_out, dict):
-                upd = analysis_out.get("updated_profile") or {}
-                if isinstance(upd, dict) and upd:
-                    session["user_profile"].update(upd)
-                if analysis_out.get("next_questions"):
-                    new_questions = normalize_questions(analysis_out.get("next_questions"))
-                if analysis_out.get("questions"):
-                    new_questions = normalize_questions(analysis_out.get("questions"))
-                if analysis_out.get("report"):
-                    try:
-                        save_report(sid, analysis_out)
-                    except Exception:
-                        logger.debug("Failed to save analysis report for %s", sid)
-                    finished = True
+            new_questions, finished = await _apply_tool_output(sid, session, analysis_out)
         except Exception as e:
             logger.debug("analysis_agent invocation failed: %s", e)
 
-    # Persist session after any updates
+    if direct:
+        result["response"] = reply(bool(answered), new_questions, list(answer_errors or {}))
+        if emit is not None:
+            emit("token", {"text": result["response"]})
+    if new_questions and emit is not None:
+        emit("questions", {"questions": new_questions})
+    # Only catalog questions can be answered by a bare reply next turn
+    session[ASKED_KEY] = [q["key"] for q in catalog_questions([q.get("key") for q in new_questions or []])]
+
+    # Record the turn; storage appends it to the session's message log
+    turn_messages = [
+        {"role": "user", "content": user_input},
+        {"role": "assistant", "content": result.get("response", "")},
+    ]
+    session.setdefault("messages", []).extend(turn_messages)
+
+    # Persist session after any updates; storage writes only the pending profile patches
+    turn_patches = pending_patches(session)
     try:
-        save_session(sid, session)
+        with span("chat.session_save"):
+            session, turn_patches = await _save_turn(sid, session, turn_patches, turn_messages)
     except Exception:
         logger.debug("Failed to save session %s", sid)
 
@@ -153,15 +364,144 @@ def chat(req: ChatRequest):
     if result.get("status") == "FINISH":
         finished = True
 
+    profile, is_delta = await _profile_payload(sid, session, req.profile_version, turn_patches)
     resp = ChatResponse(
         session_id=sid,
         response=result.get("response", ""),
-        updated_profile=session.get("user_profile", {}),
+        updated_profile=profile,
         new_questions=new_questions,
         finished=finished,
+        answer_errors=answer_errors or None,
+        profile_version=profile_version(session),
+        profile_delta=is_delta,
     )
     return resp
 
 
+async def _save_turn(sid: str, session: Dict[str, Any], turn_patches: List[Dict[str, Any]], turn_messages: List[Dict[str, Any]]):
+    """Save the session; if it was changed by another writer, replay this turn onto the stored copy.
+
+    Returns the saved session and the profile patches this turn added to it.
+    """
+    try:
+        await session_cache.aput(sid, session)
+        return session, turn_patches
+    except VersionConflict:
+        logger.warning("Session %s changed concurrently; replaying this turn onto the stored copy", sid)
+    latest = await session_cache.areload(sid)
+    if not latest:
+        raise VersionConflict(sid)
+    # Patches are path-level, so they rebase cleanly onto newer profile values
+    for patch in turn_patches:
+        apply_update(latest, delta([patch]))
+    latest.setdefault("messages", []).extend(turn_messages)
+    # Session keys this turn set outright (not via patches) are carried over too
+    for key in (ASKED_KEY, REPORT_HASH_KEY):
+        if key in session:
+            latest[key] = session[key]
+    rebased = pending_patches(latest)
+    await session_cache.aput(sid, latest)
+    return latest, rebased
+
+
+async def _profile_payload(sid: str, session: Dict[str, Any], since: Optional[int], turn_patches: List[Dict[str, Any]]):
+    """Return (updated_profile, is_delta): the changes since `since` if still available, else the full profile."""
+    current = profile_version(session)
+    if since is not None and 0 <= since <= current:
+        patches = [p for p in turn_patches if p["version"] > since]
+        if len(patches) != current - since:
+            # The client is further behind than this turn; older patches come from storage
+            try:
+                patches = await aload_profile_patches(sid, since)
+            except Exception:
+                logger.debug("Failed to load profile patches for %s", sid)
+                patches = None
+        if patches is not None:
+            record_response(True)
+            return delta(patches), True
+    record_response(False)
+    return session.get("user_profile", {}), False
+
+
+@app.post("/strategist/analyze-batch")
+def analyze_batch(req: BatchAnalysisRequest):
+    """Stream one NDJSON line per item ({"index", "report"} or {"index", "error"}) as analyses finish."""
+    strategist = get_strategist()
+    items = [item.model_dump() for item in req.items]
+
+    def lines():
+        for result in strategist.analyze_decisions_batch(items, max_concurrency=req.max_concurrency or 8):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/strategist/jobs", status_code=202)
+def submit_analysis_job(req: DecisionItem):
+    """Queue one decision analysis; poll GET /strategist/jobs/{job_id} for its result."""
+    from strategist_agent import StrategistAgent
+
+    payload = req.model_dump()
+    # Fixing the run id up front lets a retried job resume the same checkpointed run
+    payload["run_id"] = payload["run_id"] or StrategistAgent.new_run_id()
+    job_id = get_job_queue().submit("strategist.analyze", payload)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/strategist/jobs")
+def list_analysis_jobs(status: Optional[str] = None, limit: int = 50):
+    return {"jobs": get_job_queue().list(status, max(1, min(limit, 500)))}
+
+
+@app.get("/strategist/jobs/{job_id}")
+def get_analysis_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@app.post("/strategist/jobs/{job_id}/cancel")
+def cancel_analysis_job(job_id: str):
+    """Cancel a queued job, or ask a running one to stop after its current step."""
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+@app.get("/stats")
+def stats() -> Dict[str, Any]:
+    """Runtime counters for the LLM client pool, caches, prompt sizes, profile patches, locks, the question planner, reports, background jobs and strategist checkpoints."""
+    return {
+        "llm_clients": client_stats(),
+        "llm_cache": response_cache.stats(),
+        "session_cache": session_cache.stats(),
+        "prompt_context": context_stats(),
+        "profile_patches": profile_stats(),
+        "session_locks": session_locks.stats(),
+        "question_planner": planner_stats(),
+        "report_engine": report_stats(),
+        "jobs": job_stats(),
+        "strategist_checkpoints": checkpoint_stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> str:
+    """Per-stage latency histograms and LLM token/cache counters in Prometheus text format."""
+    return render_prometheus()
+
+
 if __name__ == "__main__":
-    uvicorn.run("main_api:app", host="127.0.0.1", port=8000, reload=True)
+    # APP_ENV=dev (default): one auto-reloading worker. Otherwise API_WORKERS processes
+    # (default: CPU count); sessions stay consistent through storage and per-session locks.
+    host = os.environ.get("API_HOST", "127.0.0.1")
+    port = int(os.environ.get("API_PORT", "8000"))
+    if os.environ.get("APP_ENV", "dev") == "dev":
+        uvicorn.run("main_api:app", host=host, port=port, reload=True)
+    else:
+        workers = int(os.environ.get("API_WORKERS") or os.cpu_count() or 1)
+        # Workers inherit this, which turns on session cache revalidation
+        os.environ["API_WORKERS"] = str(workers)
+        uvicorn.run("main_api:app", host=host, port=port, workers=workers)
@@ -0,0 +1,113 @@
+"""Deterministic local LLM stand-in (enable with LLM_PROVIDER=mock).
+
+`MockChatModel` exposes the subset of the LangChain chat-model API that
+`llm_client` uses (`predict_messages`, `ainvoke`, `astream`), so the whole
+client path (registry, cache, tracing) runs exactly as with a real provider.
+Responses are canned per prompt family: agent plans and analysis JSON come from
+`llm_client`'s heuristic fallback, strategist prompts get fixed report JSON.
+Each call sleeps MOCK_LLM_LATENCY_MS plus a uniform jitter of up to
+MOCK_LLM_JITTER_MS, drawn from a seeded RNG so benchmark runs are repeatable.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+MOCK_LLM_LATENCY_MS = float(os.environ.get("MOCK_LLM_LATENCY_MS", "50"))
+MOCK_LLM_JITTER_MS = float(os.environ.get("MOCK_LLM_JITTER_MS", "0"))
+MOCK_LLM_SEED = int(os.environ.get("MOCK_LLM_SEED", "0"))
+MOCK_LLM_CHUNK_CHARS = int(os.environ.get("MOCK_LLM_CHUNK_CHARS", "16"))
+
+STRATEGIST_ANALYSIS = {
+    "psychological_consequence": "Short-term relief with lingering worry about the depleted buffer",
+    "opportunity_cost": "Emergency savings that could have covered next month's shortfall",
+    "sustainability_score": 6,
+    "urgency_vs_planning": "Strategic",
+    "risk_assessment": "Moderate: limited buffer if another shock hits soon",
+}
+STRATEGIST_INSIGHTS = {
+    "decision_archetype": "Prudent Planner",
+    "vulnerability_indicators": ["Thin cash buffer", "Income tied to daily activity"],
+    "adaptive_capacity": {"short_term": "Moderate", "medium_term": "Moderate"},
+    "long_term_trajectory": "Stable if income holds and savings are rebuilt",
+    "intervention_opportunities": ["Automated micro-savings", "Low-cost insurance"],
+    "peer_comparison": {"risk_profile": "Average"},
+}
+
+
+def _as_dicts(messages: List[Any]) -> List[Dict[str, Any]]:
+    # Accept LangChain messages (type: system/human/ai) or plain role dicts
+    roles = {"human": "user", "ai": "assistant"}
+    out = []
+    for m in messages:
+        if isinstance(m, dict):
+            out.append(m)
+        else:
+            out.append({"role": roles.get(getattr(m, "type", ""), getattr(m, "type", "user")), "content": getattr(m, "content", "")})
+    return out
+
+
+def mock_response(messages: List[Dict[str, Any]]) -> str:
+    """Return the canned response text for a conversation."""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    if "Analyze this financial decision" in prompt:
+        return json.dumps(STRATEGIST_ANALYSIS)
+    if "Behavioral Analysis for Gig Economy Persona" in prompt:
+        return json.dumps(STRATEGIST_INSIGHTS)
+    from llm_client import _fallback_chat
+
+    return _fallback_chat(messages).get("content", "")
+
+
+class MockChatModel:
+    def __init__(
+        self,
+        model: str,
+        latency_ms: float = MOCK_LLM_LATENCY_MS,
+        jitter_ms: float = MOCK_LLM_JITTER_MS,
+        seed: Optional[int] = MOCK_LLM_SEED,
+    ):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return (self.latency_ms + jitter) / 1000.0
+
+    @staticmethod
+    def _message(text: str, messages: List[Dict[str, Any]]) -> SimpleNamespace:
+        # Token usage estimated at ~4 characters per token
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+        usage = {"input_tokens": prompt_chars // 4 + 1, "output_tokens": len(text) // 4 + 1}
+        return SimpleNamespace(content=text, usage_metadata=usage)
+
+    def predict_messages(self, messages: List[Any]) -> SimpleNamespace:
+        msgs = _as_dicts(messages)
+        time.sleep(self._delay())
+        return self._message(mock_response(msgs), msgs)
+
+    async def ainvoke(self, messages: List[Any]) -> SimpleNamespace:
+        msgs = _as_dicts(messages)
+        await asyncio.sleep(self._delay())
+        return self._message(mock_response(msgs), msgs)
+
+    async def astream(self, messages: List[Any]) -> AsyncIterator[SimpleNamespace]:
+        # Half the latency before the first chunk, the rest spread over the remaining chunks
+        msgs = _as_dicts(messages)
+        text = mock_response(msgs)
+        delay = self._delay()
+        chunks = [text[i:i + MOCK_LLM_CHUNK_CHARS] for i in range(0, len(text), MOCK_LLM_CHUNK_CHARS)] or [""]
+        await asyncio.sleep(delay / 2)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(delay / 2 / max(1, len(chunks) - 1))
+            yield SimpleNamespace(content=chunk, usage_metadata=None)
+        yield SimpleNamespace(content="", usage_metadata=self._message(text, msgs).usage_metadata)
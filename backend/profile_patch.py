@@ -0,0 +1,132 @@
+"""Versioned deep-merge patches for `user_profile`.
+
+Every change to a session's profile goes through `apply_update`, which
+deep-merges the update (dicts merge key by key; lists and scalars replace the
+old value), records only the changed paths as a patch and bumps
+`session["profile_version"]`. Patches wait on the session under `PENDING_KEY`
+until storage persists them, so backends write the changed sub-paths instead of
+the whole profile (see `storage` and `sqlite_store`).
+
+A patch is `{"version": int, "changes": [[path, value], ...]}` where `path` is a
+list of keys. `delta(patches)` folds patches into a nested dict; deep-merging
+it into the profile at the older version yields the current profile, which is
+how clients receive `updated_profile` as a delta.
+"""
+import copy
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Patches persisted per session and available for delta responses
+PROFILE_PATCH_HISTORY = int(os.environ.get("PROFILE_PATCH_HISTORY", "64"))
+
+PENDING_KEY = "_profile_patches"
+VERSION_KEY = "profile_version"
+
+_stats_lock = threading.Lock()
+_stats = {"patches": 0, "changed_paths": 0, "noop_updates": 0, "delta_responses": 0, "full_responses": 0}
+
+
+def deep_merge(target: Dict[str, Any], update: Dict[str, Any], prefix: Tuple[str, ...] = ()) -> List[Tuple[List[str], Any]]:
+    """Merge `update` into `target` in place; return the (path, new value) of each change."""
+    changes: List[Tuple[List[str], Any]] = []
+    for key, value in update.items():
+        path = prefix + (key,)
+        if key in target and isinstance(target[key], dict) and isinstance(value, dict):
+            changes.extend(deep_merge(target[key], value, path))
+        elif key not in target or target[key] != value:
+            target[key] = copy.deepcopy(value)
+            changes.append((list(path), copy.deepcopy(value)))
+    return changes
+
+
+def set_path(obj: Dict[str, Any], path: List[str], value: Any) -> None:
+    for key in path[:-1]:
+        child = obj.get(key)
+        if not isinstance(child, dict):
+            child = obj[key] = {}
+        obj = child
+    obj[path[-1]] = copy.deepcopy(value)
+
+
+def apply_patch(profile: Dict[str, Any], patch: Dict[str, Any]) -> None:
+    for path, value in patch.get("changes", []):
+        set_path(profile, path, value)
+
+
+def apply_update(session: Dict[str, Any], update: Any) -> Optional[Dict[str, Any]]:
+    """Deep-merge `update` into the session profile; return the new patch, or None if nothing changed."""
+    if not isinstance(update, dict) or not update:
+        return None
+    profile = session.get("user_profile")
+    if not isinstance(profile, dict):
+        profile = session["user_profile"] = {}
+    changes = deep_merge(profile, update)
+    if not changes:
+        with _stats_lock:
+            _stats["noop_updates"] += 1
+        return None
+    patch = {"version": profile_version(session) + 1, "changes": [[path, value] for path, value in changes]}
+    session[VERSION_KEY] = patch["version"]
+    session.setdefault(PENDING_KEY, []).append(patch)
+    with _stats_lock:
+        _stats["patches"] += 1
+        _stats["changed_paths"] += len(changes)
+    return patch
+
+
+def profile_version(session: Dict[str, Any]) -> int:
+    return int(session.get(VERSION_KEY) or 0)
+
+
+def pending_patches(session: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Patches applied to the session but not yet persisted, oldest first."""
+    return list(session.get(PENDING_KEY) or [])
+
+
+def mark_persisted(session: Dict[str, Any]) -> None:
+    session.pop(PENDING_KEY, None)
+
+
+def folded_changes(patches: List[Dict[str, Any]]) -> List[Tuple[List[str], Any]]:
+    """Fold patches (oldest first) into changes whose paths do not overlap.
+
+    A change inside a path set earlier is merged into that earlier value, and a
+    change that replaces a parent drops the earlier changes below it, so the
+    result can be applied in any order (e.g. in one SQLite `json_set` call).
+    """
+    folded: Dict[Tuple[str, ...], Any] = {}
+    for patch in patches:
+        for path, value in patch.get("changes", []):
+            key = tuple(path)
+            parent = next((key[:i] for i in range(1, len(key)) if key[:i] in folded), None)
+            if parent is not None:
+                container = folded[parent]
+                if not isinstance(container, dict):
+                    container = folded[parent] = {}
+                set_path(container, list(key[len(parent):]), value)
+                continue
+            for old in [k for k in folded if k[:len(key)] == key]:
+                del folded[old]
+            folded[key] = copy.deepcopy(value)
+    return [(list(k), v) for k, v in folded.items()]
+
+
+def delta(patches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fold patches (oldest first) into one nested dict of changed values."""
+    out: Dict[str, Any] = {}
+    for patch in patches:
+        apply_patch(out, patch)
+    return out
+
+
+def record_response(is_delta: bool) -> None:
+    with _stats_lock:
+        _stats["delta_responses" if is_delta else "full_responses"] += 1
+
+
+def profile_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["avg_paths_per_patch"] = round(out["changed_paths"] / out["patches"], 2) if out["patches"] else 0.0
+    return out
@@ -0,0 +1,260 @@
+"""NumPy projection engine for StrategistAgent financial trajectories.
+
+Computes month-by-month savings, debt, cumulative impact and financial health
+score for many (persona baseline, choice) rows over any horizon in one array
+operation. The 3/6/12-month outlooks in a report are slices of these arrays.
+
+Model (per row, month t = 0..horizon):
+- cumulative_impact[t] = financial_impact * t
+- savings[t]           = max(0, savings_0 + cumulative_impact[t])
+- debt[t]              = debt_0 + max(future_liability, 0) * t
+- health[t]            = health score of (savings[t], income, debt[t])
+- recovery_months      = months of surplus (income - fixed_expenses) needed to
+                         cover an immediate cost; 0 if there is no cost or surplus
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_HORIZON = 12
+
+
+def _num(value: Any, default: float = 0.0) -> float:
+    return default if value is None else float(value)
+
+
+def _py(value: float):
+    """Convert a NumPy scalar to int when integral, otherwise float (keeps reports JSON-clean)."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def health_score(savings: np.ndarray, income: np.ndarray, debt: np.ndarray) -> np.ndarray:
+    """Vectorized financial health score (0-100); 0 where income is 0."""
+    income = np.asarray(income, dtype=float)
+    safe_income = np.where(income == 0, 1.0, income)
+    savings_ratio = np.minimum(savings / safe_income * 100, 50)
+    debt_ratio = np.maximum(50 - debt / safe_income * 100, 0)
+    return np.where(income == 0, 0.0, (savings_ratio + debt_ratio) / 2)
+
+
+def project(
+    savings: np.ndarray,
+    debt: np.ndarray,
+    income: np.ndarray,
+    fixed_expenses: np.ndarray,
+    impact: np.ndarray,
+    liability: np.ndarray,
+    horizon: int = DEFAULT_HORIZON,
+) -> Dict[str, np.ndarray]:
+    """Project every row over `horizon` months.
+
+    All inputs are 1-D arrays of equal length (or scalars). Trajectory outputs
+    have shape (rows, horizon + 1); `recovery_months` has shape (rows,).
+    """
+    savings, debt, income, fixed_expenses, impact, liability = (
+        np.atleast_1d(np.asarray(a, dtype=float)) for a in (savings, debt, income, fixed_expenses, impact, liability)
+    )
+    months = np.arange(horizon + 1, dtype=float)
+
+    cumulative_impact = impact[:, None] * months
+    savings_path = np.maximum(0, savings[:, None] + cumulative_impact)
+    debt_path = debt[:, None] + np.maximum(liability, 0)[:, None] * months
+    health_path = health_score(savings_path, income[:, None], debt_path)
+
+    immediate_cost = np.where(impact < 0, -impact, 0)
+    surplus = income - fixed_expenses
+    has_recovery = (immediate_cost > 0) & (surplus > 0)
+    recovery = np.where(has_recovery, np.maximum(1, np.floor(immediate_cost / np.where(has_recovery, surplus, 1))), 0)
+
+    return {
+        "cumulative_impact": cumulative_impact,
+        "savings": savings_path,
+        "debt": debt_path,
+        "health": health_path,
+        "recovery_months": recovery,
+    }
+
+
+def baseline_row(financial_state_before: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """Return (savings, debt, income, fixed_expenses) with the report's defaults for missing values."""
+    return (
+        _num(financial_state_before.get("savings")),
+        _num(financial_state_before.get("debt")),
+        _num(financial_state_before.get("income"), 1.0),
+        _num(financial_state_before.get("fixed_expenses")),
+    )
+
+
+def project_choices(
+    cases: Iterable[Tuple[Dict[str, Any], List[dict]]],
+    horizon: int = DEFAULT_HORIZON,
+) -> List[Dict[str, Dict[str, Any]]]:
+    """Project every choice of every case in a single array operation.
+
+    `cases` is a sequence of (financial_state_before, choices). Returns, per case,
+    a dict keyed by choice id holding plain-Python trajectories (lists indexed
+    by month) and `recovery_months`.
+    """
+    cases = list(cases)
+    rows: List[Tuple[float, ...]] = []
+    for before, choices in cases:
+        base = baseline_row(before)
+        for choice in choices:
+            rows.append(base + (_num(choice.get("financial_impact")), _num(choice.get("future_liability"))))
+
+    if not rows:
+        return [{} for _ in cases]
+
+    columns = np.array(rows, dtype=float).T
+    result = project(*columns, horizon=horizon)
+
+    out: List[Dict[str, Dict[str, Any]]] = []
+    row = 0
+    for _before, choices in cases:
+        per_choice: Dict[str, Dict[str, Any]] = {}
+        for choice in choices:
+            per_choice[choice["id"]] = {
+                "cumulative_impact": [_py(v) for v in result["cumulative_impact"][row]],
+                "savings": [_py(v) for v in result["savings"][row]],
+                "debt": [_py(v) for v in result["debt"][row]],
+                "health": [float(v) for v in result["health"][row]],
+                "recovery_months": _py(result["recovery_months"][row]),
+            }
+            row += 1
+        out.append(per_choice)
+    return out
+
+
+def outlook(trajectory: Dict[str, Any], month: int) -> Optional[Dict[str, Any]]:
+    """Slice one month out of a projected trajectory."""
+    if not trajectory or month >= len(trajectory.get("savings", [])):
+        return None
+    return {
+        "cumulative_impact": trajectory["cumulative_impact"][month],
+        "savings": trajectory["savings"][month],
+        "debt": trajectory["debt"][month],
+        "health": trajectory["health"][month],
+        "debt_accumulation": _py(trajectory["debt"][month] - trajectory["debt"][0]),
+    }
+
+
+# --- Monte Carlo income-volatility simulation ---
+# Gig income is not a constant monthly figure. `simulate` samples monthly income
+# and expense paths around the persona's baseline and reports percentile bands.
+# With zero volatility it reproduces `project`, except that a path whose
+# savings run out finances the shortfall as debt (an overdraft repaid first
+# once the balance recovers).
+
+DEFAULT_PATHS = 10000
+# Memory grows with choices x paths x months, so requests are capped
+MAX_PATHS = int(os.environ.get("SIMULATION_MAX_PATHS", "25000"))
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Coefficient of variation of monthly income by the persona's `income_volatility` label
+VOLATILITY_LEVELS = {
+    "none": 0.0,
+    "low": 0.05,
+    "moderate": 0.15,
+    "medium": 0.15,
+    "high": 0.30,
+    "seasonal": 0.25,
+    "very high": 0.45,
+    "extreme": 0.45,
+}
+DEFAULT_VOLATILITY = {
+    "income_cv": VOLATILITY_LEVELS["moderate"],
+    "expense_cv": 0.05,
+    # Probability of an unexpected expense in a month, and its size as a fraction of income
+    "shock_probability": 0.05,
+    "shock_size": 0.25,
+}
+
+
+def volatility_model(financial_baseline: Dict[str, Any]) -> Dict[str, float]:
+    """Build the volatility model for a persona's `financial_baseline`.
+
+    The `income_volatility` label (e.g. "High (Daily Payouts)") picks the income
+    CV; numeric `income_volatility_cv`, `expense_volatility_cv`,
+    `shock_probability` and `shock_size` fields override the defaults.
+    """
+    model = dict(DEFAULT_VOLATILITY)
+    label = str(financial_baseline.get("income_volatility") or "").lower()
+    # Match the longest level name first so "very high" wins over "high"
+    for level in sorted(VOLATILITY_LEVELS, key=len, reverse=True):
+        if label.startswith(level) or f"{level} " in label:
+            model["income_cv"] = VOLATILITY_LEVELS[level]
+            break
+    overrides = {
+        "income_volatility_cv": "income_cv",
+        "expense_volatility_cv": "expense_cv",
+        "shock_probability": "shock_probability",
+        "shock_size": "shock_size",
+    }
+    for field, key in overrides.items():
+        if financial_baseline.get(field) is not None:
+            model[key] = float(financial_baseline[field])
+    return model
+
+
+def _lognormal_factors(rng: np.random.Generator, cv: float, shape: Tuple[int, ...]) -> np.ndarray:
+    """Mean-one multiplicative noise with the given coefficient of variation."""
+    if cv <= 0:
+        return np.ones(shape)
+    sigma = np.sqrt(np.log1p(cv * cv))
+    return np.exp(rng.standard_normal(shape) * sigma - sigma * sigma / 2)
+
+
+def simulate(
+    financial_state_before: Dict[str, Any],
+    choices: List[dict],
+    volatility: Dict[str, float],
+    horizon: int = DEFAULT_HORIZON,
+    n_paths: int = DEFAULT_PATHS,
+    seed: Optional[int] = None,
+    percentiles: Tuple[int, ...] = DEFAULT_PERCENTILES,
+) -> Dict[str, Dict[str, Any]]:
+    """Simulate `n_paths` income/expense paths per choice and return percentile bands.
+
+    All choices share the same sampled paths, so differences between choices are
+    not sampling noise. Returns, keyed by choice id, `savings`/`debt`/`health`
+    bands ({"p5": [month 0..horizon], ...}) and `probability_savings_depleted`.
+    """
+    if not choices:
+        return {}
+    savings0, debt0, income, fixed_expenses = baseline_row(financial_state_before)
+    impact = np.array([_num(c.get("financial_impact")) for c in choices])
+    liability = np.maximum(np.array([_num(c.get("future_liability")) for c in choices]), 0)
+
+    rng = np.random.default_rng(seed)
+    shape = (n_paths, horizon)
+    income_paths = income * _lognormal_factors(rng, volatility.get("income_cv", 0.0), shape)
+    expense_paths = fixed_expenses * _lognormal_factors(rng, volatility.get("expense_cv", 0.0), shape)
+    shocks = (rng.random(shape) < volatility.get("shock_probability", 0.0)) * (volatility.get("shock_size", 0.0) * income)
+
+    # Monthly deviation from the baseline budget, shared by all choices: (paths, horizon)
+    deviation = (income_paths - income) - (expense_paths - fixed_expenses) - shocks
+    cumulative_deviation = np.concatenate([np.zeros((n_paths, 1)), np.cumsum(deviation, axis=1)], axis=1)
+
+    months = np.arange(horizon + 1, dtype=float)
+    # (choices, paths, months)
+    balance = savings0 + impact[:, None, None] * months + cumulative_deviation[None, :, :]
+    savings_paths = np.maximum(balance, 0)
+    debt_paths = debt0 + liability[:, None, None] * months + np.maximum(-balance, 0)
+    health_paths = health_score(savings_paths, income, debt_paths)
+
+    bands = {
+        name: np.percentile(paths, percentiles, axis=1)
+        for name, paths in (("savings", savings_paths), ("debt", debt_paths), ("health", health_paths))
+    }
+    depleted = (savings_paths[:, :, 1:] <= 0).any(axis=2).mean(axis=1)
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for i, choice in enumerate(choices):
+        out[choice["id"]] = {
+            name: {f"p{p}": [round(float(v), 2) for v in band[j, i]] for j, p in enumerate(percentiles)}
+            for name, band in bands.items()
+        }
+        out[choice["id"]]["probability_savings_depleted"] = round(float(depleted[i]), 4)
+    return out
@@ -0,0 +1,263 @@
+"""Rule-based onboarding question planner.
+
+The default `user_profile` skeleton has a fixed set of fields, so choosing the
+next question during onboarding needs no LLM: `plan` walks a prioritized
+catalog of questions (in `tools.question_generator`'s structured format, keyed
+by the dotted profile path they fill) and returns the first ones whose field is
+still empty. `analysis_agent` is only worth calling once the profile is complete
+enough (QUESTION_PLANNER_MIN_COMPLETENESS of the applicable fields).
+
+Answers are parsed deterministically: `parse_answers` takes structured answers
+(`{"income.amount": "30k"}`) and `match_reply` recognises a bare reply ("30k",
+"yes", "Medium", or free text for a text question) to the questions asked last
+turn, so most onboarding turns update the profile without a provider call.
+"""
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from profile_patch import deep_merge, set_path
+
+QUESTION_PLANNER_ENABLED = os.environ.get("QUESTION_PLANNER_ENABLED", "1") == "1"
+QUESTION_PLANNER_BATCH = int(os.environ.get("QUESTION_PLANNER_BATCH", "2"))
+QUESTION_PLANNER_MIN_COMPLETENESS = float(os.environ.get("QUESTION_PLANNER_MIN_COMPLETENESS", "1.0"))
+
+ASKED_KEY = "asked_questions"
+
+ANSWERS_SAVED = "Thanks, I've updated your profile."
+ANSWERS_INVALID = "Sorry, I couldn't read that answer."
+
+
+def _has_debt(profile: Dict[str, Any]) -> bool:
+    return get_path(profile, "debt.has_debt") is True
+
+
+# Priority order; `when` limits a question to profiles where it applies
+CATALOG: List[Dict[str, Any]] = [
+    {"key": "income.amount", "label": "What is your monthly take-home income (₹)?", "type": "number", "min": 0, "step": 1000, "required": True},
+    {
+        "key": "income.stability",
+        "label": "How steady is your income?",
+        "type": "select",
+        "options": ["Fixed salary", "Variable / gig work", "Seasonal", "No regular income"],
+        "required": True,
+    },
+    {"key": "debt.has_debt", "label": "Do you currently have any loans or debts?", "type": "select", "options": ["Yes", "No"], "required": True},
+    {
+        "key": "debt.details",
+        "label": "Briefly list your loans (type, amount outstanding, monthly EMI):",
+        "type": "text",
+        "placeholder": "e.g. Bike loan, ₹40,000 left, ₹2,500/month",
+        "required": True,
+        "when": _has_debt,
+    },
+    {"key": "assets.savings", "label": "How much do you have saved right now (₹)?", "type": "number", "min": 0, "step": 1000, "required": True},
+    {
+        "key": "assets.liquidity",
+        "label": "How long could your savings cover your usual expenses?",
+        "type": "select",
+        "options": ["Less than 1 month", "1-3 months", "3-6 months", "More than 6 months"],
+        "required": True,
+    },
+    {"key": "goals.short_term", "label": "What is your main money goal for the next year?", "type": "text", "placeholder": "e.g. Build an emergency fund", "required": True},
+    {"key": "goals.long_term", "label": "And your main long-term goal (5+ years)?", "type": "text", "placeholder": "e.g. Buy a house", "required": True},
+    {"key": "psychology.risk_tolerance", "label": "How comfortable are you with financial risk?", "type": "select", "options": ["Low", "Medium", "High"], "required": True},
+    {
+        "key": "psychology.spending_habits",
+        "label": "Which best describes your spending?",
+        "type": "select",
+        "options": [
+            "I save first, then spend",
+            "I budget but sometimes overspend",
+            "I spend first and save what's left",
+            "I often run short before month-end",
+        ],
+        "required": True,
+    },
+]
+_BY_KEY = {q["key"]: q for q in CATALOG}
+
+_stats_lock = threading.Lock()
+_stats = {"plans": 0, "planned_questions": 0, "analysis_handoffs": 0, "answers_parsed": 0, "answers_rejected": 0, "direct_turns": 0}
+
+
+def _count(**deltas: int) -> None:
+    with _stats_lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+
+
+def get_path(profile: Dict[str, Any], path: str) -> Any:
+    value: Any = profile
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+# --- Answer parsing ---
+
+_MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "l": 1e5, "lac": 1e5, "lakh": 1e5, "lakhs": 1e5, "m": 1e6, "million": 1e6, "cr": 1e7, "crore": 1e7, "crores": 1e7}
+_NUMBER = re.compile(
+    r"(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?|\.\d+)\s*(k|thousand|lakhs?|lac|l|m|million|crores?|cr)?\s*(?:₹|rs\.?|inr|rupees)?",
+    re.IGNORECASE,
+)
+_YES = {"yes", "y", "yeah", "yep", "true", "haan", "ha"}
+_NO = {"no", "n", "nope", "false", "nahi", "none"}
+
+
+def _parse_number(raw: Any) -> Optional[float]:
+    if isinstance(raw, bool):
+        return None
+    if isinstance(raw, (int, float)):
+        return raw if raw >= 0 else None
+    m = _NUMBER.fullmatch(str(raw).strip())
+    if not m:
+        return None
+    value = float(m.group(1).replace(",", "")) * _MULTIPLIERS.get((m.group(2) or "").lower(), 1)
+    return int(value) if value.is_integer() else value
+
+
+def _parse_select(spec: Dict[str, Any], raw: Any) -> Optional[Any]:
+    options = spec.get("options") or []
+    if options == ["Yes", "No"]:
+        if isinstance(raw, bool):
+            return raw
+        text = str(raw).strip().lower().rstrip(".!")
+        return True if text in _YES else False if text in _NO else None
+    text = str(raw).strip().lower()
+    if not text:
+        return None
+    for option in options:
+        if option.lower() == text:
+            return option
+    if text.isdigit() and 1 <= int(text) <= len(options):
+        return options[int(text) - 1]
+    if len(text) < 2:
+        return None
+    # A unique prefix ("med") or, failing that, a unique substring ("gig")
+    for candidates in ([o for o in options if o.lower().startswith(text)], [o for o in options if text in o.lower()]):
+        if len(candidates) == 1:
+            return candidates[0]
+    return None
+
+
+def _parse_text(spec: Dict[str, Any], raw: Any) -> Optional[Any]:
+    text = " ".join(str(raw).split())[:300] if raw is not None else ""
+    if not text:
+        return None
+    if spec["key"] == "debt.details":
+        return [part.strip() for part in re.split(r"[;\n]", text) if part.strip()]
+    return text
+
+
+_PARSERS: Dict[str, Callable[[Dict[str, Any], Any], Optional[Any]]] = {
+    "number": lambda spec, raw: _parse_number(raw),
+    "select": _parse_select,
+    "text": _parse_text,
+}
+
+
+def parse_value(key: str, raw: Any) -> Optional[Any]:
+    """Parse one answer for catalog question `key`; None if it is not a valid answer."""
+    spec = _BY_KEY.get(key)
+    return _PARSERS[spec["type"]](spec, raw) if spec else None
+
+
+def parse_answers(answers: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str], Dict[str, Any]]:
+    """Turn {question key: raw answer} into a profile update.
+
+    Returns (update, errors, unknown): errors maps catalog keys whose answer could
+    not be parsed to a message; unknown holds answers to non-catalog questions.
+    """
+    update: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    unknown: Dict[str, Any] = {}
+    for key, raw in (answers or {}).items():
+        spec = _BY_KEY.get(key)
+        if spec is None:
+            unknown[key] = raw
+            continue
+        value = parse_value(key, raw)
+        if value is None:
+            errors[key] = f"Expected {'one of: ' + ', '.join(spec['options']) if spec.get('options') else 'a ' + spec['type']}"
+            continue
+        set_path(update, key.split("."), value)
+        # Debt is settled once we know there is none, or have the details
+        if (key == "debt.has_debt" and value is False) or key == "debt.details":
+            deep_merge(update, {"debt": {"status": "complete"}})
+    _count(answers_parsed=len(answers or {}) - len(errors) - len(unknown), answers_rejected=len(errors))
+    return update, errors, unknown
+
+
+def match_reply(text: str, asked: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+    """Treat a bare reply as the answer to one of the questions asked last turn.
+
+    The reply is tried against each non-text question in order; only replies
+    that parse completely ("30k", "yes", "2", "Medium") match. Otherwise, if
+    exactly one text question was asked, any reply that is not itself a
+    question answers it. Returns None for ordinary chat messages, which go to
+    the agent.
+    """
+    specs = [_BY_KEY[k] for k in asked or [] if k in _BY_KEY]
+    for spec in specs:
+        if spec["type"] != "text" and parse_value(spec["key"], text) is not None:
+            return {spec["key"]: text}
+    text_specs = [spec for spec in specs if spec["type"] == "text"]
+    if len(text_specs) == 1 and text.strip() and not text.rstrip().endswith("?"):
+        return {text_specs[0]["key"]: text}
+    return None
+
+
+# --- Planning ---
+
+class Plan(NamedTuple):
+    questions: List[Dict[str, Any]]  # next questions, highest priority first
+    missing: List[str]  # applicable catalog keys still empty
+    completeness: float  # share of applicable catalog fields filled
+    needs_analysis: bool  # complete enough for analysis_agent
+
+
+def plan(profile: Dict[str, Any], limit: int = QUESTION_PLANNER_BATCH, count: bool = True) -> Plan:
+    """Next questions for `profile`; `count=False` re-plans a turn without counting it again."""
+    applicable = [q for q in CATALOG if q.get("when") is None or q["when"](profile)]
+    missing = [q for q in applicable if _is_missing(get_path(profile, q["key"]))]
+    completeness = round(1 - len(missing) / len(applicable), 3) if applicable else 1.0
+    needs_analysis = not missing or completeness >= QUESTION_PLANNER_MIN_COMPLETENESS
+    questions = [] if needs_analysis else [{k: v for k, v in q.items() if k != "when"} for q in missing[:limit]]
+    if count:
+        _count(plans=1, planned_questions=len(questions), analysis_handoffs=int(needs_analysis))
+    return Plan(questions, [q["key"] for q in missing], completeness, needs_analysis)
+
+
+def catalog_questions(keys: List[str]) -> List[Dict[str, Any]]:
+    """Catalog questions for `keys` (unknown keys are skipped), in the given order."""
+    return [{k: v for k, v in _BY_KEY[key].items() if k != "when"} for key in keys if key in _BY_KEY]
+
+
+def reply(saved: bool, questions: Optional[List[Dict[str, Any]]], rejected: Optional[List[str]] = None) -> str:
+    """Response text for a turn answered without the agent.
+
+    A rejected answer re-asks its own question; otherwise the first of `questions` is asked.
+    """
+    retry = catalog_questions(rejected or [])
+    text = ANSWERS_INVALID if retry else ANSWERS_SAVED if saved else ""
+    ask = retry or questions
+    if ask:
+        text = f"{text} {ask[0].get('label', '')}".strip()
+    return text
+
+
+def record_direct_turn() -> None:
+    _count(direct_turns=1)
+
+
+def planner_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return dict(_stats)
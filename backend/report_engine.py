@@ -0,0 +1,297 @@
+"""Mirror / Diagnosis / Lesson report built from the user profile.
+
+A report is three sections, each built by a pure function of a few profile
+sub-sections:
+- mirror: what the user has told us (every filled field) and what is unknown;
+- diagnosis: rule-based findings on income, savings runway and debt;
+- lesson: prioritized actions from the diagnosis, goals and psychology.
+
+Each section is addressed by a hash of its inputs (the profile sub-sections it
+reads plus the hashes of the sections it depends on), and built sections are
+kept in an LRU cache of REPORT_CACHE_SIZE entries. `build_report` therefore only
+rebuilds the sections whose inputs changed; for an unchanged profile it costs a
+few small hashes. The report hash combines the section hashes, so callers can
+skip saving a report that did not change.
+
+`render_json` returns the report as a plain dict and `render_text` a compact
+text form (also cached by report hash).
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from context_builder import compact_profile
+
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", "1024"))
+
+# Session key holding the hash of the last saved report
+REPORT_HASH_KEY = "report_hash"
+
+# Bump when a section builder changes so cached/saved sections are rebuilt
+REPORT_FORMAT_VERSION = 1
+
+_stats_lock = threading.Lock()
+_stats = {"reports": 0, "sections_built": 0, "sections_cached": 0, "text_renders": 0, "text_cached": 0}
+
+
+def _count(**deltas: int) -> None:
+    with _stats_lock:
+        for k, v in deltas.items():
+            _stats[k] += v
+
+
+def content_hash(value: Any) -> str:
+    """Stable short hash of a JSON-serialisable value."""
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+
+class _LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+_sections = _LRU(REPORT_CACHE_SIZE)
+_texts = _LRU(REPORT_CACHE_SIZE)
+
+
+# --- Helpers ---
+
+def _get(profile: Dict[str, Any], path: str) -> Any:
+    value: Any = profile
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "").replace("₹", "").strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _rupees(value: float) -> str:
+    return f"₹{value:,.0f}"
+
+
+def _label(path: str) -> str:
+    return " ".join(path.replace("_", " ").split(".")).capitalize()
+
+
+def _fmt_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, list):
+        return "; ".join(_fmt_value(v) for v in value)
+    if isinstance(value, dict):
+        return ", ".join(f"{k}: {_fmt_value(v)}" for k, v in value.items())
+    return str(value)
+
+
+def _flatten(filled: Dict[str, Any], prefix: str = "") -> List[Tuple[str, Any]]:
+    out: List[Tuple[str, Any]] = []
+    for key, value in filled.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.extend(_flatten(value, f"{path}."))
+        else:
+            out.append((path, value))
+    return out
+
+
+# --- Section builders ---
+
+def build_mirror(inputs: Dict[str, Any], deps: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    filled, missing = compact_profile(inputs.get("profile") or {})
+    facts = [{"field": path, "label": _label(path), "value": value} for path, value in _flatten(filled) if path != "debt.status"]
+    return {"facts": facts, "unknown": [p for p in missing if p != "debt.status"]}
+
+
+def build_diagnosis(inputs: Dict[str, Any], deps: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    income = _number(_get(inputs, "income.amount"))
+    savings = _number(_get(inputs, "assets.savings"))
+    stability = str(_get(inputs, "income.stability") or "")
+    has_debt = _get(inputs, "debt.has_debt")
+    debts = _get(inputs, "debt.details") or []
+    metrics: Dict[str, Any] = {"monthly_income": income, "savings": savings}
+    findings: List[Dict[str, str]] = []
+
+    runway = round(savings / income, 1) if income and savings is not None else None
+    metrics["runway_months"] = runway
+    if runway is None:
+        findings.append({"code": "runway_unknown", "severity": "info", "text": "Income or savings not known yet, so the savings runway cannot be measured."})
+    elif runway < 1:
+        findings.append({"code": "runway_low", "severity": "high", "text": f"Savings cover about {runway} months of income; one bad month could mean new debt."})
+    elif runway < 3:
+        findings.append({"code": "runway_thin", "severity": "medium", "text": f"Savings cover about {runway} months of income, short of a 3-month cushion."})
+    else:
+        findings.append({"code": "runway_ok", "severity": "low", "text": f"Savings cover about {runway} months of income."})
+
+    if stability and stability != "Fixed salary":
+        findings.append({"code": "income_irregular", "severity": "medium", "text": f"Income is not fixed ({stability}), so spending needs a buffer for lean months."})
+
+    metrics["debts"] = len(debts) if isinstance(debts, list) else int(bool(debts))
+    if has_debt is True:
+        findings.append({"code": "debt", "severity": "medium", "text": f"Outstanding loans: {_fmt_value(debts) if debts else 'details not shared yet'}."})
+    elif has_debt is False:
+        findings.append({"code": "debt_free", "severity": "low", "text": "No outstanding loans."})
+
+    high = sum(f["severity"] == "high" for f in findings)
+    medium = sum(f["severity"] == "medium" for f in findings)
+    resilience = "unknown" if runway is None else "fragile" if high or medium >= 2 else "building" if medium else "steady"
+    return {"resilience": resilience, "metrics": metrics, "findings": findings}
+
+
+_SPENDING_LESSONS = {
+    "I budget but sometimes overspend": "Set a weekly spending cap for the categories where you overspend and check it every Sunday.",
+    "I spend first and save what's left": "Move a fixed amount to savings on payday, before spending, instead of saving what is left.",
+    "I often run short before month-end": "Track every expense for one month to find the leaks that leave you short before month-end.",
+}
+_RISK_LESSONS = {
+    "Low": "start a monthly recurring deposit or debt fund; it suits your low risk comfort",
+    "Medium": "split monthly investing between a debt fund and an index-fund SIP",
+    "High": "use a diversified equity SIP, but only after the emergency fund is in place",
+}
+
+
+def build_lesson(inputs: Dict[str, Any], deps: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    diagnosis = deps.get("diagnosis") or {}
+    codes = {f.get("code") for f in diagnosis.get("findings", [])}
+    income = (diagnosis.get("metrics") or {}).get("monthly_income")
+    actions: List[str] = []
+    if codes & {"runway_low", "runway_thin"}:
+        target = f" ({_rupees(income * 3)})" if income else ""
+        actions.append(f"Build an emergency fund of 3 months of income{target} before other goals.")
+    if "debt" in codes:
+        actions.append("List your loans by interest rate, pay the costliest first and avoid new EMIs.")
+    if "income_irregular" in codes:
+        actions.append("Save a fixed share (10-20%) of every payout on the day it arrives.")
+    habit = _SPENDING_LESSONS.get(str(_get(inputs, "psychology.spending_habits") or ""))
+    if habit:
+        actions.append(habit)
+    short_term = _get(inputs, "goals.short_term")
+    if short_term:
+        actions.append(f"Turn \"{short_term}\" into a monthly amount and track it.")
+    long_term = _get(inputs, "goals.long_term")
+    if long_term:
+        how = _RISK_LESSONS.get(str(_get(inputs, "psychology.risk_tolerance") or ""), "start a small monthly SIP and raise it with your income")
+        actions.append(f"For \"{long_term}\", {how}.")
+    if not actions:
+        actions.append("Prioritize emergency savings and reduce high-interest debt.")
+    return {"actions": actions}
+
+
+class Section(NamedTuple):
+    name: str
+    title: str
+    inputs: Tuple[str, ...]  # profile sub-sections read; () means the whole profile
+    depends: Tuple[str, ...]  # earlier sections whose content is passed in
+    build: Callable[[Dict[str, Any], Dict[str, Dict[str, Any]]], Dict[str, Any]]
+
+
+SECTIONS: List[Section] = [
+    Section("mirror", "The Mirror", (), (), build_mirror),
+    Section("diagnosis", "The Diagnosis", ("income", "debt", "assets"), (), build_diagnosis),
+    Section("lesson", "The Lesson", ("goals", "psychology"), ("diagnosis",), build_lesson),
+]
+
+
+# --- Building and rendering ---
+
+def build_report(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Build (or fetch from cache) every section for `profile`."""
+    profile = profile if isinstance(profile, dict) else {}
+    sections: Dict[str, Dict[str, Any]] = {}
+    built = 0
+    for spec in SECTIONS:
+        inputs = {k: profile.get(k) for k in spec.inputs} if spec.inputs else {"profile": profile}
+        key = content_hash([spec.name, REPORT_FORMAT_VERSION, inputs, [sections[d]["hash"] for d in spec.depends]])
+        section = _sections.get(key)
+        if section is None:
+            content = spec.build(inputs, {d: sections[d]["content"] for d in spec.depends})
+            section = {"title": spec.title, "hash": key, "content": content}
+            _sections.put(key, section)
+            built += 1
+        sections[spec.name] = section
+    _count(reports=1, sections_built=built, sections_cached=len(SECTIONS) - built)
+    return {"version": REPORT_FORMAT_VERSION, "hash": content_hash([s["hash"] for s in sections.values()]), "sections": sections}
+
+
+def render_json(report: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON form: {"hash", "sections": {name: {"title", ...content}}}."""
+    return {
+        "hash": report["hash"],
+        "sections": {name: {"title": s["title"], **s["content"]} for name, s in report["sections"].items()},
+    }
+
+
+def _render_mirror(content: Dict[str, Any]) -> List[str]:
+    lines = [f"- {f['label']}: {_fmt_value(f['value'])}" for f in content.get("facts", [])] or ["- Nothing shared yet."]
+    if content.get("unknown"):
+        lines.append("Still unknown: " + ", ".join(content["unknown"]))
+    return lines
+
+
+def _render_diagnosis(content: Dict[str, Any]) -> List[str]:
+    lines = [f"Resilience: {content.get('resilience', 'unknown')}"]
+    lines.extend(f"- [{f['severity']}] {f['text']}" for f in content.get("findings", []))
+    return lines
+
+
+def _render_lesson(content: Dict[str, Any]) -> List[str]:
+    return [f"{i}. {action}" for i, action in enumerate(content.get("actions", []), 1)]
+
+
+_RENDERERS = {"mirror": _render_mirror, "diagnosis": _render_diagnosis, "lesson": _render_lesson}
+
+
+def render_text(report: Dict[str, Any]) -> str:
+    """Compact text form, one block per section."""
+    text = _texts.get(report["hash"])
+    if text is not None:
+        _count(text_renders=1, text_cached=1)
+        return text
+    blocks = []
+    for name, section in report["sections"].items():
+        blocks.append("\n".join([f"{section['title']}:"] + _RENDERERS[name](section["content"])))
+    text = "\n\n".join(blocks)
+    _texts.put(report["hash"], text)
+    _count(text_renders=1)
+    return text
+
+
+def report_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["cached_sections"] = len(_sections)
+    out["cache_size"] = REPORT_CACHE_SIZE
+    return out
@@ -0,0 +1,114 @@
+"""Bounded, write-through in-process session cache.
+
+`/chat` reads sessions through this cache instead of hitting storage on every
+request. Writes go to storage first and then update the cache, so storage stays
+the source of truth; the least recently used sessions are evicted once
+`max_entries` is reached. Nothing is loaded at startup.
+
+With several worker processes each has its own cache, so a cached session may
+be stale. When revalidation is on (SESSION_CACHE_REVALIDATE, default on when
+API_WORKERS > 1), a hit is only served if its `revision` still matches storage;
+that costs one small read instead of a full load.
+
+Callers get their own deep copy of a cached session, and the cache only takes a
+new copy after storage accepted it, so a turn that fails part-way never leaves
+its half-applied changes in the cache.
+"""
+import asyncio
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+
+import storage
+
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", "1024"))
+SESSION_CACHE_REVALIDATE = os.environ.get(
+    "SESSION_CACHE_REVALIDATE", "1" if int(os.environ.get("API_WORKERS", "1")) > 1 else "0"
+) == "1"
+
+
+class SessionCache:
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES, revalidate: bool = SESSION_CACHE_REVALIDATE):
+        self.max_entries = max_entries
+        self.revalidate = revalidate
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "stale": 0}
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """Return the session, loading it from storage on a miss ({} if it does not exist)."""
+        session = self._lookup(session_id)
+        if session is not None and self._fresh(session_id, session):
+            return copy.deepcopy(session)
+        return self._load(session_id)
+
+    def _fresh(self, session_id: str, session: Dict[str, Any]) -> bool:
+        if not self.revalidate or storage.load_revision(session_id) == session.get(storage.REVISION_KEY, 0):
+            return True
+        with self._lock:
+            self._stats["stale"] += 1
+        return False
+
+    def _lookup(self, session_id: str):
+        with self._lock:
+            session = self._entries.get(session_id)
+            if session is not None:
+                self._entries.move_to_end(session_id)
+                self._stats["hits"] += 1
+            return session
+
+    def _load(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            self._stats["misses"] += 1
+        session = storage.load_session(session_id)
+        if session:
+            self._remember(session_id, copy.deepcopy(session))
+        return session
+
+    def put(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Persist the session, then cache a copy of it; any failure drops the cached copy."""
+        try:
+            storage.save_session(session_id, session)
+        except BaseException:
+            self.invalidate(session_id)
+            raise
+        self._remember(session_id, copy.deepcopy(session))
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def _remember(self, session_id: str, session: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[session_id] = session
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    async def aget(self, session_id: str) -> Dict[str, Any]:
+        # Hits are served on the event loop; misses and revalidation go to a worker thread
+        session = self._lookup(session_id)
+        if session is not None and (not self.revalidate or await asyncio.to_thread(self._fresh, session_id, session)):
+            return copy.deepcopy(session)
+        return await asyncio.to_thread(self._load, session_id)
+
+    async def areload(self, session_id: str) -> Dict[str, Any]:
+        """Drop any cached copy and load the session from storage."""
+        self.invalidate(session_id)
+        return await asyncio.to_thread(self._load, session_id)
+
+    async def aput(self, session_id: str, session: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.put, session_id, session)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["entries"] = len(self._entries)
+            out["max_entries"] = self.max_entries
+            out["revalidate"] = self.revalidate
+        total = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / total, 4) if total else 0.0
+        return out
@@ -0,0 +1,126 @@
+"""Per-session mutual exclusion that holds across worker processes.
+
+`/chat` turns on the same session are serialized with two layers:
+- an `asyncio.Lock` per session id, so coroutines in one worker queue up
+  without polling;
+- an exclusive `fcntl.flock` on a lock file under DATA_DIR/locks, so workers
+  (processes) exclude each other. Session ids are hashed onto
+  SESSION_LOCK_STRIPES files to keep the number of lock files bounded; two
+  sessions sharing a stripe only contend when they run at the same time.
+
+The file lock is polled with LOCK_NB and `asyncio.sleep`, so waiting never ties
+up a thread. A turn that cannot get its lock within SESSION_LOCK_TIMEOUT_S gets
+`LockTimeout`. Where `fcntl` is unavailable (Windows) only the in-process layer
+applies, which is correct for a single worker.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from storage import fcntl, lock_path
+
+SESSION_LOCK_TIMEOUT_S = float(os.environ.get("SESSION_LOCK_TIMEOUT_S", "60"))
+
+
+class LockTimeout(Exception):
+    """Raised when a session lock is not acquired within its timeout."""
+
+
+class SessionLocks:
+    def __init__(self, timeout: float = SESSION_LOCK_TIMEOUT_S):
+        self.timeout = timeout
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+        self._guard = threading.Lock()
+        self._stats = {"acquired": 0, "contended": 0, "timeouts": 0, "wait_s_total": 0.0, "wait_s_max": 0.0}
+
+    def _checkout(self, session_id: str) -> asyncio.Lock:
+        with self._guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = asyncio.Lock()
+            self._users[session_id] = self._users.get(session_id, 0) + 1
+            return lock
+
+    def _checkin(self, session_id: str) -> None:
+        # Drop the per-session lock once nobody holds or waits on it
+        with self._guard:
+            self._users[session_id] -= 1
+            if not self._users[session_id]:
+                del self._users[session_id]
+                del self._locks[session_id]
+
+    async def _acquire_file(self, session_id: str, deadline: float) -> Tuple[Optional[int], bool]:
+        """Return (fd, waited) once the cross-process lock file is held."""
+        if fcntl is None:
+            return None, False
+        fd = os.open(lock_path("session", session_id), os.O_RDWR | os.O_CREAT, 0o644)
+        delay = 0.005
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd, waited
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise LockTimeout(session_id)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+
+    @asynccontextmanager
+    async def hold(self, session_id: str) -> AsyncIterator[None]:
+        """Hold the session exclusively, across coroutines and worker processes."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        lock = self._checkout(session_id)
+        fd = None
+        try:
+            contended = lock.locked()
+            try:
+                await asyncio.wait_for(lock.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self._record(timeout=True)
+                raise LockTimeout(session_id)
+            try:
+                fd, file_waited = await self._acquire_file(session_id, deadline)
+            except BaseException as e:
+                lock.release()
+                if isinstance(e, LockTimeout):
+                    self._record(timeout=True)
+                raise
+            self._record(waited=time.monotonic() - start, contended=contended or file_waited)
+            try:
+                yield
+            finally:
+                if fd is not None:
+                    os.close(fd)
+                lock.release()
+        finally:
+            self._checkin(session_id)
+
+    def _record(self, waited: float = 0.0, contended: bool = False, timeout: bool = False) -> None:
+        with self._guard:
+            if timeout:
+                self._stats["timeouts"] += 1
+                return
+            self._stats["acquired"] += 1
+            self._stats["contended"] += int(contended)
+            self._stats["wait_s_total"] += waited
+            self._stats["wait_s_max"] = max(self._stats["wait_s_max"], waited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._guard:
+            out: Dict[str, Any] = dict(self._stats)
+            out["held_or_waiting"] = sum(self._users.values())
+        out["cross_process"] = fcntl is not None
+        out["avg_wait_ms"] = round(out.pop("wait_s_total") / out["acquired"] * 1000, 3) if out["acquired"] else 0.0
+        out["wait_s_max"] = round(out["wait_s_max"], 4)
+        return out
+
+
+session_locks = SessionLocks()
@@ -0,0 +1,92 @@
+"""Single-flight deduplication of identical in-flight calls.
+
+While a call for a key is running, further calls for the same key wait for it
+and share its result instead of starting their own. Once the call finishes the
+key is released, so later calls run normally (pair with a cache to reuse
+finished results).
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls across threads (sync) and within an event loop (async)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], "asyncio.Future"] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn` once per concurrent `key`; returns (result, shared) where shared is True for waiters."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Async counterpart of `do`; calls are coalesced per event loop.
+
+        The shared call runs as its own task, so cancelling any caller (the one
+        that started it included) does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        loop_key = (id(loop), key)
+        with self._lock:
+            task = self._async_calls.get(loop_key)
+            leader = task is None
+            if leader:
+                task = self._async_calls[loop_key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda t: self._release(loop_key, t))
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        return await asyncio.shield(task), not leader
+
+    def _release(self, loop_key: Tuple[int, str], task: "asyncio.Future") -> None:
+        with self._lock:
+            if self._async_calls.get(loop_key) is task:
+                del self._async_calls[loop_key]
+        if not task.cancelled():
+            # Mark the exception retrieved so a call nobody waited on does not log a warning
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["in_flight"] = len(self._calls) + len(self._async_calls)
+        total = out["leaders"] + out["coalesced"]
+        out["coalesce_rate"] = round(out["coalesced"] / total, 4) if total else 0.0
+        return out
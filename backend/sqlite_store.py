@@ -0,0 +1,288 @@
+"""SQLite storage backend (enable with STORAGE_BACKEND=sqlite).
+
+Sessions, messages and reports live in indexed tables of a WAL-mode database:
+- `sessions`: one row per session with the `user_profile` JSON and any other
+  top-level session keys;
+- `messages`: one row per message, keyed by (session_id, seq);
+- `reports`: latest report per session;
+- `profile_patches`: the last PROFILE_PATCH_HISTORY profile patches per session,
+  keyed by (session_id, version), for delta responses.
+
+Saving a session upserts the small session row and inserts only the messages
+that are not stored yet (the `messages` table is an append-only log), so
+per-turn write cost stays flat as a conversation grows. Pending profile patches
+are applied in place with SQLite's `json_set`, so only the changed profile paths
+are written; the whole profile is rewritten only when the stored version does
+not line up with the patches (e.g. legacy rows).
+
+Import an existing JSON data directory with:
+    python sqlite_store.py import [--db PATH] [--sessions DIR] [--reports DIR]
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from profile_patch import PENDING_KEY, PROFILE_PATCH_HISTORY, folded_changes, mark_persisted, pending_patches, profile_version
+from storage import REPORTS_DIR, REVISION_KEY, SESSIONS_DIR, SQLITE_PATH, JsonFileBackend, StorageBackend, VersionConflict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id   TEXT PRIMARY KEY,
+    user_profile TEXT NOT NULL DEFAULT '{}',
+    extra        TEXT NOT NULL DEFAULT '{}',
+    updated_at   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    message    TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS reports (
+    session_id TEXT PRIMARY KEY,
+    report     TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profile_patches (
+    session_id TEXT NOT NULL,
+    version    INTEGER NOT NULL,
+    changes    TEXT NOT NULL,
+    PRIMARY KEY (session_id, version)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at);
+"""
+
+# json_set paths per UPDATE statement, well under SQLite's function argument limit
+_JSON_SET_BATCH = 40
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json_path(path: List[Any]) -> Optional[str]:
+    """SQLite JSON path for a list of object keys, or None if a key cannot be quoted."""
+    if not path or any(not isinstance(k, str) or '"' in k or "\\" in k for k in path):
+        return None
+    return "$" + "".join(f'."{k}"' for k in path)
+
+
+class SqliteBackend(StorageBackend):
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _split(session: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Any], Dict[str, Any]]:
+        extra = {k: v for k, v in session.items() if k not in ("user_profile", "messages", PENDING_KEY)}
+        return session.get("user_profile", {}) or {}, session.get("messages", []) or [], extra
+
+    def save_session(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Upsert the session row, apply pending profile patches and append messages not yet stored.
+
+        Raises VersionConflict if the stored revision moved since the session was loaded.
+
+        Messages are treated as append-only: stored messages are never rewritten,
+        and a shorter list than what is stored truncates the tail.
+        """
+        profile, messages, extra = self._split(session)
+        revision = session.get(REVISION_KEY, 0)
+        extra[REVISION_KEY] = revision + 1
+        conn = self._conn()
+        with conn:
+            # Take the write lock up front so the revision check and the writes are one atomic step
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT COALESCE(json_extract(extra, '$.profile_version'), 0), COALESCE(json_extract(extra, '$.revision'), 0) "
+                "FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            # A session that is not stored yet counts as revision 0
+            if (row[1] if row is not None else 0) != revision:
+                raise VersionConflict(session_id)
+            if row is None or not self._save_profile_delta(conn, session_id, session, row[0], extra):
+                conn.execute(
+                    "INSERT INTO sessions (session_id, user_profile, extra, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET user_profile = excluded.user_profile, "
+                    "extra = excluded.extra, updated_at = excluded.updated_at",
+                    (session_id, _dumps(profile), _dumps(extra), time.time()),
+                )
+                # Patch history restarts at the version just written in full
+                conn.execute("DELETE FROM profile_patches WHERE session_id = ?", (session_id,))
+            row = conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+            stored = row[0]
+            if len(messages) > stored:
+                conn.executemany(
+                    "INSERT INTO messages (session_id, seq, message) VALUES (?, ?, ?)",
+                    [(session_id, seq, _dumps(m)) for seq, m in enumerate(messages[stored:], start=stored)],
+                )
+            elif len(messages) < stored:
+                conn.execute("DELETE FROM messages WHERE session_id = ? AND seq >= ?", (session_id, len(messages)))
+        session[REVISION_KEY] = revision + 1
+        mark_persisted(session)
+
+    def _save_profile_delta(self, conn: sqlite3.Connection, session_id: str, session: Dict[str, Any], stored_version: int, extra: Dict[str, Any]) -> bool:
+        """Write only the changed profile paths; returns False when a full profile write is needed."""
+        version = profile_version(session)
+        pending = pending_patches(session)
+        if pending:
+            if pending[0]["version"] != stored_version + 1 or pending[-1]["version"] != version:
+                return False
+        elif stored_version != version:
+            return False
+        # json_set drops a path that points inside an object set earlier in the same
+        # call, so overlapping changes are folded into non-overlapping ones first
+        args: List[Any] = []
+        for path, value in folded_changes(pending):
+            json_path = _json_path(path)
+            if json_path is None:
+                return False
+            args.append((json_path, _dumps(value)))
+
+        now = time.time()
+        conn.execute("UPDATE sessions SET extra = ?, updated_at = ? WHERE session_id = ?", (_dumps(extra), now, session_id))
+        for i in range(0, len(args), _JSON_SET_BATCH):
+            batch = args[i:i + _JSON_SET_BATCH]
+            conn.execute(
+                "UPDATE sessions SET user_profile = json_set(user_profile, " + ", ".join(["?, json(?)"] * len(batch)) + ") WHERE session_id = ?",
+                [x for pair in batch for x in pair] + [session_id],
+            )
+        if pending:
+            conn.executemany(
+                "INSERT OR REPLACE INTO profile_patches (session_id, version, changes) VALUES (?, ?, ?)",
+                [(session_id, p["version"], _dumps(p["changes"])) for p in pending],
+            )
+            conn.execute(
+                "DELETE FROM profile_patches WHERE session_id = ? AND version <= ?", (session_id, version - PROFILE_PATCH_HISTORY)
+            )
+        return True
+
+    def load_session(self, session_id: str) -> Dict[str, Any]:
+        conn = self._conn()
+        row = conn.execute("SELECT user_profile, extra FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return {}
+        session: Dict[str, Any] = json.loads(row[1])
+        session["user_profile"] = json.loads(row[0])
+        session["messages"] = [
+            json.loads(m) for (m,) in conn.execute("SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (session_id,))
+        ]
+        return session
+
+    def update_profile_section(self, session_id: str, section: str, value: Any) -> None:
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                "UPDATE sessions SET user_profile = json_set(user_profile, ?, json(?)), "
+                "extra = json_set(extra, '$.profile_version', COALESCE(json_extract(extra, '$.profile_version'), 0) + 1, "
+                "'$.revision', COALESCE(json_extract(extra, '$.revision'), 0) + 1), "
+                "updated_at = ? WHERE session_id = ?",
+                ("$." + json.dumps(section), _dumps(value), time.time(), session_id),
+            )
+            if cur.rowcount == 0:
+                raise KeyError(session_id)
+            (version,) = conn.execute(
+                "SELECT json_extract(extra, '$.profile_version') FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO profile_patches (session_id, version, changes) VALUES (?, ?, ?)",
+                (session_id, version, _dumps([[[section], value]])),
+            )
+
+    def load_revision(self, session_id: str) -> Optional[int]:
+        row = self._conn().execute(
+            "SELECT COALESCE(json_extract(extra, '$.revision'), 0) FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load_profile_patches(self, session_id: str, since: int) -> Optional[List[Dict[str, Any]]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT COALESCE(json_extract(extra, '$.profile_version'), 0) FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or since > row[0]:
+            return None
+        patches = [
+            {"version": v, "changes": json.loads(c)}
+            for v, c in conn.execute(
+                "SELECT version, changes FROM profile_patches WHERE session_id = ? AND version > ? ORDER BY version", (session_id, since)
+            )
+        ]
+        # Every version after `since` must still be stored, otherwise the delta would be incomplete
+        return patches if len(patches) == row[0] - since else None
+
+    def save_report(self, session_id: str, report: Dict[str, Any]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO reports (session_id, report, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET report = excluded.report, updated_at = excluded.updated_at",
+                (session_id, _dumps(report), time.time()),
+            )
+
+    def load_report(self, session_id: str) -> Dict[str, Any]:
+        row = self._conn().execute("SELECT report FROM reports WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def list_session_ids(self) -> List[str]:
+        return [sid for (sid,) in self._conn().execute("SELECT session_id FROM sessions")]
+
+    def compact(self) -> None:
+        """Fold the WAL back into the main database file and reclaim free pages."""
+        conn = self._conn()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+
+
+def import_json_dir(backend: SqliteBackend, sessions_dir: str = SESSIONS_DIR, reports_dir: str = REPORTS_DIR) -> Dict[str, int]:
+    """Copy every session (with its message log) and report of a JSON data directory into `backend`."""
+    source = JsonFileBackend(sessions_dir, reports_dir)
+    counts = {"sessions": 0, "reports": 0, "failed": 0}
+    for sid in source.list_session_ids():
+        try:
+            session = source.load_session(sid)
+            # Revisions restart in the new store
+            session.pop(REVISION_KEY, None)
+            backend.save_session(sid, session)
+            report = source.load_report(sid)
+            if report:
+                backend.save_report(sid, report)
+                counts["reports"] += 1
+            counts["sessions"] += 1
+        except Exception:
+            counts["failed"] += 1
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SQLite session store utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import a JSON sessions/reports directory")
+    imp.add_argument("--db", default=SQLITE_PATH)
+    imp.add_argument("--sessions", default=SESSIONS_DIR)
+    imp.add_argument("--reports", default=REPORTS_DIR)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        counts = import_json_dir(SqliteBackend(args.db), args.sessions, args.reports)
+        print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,440 @@
+"""Session and report persistence.
+
+The module-level functions (`save_session`, `load_session`, ...) are the public
+API and delegate to a pluggable backend chosen with the `STORAGE_BACKEND` env
+var:
+- `json` (default): per session, a small JSON snapshot of the mutable keys, an
+  append-only JSONL message log and a JSONL profile patch log; one JSON file per
+  report.
+- `sqlite`: indexed tables in a WAL-mode SQLite database (see `sqlite_store`).
+
+Both backends persist message history append-only and write only the profile
+paths changed since the last save (the pending `profile_patch` patches), so the
+cost of saving a turn does not grow with the conversation or the profile. The
+last PROFILE_PATCH_HISTORY patches stay readable through `load_profile_patches`
+for delta responses.
+
+Every save is an optimistic compare-and-set on the session's `revision`: if
+another writer (e.g. a second worker process) saved the session after it was
+loaded, `save_session` raises `VersionConflict` instead of overwriting it. A
+session that is not stored yet can only be created from revision 0, so of two
+writers creating the same session only the first succeeds. The read-check-write
+runs under `write_lock` (json) or `BEGIN IMMEDIATE` (sqlite), so the check
+holds across processes.
+"""
+import asyncio
 import json
 import os
-from typing import Dict, Any
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+try:
+    import fcntl
+except ImportError:  # Windows: locks are process-local only
+    fcntl = None
+
+from profile_patch import (
+    PENDING_KEY,
+    PROFILE_PATCH_HISTORY,
+    VERSION_KEY,
+    apply_patch,
+    mark_persisted,
+    pending_patches,
+    profile_version,
+)
+
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(os.path.dirname(__file__), "data")
 SESSIONS_DIR = os.path.join(DATA_DIR, "sessions")
 REPORTS_DIR = os.path.join(DATA_DIR, "reports")
+LOCKS_DIR = os.path.join(DATA_DIR, "locks")
 
-for d in (DATA_DIR, SESSIONS_DIR, REPORTS_DIR):
+for d in (DATA_DIR, SESSIONS_DIR, REPORTS_DIR, LOCKS_DIR):
     os.makedirs(d, exist_ok=True)
 
+# Session ids hash onto a bounded set of lock files
+SESSION_LOCK_STRIPES = int(os.environ.get("SESSION_LOCK_STRIPES", "1024"))
+
+# Bumped on every save; a save is rejected if the stored revision moved since load
+REVISION_KEY = "revision"
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json").lower()
+SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(DATA_DIR, "arthsaathi.db"))
+
 
 def session_path(session_id: str) -> str:
     return os.path.join(SESSIONS_DIR, f"{session_id}.json")
 
 
+def message_log_path(session_id: str) -> str:
+    return os.path.join(SESSIONS_DIR, f"{session_id}.messages.jsonl")
+
+
 def report_path(session_id: str) -> str:
     return os.path.join(REPORTS_DIR, f"{session_id}.json")
 
 
+def _stripe(session_id: str) -> int:
+    return zlib.crc32(session_id.encode("utf-8")) % SESSION_LOCK_STRIPES
+
+
+def lock_path(kind: str, session_id: str) -> str:
+    return os.path.join(LOCKS_DIR, f"{kind}-{_stripe(session_id)}.lock")
+
+
+# Without fcntl, write_lock falls back to these (threads of one process only)
+_local_write_locks = [threading.Lock() for _ in range(SESSION_LOCK_STRIPES)] if fcntl is None else []
+
+
+@contextmanager
+def write_lock(session_id: str) -> Iterator[None]:
+    """Blocking cross-process lock around one read-check-write of a session's files."""
+    if fcntl is None:
+        with _local_write_locks[_stripe(session_id)]:
+            yield
+        return
+    fd = os.open(lock_path("write", session_id), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor releases the lock
+
+
+class VersionConflict(Exception):
+    """The stored session changed since it was loaded (optimistic revision check failed)."""
+
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    # Write to a temp file and rename so readers never see a half-written file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class StorageBackend(ABC):
+    """Interface implemented by every storage backend."""
+
+    @abstractmethod
+    def save_session(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Persist the session and bump `session["revision"]`; raises VersionConflict if it changed since load."""
+
+    @abstractmethod
+    def load_session(self, session_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def load_revision(self, session_id: str) -> Optional[int]:
+        """Stored revision of a session (None if it does not exist), without loading it."""
+
+    @abstractmethod
+    def update_profile_section(self, session_id: str, section: str, value: Any) -> None:
+        """Replace one top-level `user_profile` section without rewriting the session."""
+
+    def load_profile_patches(self, session_id: str, since: int) -> Optional[List[Dict[str, Any]]]:
+        """Return the profile patches after version `since`, oldest first, or None if no longer available."""
+        return None
+
+    @abstractmethod
+    def save_report(self, session_id: str, report: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def load_report(self, session_id: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def list_session_ids(self) -> List[str]:
+        ...
+
+    def compact_session(self, session_id: str) -> None:
+        """Rewrite a session's storage into its canonical compact form (no-op by default)."""
+
+    def compact(self) -> None:
+        for sid in self.list_session_ids():
+            self.compact_session(sid)
+
+
+class JsonFileBackend(StorageBackend):
+    """Per session: a pretty-printed snapshot file plus append-only message and profile logs.
+
+    The snapshot holds everything except `messages` and `user_profile`, plus a
+    `_log` marker with the number of committed messages and the committed byte
+    length of the message log. A save truncates the log back to that length
+    (dropping anything left by an interrupted write), appends only the new
+    messages, then atomically replaces the snapshot.
+
+    The profile log works the same way (`_profile` marker): its first line is a
+    base `{"version", "base"}` record, every other line a patch. A save appends
+    the pending patches. When the log would exceed PROFILE_PATCH_HISTORY patches
+    the older half is folded into the base; when the pending patches do not
+    continue the stored version the log restarts from the in-memory profile. Legacy files with embedded `messages` or
+    `user_profile` are still readable and are migrated on their next save or
+    compaction.
+    """
+
+    def __init__(self, sessions_dir: str = SESSIONS_DIR, reports_dir: str = REPORTS_DIR):
+        self.sessions_dir = sessions_dir
+        self.reports_dir = reports_dir
+
+    def _session_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.json")
+
+    def _log_path(self, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.messages.jsonl")
+
+    def _profile_log_path(self, session_id: str, generation: int) -> str:
+        return os.path.join(self.sessions_dir, f"{session_id}.profile.{generation}.jsonl")
+
+    def _report_path(self, session_id: str) -> str:
+        return os.path.join(self.reports_dir, f"{session_id}.json")
+
+    def _read_snapshot(self, session_id: str) -> Dict[str, Any]:
+        p = self._session_path(session_id)
+        if not os.path.exists(p):
+            return {}
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _read_lines(path: str, count: int, offset: int) -> List[Any]:
+        if not count:
+            return []
+        with open(path, "rb") as f:
+            data = f.read(offset)
+        return [json.loads(line) for line in data.splitlines()[:count]]
+
+    @staticmethod
+    def _append_lines(path: str, records: List[Any], offset: int) -> int:
+        """Write records after the committed `offset`; returns the new committed length."""
+        mode = "r+b" if os.path.exists(path) else "wb"
+        with open(path, mode) as f:
+            f.truncate(offset)
+            f.seek(offset)
+            for r in records:
+                f.write((json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+            return f.tell()
+
+    def _read_log(self, session_id: str, count: int, offset: int) -> List[Any]:
+        return self._read_lines(self._log_path(session_id), count, offset)
+
+    def _write_log(self, session_id: str, messages: List[Any], start: int, offset: int) -> int:
+        """Append messages[start:] after the committed `offset`; returns the new committed length."""
+        return self._append_lines(self._log_path(session_id), messages[start:], offset)
+
+    def _read_profile_log(self, session_id: str, meta: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return self._read_lines(self._profile_log_path(session_id, meta.get("gen", 0)), meta.get("count", 0), meta.get("offset", 0))
+
+    def _write_profile(self, session_id: str, session: Dict[str, Any], meta: Optional[Dict[str, Any]], rewrite: bool = False) -> Dict[str, Any]:
+        """Persist the session's pending profile patches; returns the new `_profile` marker.
+
+        With `rewrite`, the log always restarts from the in-memory profile.
+        """
+        version = profile_version(session)
+        pending = pending_patches(session)
+        if meta and not rewrite and not pending and meta.get("version") == version:
+            return meta
+        continues = bool(
+            meta and not rewrite and pending and pending[0]["version"] == meta.get("version", 0) + 1 and pending[-1]["version"] == version
+        )
+        if continues and meta.get("count", 0) + len(pending) <= PROFILE_PATCH_HISTORY:
+            offset = self._append_lines(self._profile_log_path(session_id, meta.get("gen", 0)), pending, meta.get("offset", 0))
+            return {**meta, "version": version, "count": meta.get("count", 0) + len(pending), "offset": offset}
+        if continues:
+            # Log is full: fold the older patches into the base, keeping the newest half for deltas
+            records = self._read_profile_log(session_id, meta)
+            base = records[0].get("base", {})
+            patches = records[1:] + pending
+            keep = patches[len(patches) - PROFILE_PATCH_HISTORY // 2:] if PROFILE_PATCH_HISTORY >= 2 else []
+            for patch in patches[:len(patches) - len(keep)]:
+                apply_patch(base, patch)
+            base_version = keep[0]["version"] - 1 if keep else version
+            lines = [{"version": base_version, "base": base}] + keep
+        else:
+            # Fresh base record from the in-memory profile
+            lines = [{"version": version, "base": session.get("user_profile", {}) or {}}]
+        # A rewrite goes to a new generation file so the current snapshot stays readable until replaced
+        generation = meta.get("gen", 0) + 1 if meta else 0
+        offset = self._append_lines(self._profile_log_path(session_id, generation), lines, 0)
+        return {"version": version, "gen": generation, "count": len(lines), "offset": offset}
+
+    def _drop_profile_log(self, session_id: str, old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> None:
+        if old and old.get("gen", 0) != new.get("gen", 0):
+            try:
+                os.remove(self._profile_log_path(session_id, old.get("gen", 0)))
+            except OSError:
+                pass
+
+    def _write_snapshot(self, session_id: str, session: Dict[str, Any], revision: int, log: Dict[str, Any], profile: Dict[str, Any]) -> None:
+        snapshot = {k: v for k, v in session.items() if k not in ("messages", "user_profile", PENDING_KEY)}
+        snapshot[REVISION_KEY] = revision
+        snapshot["_log"] = log
+        snapshot["_profile"] = profile
+        _write_json_atomic(self._session_path(session_id), snapshot)
+
+    def save_session(self, session_id: str, session: Dict[str, Any]) -> None:
+        messages = session.get("messages", []) or []
+        with write_lock(session_id):
+            previous = self._read_snapshot(session_id)
+            revision = session.get(REVISION_KEY, 0)
+            # A session that is not stored yet counts as revision 0
+            if previous.get(REVISION_KEY, 0) != revision:
+                raise VersionConflict(session_id)
+            log = previous.get("_log") or {}
+            count, offset = log.get("count", 0), log.get("offset", 0)
+            if len(messages) < count:
+                # History was shortened; start the log over
+                count, offset = 0, 0
+            offset = self._write_log(session_id, messages, count, offset)
+            profile = self._write_profile(session_id, session, previous.get("_profile"))
+            self._write_snapshot(session_id, session, revision + 1, {"count": len(messages), "offset": offset}, profile)
+            self._drop_profile_log(session_id, previous.get("_profile"), profile)
+        session[REVISION_KEY] = revision + 1
+        mark_persisted(session)
+
+    def load_session(self, session_id: str) -> Dict[str, Any]:
+        session = self._read_snapshot(session_id)
+        if not session:
+            return {}
+        log = session.pop("_log", None)
+        if log is not None:
+            session["messages"] = self._read_log(session_id, log.get("count", 0), log.get("offset", 0))
+        meta = session.pop("_profile", None)
+        if meta is not None:
+            profile: Dict[str, Any] = {}
+            for record in self._read_profile_log(session_id, meta):
+                if "base" in record:
+                    profile = record["base"]
+                else:
+                    apply_patch(profile, record)
+            session["user_profile"] = profile
+            session[VERSION_KEY] = meta.get("version", 0)
+        return session
+
+    def load_revision(self, session_id: str) -> Optional[int]:
+        snapshot = self._read_snapshot(session_id)
+        return snapshot.get(REVISION_KEY, 0) if snapshot else None
+
+    def load_profile_patches(self, session_id: str, since: int) -> Optional[List[Dict[str, Any]]]:
+        meta = self._read_snapshot(session_id).get("_profile")
+        if not meta or since > meta.get("version", 0):
+            return None
+        records = self._read_profile_log(session_id, meta)
+        if not records or since < records[0].get("version", 0):
+            return None
+        return [r for r in records[1:] if r["version"] > since]
+
+    def compact_session(self, session_id: str) -> None:
+        """Drop uncommitted log bytes, fold the profile log and migrate legacy embedded data."""
+        with write_lock(session_id):
+            previous = self._read_snapshot(session_id).get("_profile")
+            session = self.load_session(session_id)
+            if session:
+                messages = session.get("messages", []) or []
+                offset = self._write_log(session_id, messages, 0, 0)
+                profile = self._write_profile(session_id, session, previous, rewrite=True)
+                self._write_snapshot(session_id, session, session.get(REVISION_KEY, 0), {"count": len(messages), "offset": offset}, profile)
+                self._drop_profile_log(session_id, previous, profile)
+
+    def update_profile_section(self, session_id: str, section: str, value: Any) -> None:
+        # Appends one patch to the profile log; only the small snapshot is rewritten
+        session = self.load_session(session_id)
+        if not session:
+            raise KeyError(session_id)
+        version = profile_version(session) + 1
+        session.setdefault("user_profile", {})[section] = value
+        session[VERSION_KEY] = version
+        session[PENDING_KEY] = [{"version": version, "changes": [[[section], value]]}]
+        self.save_session(session_id, session)
+
+    def save_report(self, session_id: str, report: Dict[str, Any]) -> None:
+        _write_json_atomic(self._report_path(session_id), report)
+
+    def load_report(self, session_id: str) -> Dict[str, Any]:
+        p = self._report_path(session_id)
+        if not os.path.exists(p):
+            return {}
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_session_ids(self) -> List[str]:
+        """Return list of session ids (filenames without .json) present in sessions dir."""
+        ids = []
+        try:
+            for fn in os.listdir(self.sessions_dir):
+                if fn.endswith('.json'):
+                    ids.append(fn[:-5])
+        except Exception:
+            pass
+        return ids
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    """Return the configured storage backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STORAGE_BACKEND == "sqlite":
+                    from sqlite_store import SqliteBackend
+
+                    _backend = SqliteBackend(SQLITE_PATH)
+                elif STORAGE_BACKEND == "json":
+                    _backend = JsonFileBackend()
+                else:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _backend
+
+
+def set_backend(backend: StorageBackend) -> None:
+    """Replace the active backend (e.g. to point the API at an explicitly built store)."""
+    global _backend
+    _backend = backend
+
+
 def save_session(session_id: str, session: Dict[str, Any]) -> None:
-    p = session_path(session_id)
-    with open(p, "w", encoding="utf-8") as f:
-        json.dump(session, f, ensure_ascii=False, indent=2)
+    get_backend().save_session(session_id, session)
 
 
 def load_session(session_id: str) -> Dict[str, Any]:
-    p = session_path(session_id)
-    if not os.path.exists(p):
-        return {}
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_backend().load_session(session_id)
+
+
+def update_profile_section(session_id: str, section: str, value: Any) -> None:
+    get_backend().update_profile_section(session_id, section, value)
+
+
+def load_profile_patches(session_id: str, since: int) -> Optional[List[Dict[str, Any]]]:
+    return get_backend().load_profile_patches(session_id, since)
+
+
+def load_revision(session_id: str) -> Optional[int]:
+    return get_backend().load_revision(session_id)
 
 
 def save_report(session_id: str, report: Dict[str, Any]) -> None:
-    p = report_path(session_id)
-    with open(p, "w", encoding="utf-8") as f:
-        json.dump(report, f, ensure_ascii=False, indent=2)
+    get_backend().save_report(session_id, report)
 
 
 def load_report(session_id: str) -> Dict[str, Any]:
-    p = report_path(session_id)
-    if not os.path.exists(p):
-        return {}
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_backend().load_report(session_id)
+
+
+def compact_sessions() -> None:
+    """Compact every stored session (safe to run while the API is stopped)."""
+    get_backend().compact()
 
 
 def list_session_ids() -> list:
-    """Return list of session ids (filenames without .json) present in sessions dir."""
-    ids = []
-    try:
-        for fn in os.listdir(SESSIONS_DIR):
-            if fn.endswith('.json'):
-                ids.append(fn[:-5])
-    except Exception:
-        pass
-    return ids
+    """Return the ids of all stored sessions."""
+    return get_backend().list_session_ids()
 
 
 def load_all_sessions() -> Dict[str, Dict[str, Any]]:
@@ -67,3 +446,30 @@ def load_all_sessions() -> Dict[str, Dict[str, Any]]:
         except Exception:
             out[sid] = {}
     return out
+
+
+# Async wrappers: file I/O runs in a worker thread so the event loop is never blocked.
+
+async def aload_session(session_id: str) -> Dict[str, Any]:
+    return await asyncio.to_thread(load_session, session_id)
+
+
+async def asave_session(session_id: str, session: Dict[str, Any]) -> None:
+    await asyncio.to_thread(save_session, session_id, session)
+
+
+async def aload_profile_patches(session_id: str, since: int) -> Optional[List[Dict[str, Any]]]:
+    return await asyncio.to_thread(load_profile_patches, session_id, since)
+
+
+async def asave_report(session_id: str, report: Dict[str, Any]) -> None:
+    await asyncio.to_thread(save_report, session_id, report)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["compact"]:
+        compact_sessions()
+    else:
+        print("usage: python storage.py compact")
@@ -1,11 +1,25 @@
-import json
-from typing import Any
+import logging
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.errors import GraphInterrupt
 from langgraph.graph import StateGraph, END
 from typing_extensions import TypedDict
+from llm_client import chat
+from structured_output import BEHAVIORAL_INSIGHTS, CHOICE_ANALYSIS, parse
+from tracing import span, traced
+from checkpoint_store import SqliteCheckpointSaver, default_saver
+from jobs import RetryableJobError
+from projection_engine import DEFAULT_HORIZON, MAX_PATHS, outlook, project_choices, simulate, volatility_model
+
+logger = logging.getLogger("strategist_agent")
+
+STRATEGIST_MODEL = "openai/gpt-oss-120b"
 
 class DecisionAnalysisState(TypedDict):
     """State for decision analysis workflow"""
@@ -16,60 +30,137 @@ class DecisionAnalysisState(TypedDict):
     selected_choice_id: str
     selected_choice: dict
     all_choices: list
+    simulation_paths: int
     financial_state_before: dict
+    projections: dict
     analysis_report: dict
     second_order_effects: dict
     behavioral_insights: dict
     simulation_update: dict
     timestamp: str
 
+class AnalysisStopped(Exception):
+    """Raised when an analysis is stopped through its `should_stop` callback"""
+
+
+# Run ids currently executing in this process
+_active_runs = set()
+_active_lock = threading.Lock()
+
+# A failed node's exception per run id, re-raised once the workflow step ends (see `_defer_failure`)
+_node_errors: Dict[str, BaseException] = {}
+_node_errors_lock = threading.Lock()
+
+
+def _defer_failure(node: Callable[[dict], dict]) -> Callable[[dict, RunnableConfig], dict]:
+    """Wrap a workflow node so that its failure ends the run only after the step's other nodes finish.
+
+    LangGraph stops a step at the first exception and shuts its executor down while
+    parallel branches are still running, dropping their checkpoint writes ("cannot
+    schedule new futures after shutdown"). Instead the node records its exception
+    and interrupts the run: the other branches finish and are checkpointed, the
+    failed node stays pending for a resume, and `_run_workflow` re-raises.
+    """
+    def run(state: dict, config: RunnableConfig) -> dict:
+        try:
+            return node(state)
+        except Exception as e:
+            with _node_errors_lock:
+                _node_errors.setdefault(config["configurable"]["thread_id"], e)
+            raise GraphInterrupt() from e
+
+    return run
+
+
 class StrategistAgent:
-    def __init__(self, groq_api_key: str = None):
-        """Initialize Strategist Agent with Groq LLM"""
-        self.llm = ChatGroq(
-            model="openai/gpt-oss-120b",
-            temperature=0.7,
-            groq_api_key=''
-        )
+    def __init__(self, groq_api_key: str = None, checkpointer: Optional[SqliteCheckpointSaver] = None):
+        """Initialize Strategist Agent with the shared Groq LLM client
+        
+        Workflow runs are checkpointed with `checkpointer` (default: the shared
+        SQLite saver unless STRATEGIST_CHECKPOINTS=0), so a failed run can be
+        resumed from its last completed node by passing back its run id.
+        """
+        self.api_key = groq_api_key
+        self.temperature = 0.7
+        self.checkpointer = checkpointer if checkpointer is not None else default_saver()
         self.workflow = self._build_workflow()
+
+    def _invoke_llm(self, prompt_text: str) -> str:
+        """Run a prompt through the shared LLM client and return the text
+        
+        Raises `LLMUnavailable` when the provider fails, so the workflow node fails
+        (and is retried from its checkpoint) instead of parsing the local fallback.
+        The prompts are templated from the persona, event and choice, so responses
+        are cached despite the 0.7 temperature: repeating an analysis within the
+        cache TTL replays the same sample instead of calling the provider.
+        """
+        res = chat(
+            [{"role": "user", "content": prompt_text}],
+            model=STRATEGIST_MODEL,
+            temperature=self.temperature,
+            api_key=self.api_key,
+            cache=True,
+            # Simulation analysis yields provider capacity to interactive /chat calls
+            priority="batch",
+            fallback=False,
+        )
+        return res.get("content", "")
     
     def _build_workflow(self):
         """Build the decision analysis workflow using LangGraph"""
         workflow = StateGraph(DecisionAnalysisState)
         
-        workflow.add_node("extract_context", self._extract_context)
-        workflow.add_node("analyze_choice", self._analyze_choice)
-        workflow.add_node("calculate_second_order", self._calculate_second_order)
-        workflow.add_node("build_decision_tree", self._build_decision_tree)
-        workflow.add_node("generate_behavioral_insights", self._generate_behavioral_insights)
-        workflow.add_node("compile_report", self._compile_report)
-        
-        workflow.add_edge("extract_context", "analyze_choice")
-        workflow.add_edge("analyze_choice", "calculate_second_order")
-        workflow.add_edge("calculate_second_order", "build_decision_tree")
-        workflow.add_edge("build_decision_tree", "generate_behavioral_insights")
-        workflow.add_edge("generate_behavioral_insights", "compile_report")
+        nodes = {
+            "extract_context": self._extract_context,
+            "analyze_choice": self._analyze_choice,
+            "calculate_second_order": self._calculate_second_order,
+            "build_decision_tree": self._build_decision_tree,
+            "generate_behavioral_insights": self._generate_behavioral_insights,
+            "compile_report": self._compile_report,
+        }
+        for name, node in nodes.items():
+            # Each node's duration is recorded as stage "strategist_node"{node=<name>}
+            workflow.add_node(name, _defer_failure(traced("strategist_node", node=name)(node)))
+        
+        # The two LLM nodes and the two pure-compute nodes only depend on the
+        # extracted context, so they run as parallel branches and join before
+        # compile_report. Each branch returns just the state keys it owns.
+        branches = ["analyze_choice", "calculate_second_order", "build_decision_tree", "generate_behavioral_insights"]
+        for branch in branches:
+            workflow.add_edge("extract_context", branch)
+        workflow.add_edge(branches, "compile_report")
         workflow.add_edge("compile_report", END)
         
         workflow.set_entry_point("extract_context")
-        return workflow.compile()
+        return workflow.compile(checkpointer=self.checkpointer)
+    
+    def _extract_context(self, state: DecisionAnalysisState) -> dict:
+        """Extract and validate context from input, and project every choice's trajectory"""
+        context = self._capture_context(state)
+        context["projections"] = project_choices([(context["financial_state_before"], state["all_choices"])], DEFAULT_HORIZON)[0]
+        return context
     
-    def _extract_context(self, state: DecisionAnalysisState) -> DecisionAnalysisState:
-        """Extract and validate context from input"""
-        state["timestamp"] = datetime.now().isoformat()
+    def _capture_context(self, state: DecisionAnalysisState) -> dict:
+        """Timestamp and financial state BEFORE the decision"""
+        timestamp = datetime.now().isoformat()
         
         # Capture financial state BEFORE decision
-        state["financial_state_before"] = {
+        financial_state_before = {
             "income": state["persona_data"].get("financial_baseline", {}).get("avg_monthly_income"),
             "savings": state["persona_data"].get("financial_baseline", {}).get("savings_balance"),
             "debt": state["persona_data"].get("financial_baseline", {}).get("debt_total"),
             "fixed_expenses": state["persona_data"].get("financial_baseline", {}).get("fixed_expenses")
         }
         
-        return state
+        return {"timestamp": timestamp, "financial_state_before": financial_state_before}
     
-    def _analyze_choice(self, state: DecisionAnalysisState) -> DecisionAnalysisState:
+    def _analyze_choice(self, state: DecisionAnalysisState) -> dict:
         """Analyze the selected choice using LLM"""
+        response = self._invoke_llm(self._analysis_prompt(state))
+        return {"analysis_report": self._parse_analysis(state, response)}
+    
+    def _analysis_prompt(self, state: DecisionAnalysisState) -> str:
+        """Build the choice-analysis prompt for a state"""
         prompt = PromptTemplate(
             input_variables=["event_title", "event_desc", "choice_text", "financial_impact", "behavioral_tag", "outcome_narrative"],
             template="""Analyze this financial decision deeply:
@@ -103,22 +194,17 @@ Return ONLY valid JSON."""
             behavioral_tag=state["selected_choice"].get("behavioral_tag"),
             outcome_narrative=state["selected_choice"].get("outcome_narrative")
         )
-        
-        response = self.llm.invoke([HumanMessage(content=prompt_text)])
-        try:
-            analysis = json.loads(response.content)
+        return prompt_text
+    
+    def _parse_analysis(self, state: DecisionAnalysisState, response: str) -> dict:
+        """Turn the raw choice-analysis LLM response into a sanitized analysis report"""
+        analysis = parse(response, CHOICE_ANALYSIS).value
+        if analysis is not None:
             # Flatten and sanitize response
-            state["analysis_report"] = {
-                "immediate_impact": state["selected_choice"].get("financial_impact", 0),
-                "psychological_consequence": analysis.get("psychological_consequence", "N/A"),
-                "opportunity_cost": analysis.get("opportunity_cost", "N/A"),
-                "sustainability_score": int(analysis.get("sustainability_score", 5)),
-                "urgency_vs_planning": analysis.get("urgency_vs_planning", "N/A"),
-                "risk_assessment": analysis.get("risk_assessment", "N/A")
-            }
-        except (json.JSONDecodeError, ValueError, TypeError):
+            analysis_report = {"immediate_impact": state["selected_choice"].get("financial_impact", 0), **analysis.model_dump()}
+        else:
             # Fallback with sanitized values
-            state["analysis_report"] = {
+            analysis_report = {
                 "immediate_impact": state["selected_choice"].get("financial_impact", 0),
                 "psychological_consequence": "Unable to analyze",
                 "opportunity_cost": "Unable to determine",
@@ -127,56 +213,41 @@ Return ONLY valid JSON."""
                 "risk_assessment": "Standard financial risk"
             }
         
-        return state
+        return analysis_report
+    
+    def _selected_trajectory(self, state: DecisionAnalysisState) -> dict:
+        """Projected trajectory of the selected choice (computed once in extract_context)"""
+        return state.get("projections", {}).get(state["selected_choice_id"], {})
     
     def _project_3month(self, state: DecisionAnalysisState) -> dict:
         """Project 3-month financial impact"""
         impact = state["selected_choice"].get("financial_impact", 0)
+        month_3 = outlook(self._selected_trajectory(state), 3)
         return {
-            "cumulative_impact": impact * 3,
+            "cumulative_impact": month_3["cumulative_impact"],
             "trend": "negative" if impact < 0 else "positive" if impact > 0 else "neutral"
         }
     
     def _project_12month(self, state: DecisionAnalysisState) -> dict:
         """Project 12-month financial impact with detailed breakdown"""
         impact = state["selected_choice"].get("financial_impact", 0)
-        liability = state["selected_choice"].get("future_liability", 0)
-        
-        before = state["financial_state_before"]
-        income = before.get("income", 1)
-        
-        # CORRECT: Calculate recovery time for the IMMEDIATE impact amount
-        immediate_cost = abs(impact) if impact < 0 else 0
-        monthly_surplus = income - before.get("fixed_expenses", 0)
-        
-        recovery_months = 0
-        if immediate_cost > 0 and monthly_surplus > 0:
-            recovery_months = max(1, int(immediate_cost / monthly_surplus))
-        
-        cumulative_impact = (impact * 12)
-        debt_accumulation = (liability * 12) if liability > 0 else 0
-        
-        # Financial health after 12 months
-        projected_savings_12m = max(0, before.get("savings", 0) + cumulative_impact)
-        projected_debt_12m = before.get("debt", 0) + debt_accumulation
+        trajectory = self._selected_trajectory(state)
+        month_12 = outlook(trajectory, 12)
         
         return {
-            "cumulative_impact": cumulative_impact,
+            "cumulative_impact": month_12["cumulative_impact"],
             "monthly_average": impact,
-            "debt_accumulation": debt_accumulation,
+            "debt_accumulation": month_12["debt_accumulation"],
             "trend": "negative" if impact < 0 else "positive" if impact > 0 else "neutral",
-            "net_position": cumulative_impact - debt_accumulation,
-            "projected_savings": projected_savings_12m,
-            "projected_debt": projected_debt_12m,
-            "recovery_timeline_months": max(0, round(recovery_months, 1)),
-            "financial_health_score": self._calculate_health_score(
-                projected_savings_12m,
-                income,
-                projected_debt_12m
-            )
+            "net_position": month_12["cumulative_impact"] - month_12["debt_accumulation"],
+            "projected_savings": month_12["savings"],
+            "projected_debt": month_12["debt"],
+            # Recovery time for the IMMEDIATE impact amount
+            "recovery_timeline_months": trajectory["recovery_months"],
+            "financial_health_score": month_12["health"]
         }
     
-    def _calculate_second_order(self, state: DecisionAnalysisState) -> DecisionAnalysisState:
+    def _calculate_second_order(self, state: DecisionAnalysisState) -> dict:
         """Calculate 2nd and 3rd order financial effects"""
         selected = state["selected_choice"]
         all_choices = state["all_choices"]
@@ -205,42 +276,19 @@ Return ONLY valid JSON."""
                     "outcome_narrative": choice.get("outcome_narrative")
                 })
         
-        # Simulate 6-month trajectory
-        before = state["financial_state_before"]
-        selected = state["selected_choice"]
-        
-        # CORRECT: Calculate full 6-month impact
-        six_month_impact = selected.get("financial_impact", 0) * 6
-        projected_savings_6m = before.get("savings", 0) + six_month_impact
-        
-        second_order["cumulative_scenario_6_months"] = {
-            "projected_savings": max(0, projected_savings_6m),
-            "debt_trajectory": before.get("debt", 0) + selected.get("future_liability", 0),
-            "financial_health_score": self._calculate_health_score(
-                max(0, projected_savings_6m),
-                before.get("income", 1),
-                before.get("debt", 0) + selected.get("future_liability", 0)
-            )
-        }
-        
-        # Simulate 12-month trajectory
-        monthly_impact_12 = selected.get("financial_impact", 0)
-        projected_savings_12m = before.get("savings", 0) + (monthly_impact_12 * 12)
-        
-        second_order["cumulative_scenario_12_months"] = {
-            "projected_savings": max(0, projected_savings_12m),
-            "debt_trajectory": before.get("debt", 0) + (selected.get("future_liability", 0) * 12),
-            "financial_health_score": self._calculate_health_score(
-                max(0, projected_savings_12m),
-                before.get("income", 1),
-                before.get("debt", 0) + (selected.get("future_liability", 0) * 12)
-            )
-        }
+        # 6- and 12-month trajectories are slices of the precomputed projection
+        trajectory = self._selected_trajectory(state)
+        for months, key in ((6, "cumulative_scenario_6_months"), (12, "cumulative_scenario_12_months")):
+            month_n = outlook(trajectory, months)
+            second_order[key] = {
+                "projected_savings": month_n["savings"],
+                "debt_trajectory": month_n["debt"],
+                "financial_health_score": month_n["health"]
+            }
         
-        state["second_order_effects"] = second_order
-        return state
+        return {"second_order_effects": second_order}
     
-    def _build_decision_tree(self, state: DecisionAnalysisState) -> DecisionAnalysisState:
+    def _build_decision_tree(self, state: DecisionAnalysisState) -> dict:
         """Build comprehensive decision tree with consequences"""
         proj_12m = self._project_12month(state)
         
@@ -277,8 +325,29 @@ Return ONLY valid JSON."""
                     "alternative_behavioral_path": alt_choice.get("behavioral_tag")
                 })
         
-        state["simulation_update"] = tree
-        return state
+        if state.get("simulation_paths"):
+            tree["income_volatility_simulation"] = self._simulate_outcomes(state)
+        
+        return {"simulation_update": tree}
+    
+    def _simulate_outcomes(self, state: DecisionAnalysisState) -> dict:
+        """Monte Carlo percentile bands for every choice under the persona's income volatility"""
+        volatility = volatility_model(state["persona_data"].get("financial_baseline", {}))
+        # Seed from the persona/event so repeated analyses report identical bands
+        seed = zlib.crc32(f"{state['persona_id']}:{state['event_id']}".encode("utf-8"))
+        return {
+            "paths": state["simulation_paths"],
+            "horizon_months": DEFAULT_HORIZON,
+            "volatility_model": volatility,
+            "choices": simulate(
+                state["financial_state_before"],
+                state["all_choices"],
+                volatility,
+                horizon=DEFAULT_HORIZON,
+                n_paths=state["simulation_paths"],
+                seed=seed,
+            ),
+        }
     
     def _get_consequences(self, choice: dict) -> dict:
         """Extract consequences from choice"""
@@ -315,22 +384,99 @@ Return ONLY valid JSON."""
             return "Cautious approach. Opportunity to explore calculated risks."
         return "Opportunity to reflect on decision-making patterns."
     
-    def _calculate_health_score(self, savings: float, income: float, debt: float) -> float:
-        """Calculate financial health score (0-100)"""
-        if income == 0:
-            return 0
-        savings_ratio = min((savings / income) * 100, 50)
-        debt_ratio = max(50 - (debt / income) * 100, 0)
-        return (savings_ratio + debt_ratio) / 2
-    
     def analyze_decision(self, 
                         persona_id: str, 
                         persona_data: dict,
                         event_id: str,
                         event_data: dict,
-                        selected_choice_id: str) -> dict:
-        """Main entry point for decision analysis"""
+                        selected_choice_id: str,
+                        simulation_paths: int = 0,
+                        should_stop: Optional[Callable[[], bool]] = None,
+                        run_id: Optional[str] = None) -> dict:
+        """Main entry point for decision analysis
+        
+        With `simulation_paths` > 0 (capped at MAX_PATHS) the decision tree also
+        carries Monte Carlo percentile bands sampled from the persona's income volatility.
+        `should_stop` is checked after every workflow node; when it returns True
+        the run ends with `AnalysisStopped`.
+        
+        Every call is checkpointed under its own run id. If a run fails, the
+        partial report carries its `run_id`; passing it back as `run_id` resumes
+        that run from its last completed node instead of repeating its LLM calls.
+        A run id can only be resumed by one call at a time.
+        """
+        initial_state = self._initial_state(persona_id, persona_data, event_id, event_data, selected_choice_id, simulation_paths)
+        resume = run_id is not None
+        run_id = run_id or self.new_run_id()
+        config = {"configurable": {"thread_id": run_id}}
+        with _active_lock:
+            if run_id in _active_runs:
+                raise ValueError(f"Run {run_id} is already in progress")
+            _active_runs.add(run_id)
         
+        try:
+            with span("strategist"):
+                final_state = self._run_workflow(initial_state, config, should_stop, resume)
+            if self.checkpointer is not None:
+                self.checkpointer.record_run("completed")
+                self.checkpointer.delete_thread(run_id)
+            return self._format_final_report(final_state)
+        except AnalysisStopped:
+            raise
+        except Exception as e:
+            logger.warning("Workflow error (continuing with partial analysis): %s", e)
+            # Return partial report with the work checkpointed so far
+            partial_state = initial_state
+            if self.checkpointer is not None:
+                self.checkpointer.record_run("failed")
+                try:
+                    partial_state = self.workflow.get_state(config).values or initial_state
+                except Exception:
+                    pass
+            report = self._format_final_report(partial_state)
+            report["run_id"] = run_id
+            report["error"] = str(e) or type(e).__name__
+            return report
+        finally:
+            with _active_lock:
+                _active_runs.discard(run_id)
+    
+    @staticmethod
+    def new_run_id() -> str:
+        """Checkpoint thread id for a new run"""
+        return f"strategist-{uuid.uuid4().hex}"
+    
+    def _run_workflow(self, initial_state: DecisionAnalysisState, config: dict, should_stop: Optional[Callable[[], bool]], resume: bool = False) -> DecisionAnalysisState:
+        inputs = initial_state
+        if self.checkpointer is not None:
+            self.checkpointer.record_run("runs")
+            # The caller passed back a run that stopped part-way: continue it from its last checkpoint
+            if resume and self.workflow.get_state(config).next:
+                self.checkpointer.record_run("resumed")
+                inputs = None
+        try:
+            if should_stop is None:
+                final_state = self.workflow.invoke(inputs, config)
+            else:
+                final_state = initial_state
+                for final_state in self.workflow.stream(inputs, config, stream_mode="values"):
+                    if should_stop():
+                        raise AnalysisStopped()
+        finally:
+            with _node_errors_lock:
+                error = _node_errors.pop(config["configurable"]["thread_id"], None)
+        if error is not None:
+            raise error
+        return final_state
+    
+    def _initial_state(self,
+                       persona_id: str,
+                       persona_data: dict,
+                       event_id: str,
+                       event_data: dict,
+                       selected_choice_id: str,
+                       simulation_paths: int = 0) -> DecisionAnalysisState:
+        """Validate the selected choice and build the workflow's initial state"""
         # Find selected choice
         selected_choice = None
         all_choices = event_data.get("choices", [])
@@ -351,24 +497,94 @@ Return ONLY valid JSON."""
             "selected_choice_id": selected_choice_id,
             "selected_choice": selected_choice,
             "all_choices": all_choices,
+            "simulation_paths": min(max(int(simulation_paths or 0), 0), MAX_PATHS),
             "financial_state_before": {},
+            "projections": {},
             "analysis_report": {},
             "second_order_effects": {},
             "behavioral_insights": {},
             "simulation_update": {},
             "timestamp": ""
         }
-        
+        return initial_state
+    
+    def analyze_decisions_batch(self, items: Iterable[dict], max_concurrency: int = 8) -> Iterator[dict]:
+        """Analyze many (persona, event, choice) tuples, yielding reports as they finish.
+        
+        Each item carries the `analyze_decision` arguments as keys. The deterministic
+        projections are computed for the whole batch up front; identical LLM prompts
+        are sent once and run with at most `max_concurrency` calls in flight.
+        Yields {"index": i, "report": {...}} or {"index": i, "error": "..."}.
+        """
+        states: Dict[int, DecisionAnalysisState] = {}
+        for idx, item in enumerate(items):
+            try:
+                state = self._initial_state(
+                    item.get("persona_id"),
+                    item.get("persona_data") or {},
+                    item.get("event_id"),
+                    item.get("event_data") or {},
+                    item.get("selected_choice_id"),
+                    item.get("simulation_paths") or 0,
+                )
+                state.update(self._capture_context(state))
+                states[idx] = state
+            except Exception as e:
+                yield {"index": idx, "error": str(e)}
+        
+        # Deterministic pass: one projection for every choice of every item, then
+        # the LLM-free report sections
+        projections = project_choices(
+            [(state["financial_state_before"], state["all_choices"]) for state in states.values()],
+            DEFAULT_HORIZON,
+        )
+        for state, projection in zip(list(states.values()), projections):
+            state["projections"] = projection
+        for idx in list(states):
+            state = states[idx]
+            try:
+                state.update(self._calculate_second_order(state))
+                state.update(self._build_decision_tree(state))
+            except Exception as e:
+                del states[idx]
+                yield {"index": idx, "error": str(e)}
+        
+        # Dedupe identical prompts across the batch: prompt -> [(index, kind)]
+        prompts: Dict[str, List[Tuple[int, str]]] = {}
+        for idx, state in states.items():
+            prompts.setdefault(self._analysis_prompt(state), []).append((idx, "analysis"))
+            prompts.setdefault(self._insights_prompt(state), []).append((idx, "insights"))
+        remaining = {idx: 2 for idx in states}
+        
+        pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
         try:
-            final_state = self.workflow.invoke(initial_state)
-            return self._format_final_report(final_state)
-        except Exception as e:
-            print(f"⚠ Workflow error (continuing with partial analysis): {str(e)}")
-            # Return partial report with available data
-            return self._format_final_report(initial_state)
+            futures = {pool.submit(self._invoke_llm, prompt): prompt for prompt in prompts}
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logger.warning("Batch LLM call failed (using fallback analysis): %s", e)
+                    response = ""
+                for idx, kind in prompts[futures[future]]:
+                    state = states[idx]
+                    if kind == "analysis":
+                        state["analysis_report"] = self._parse_analysis(state, response)
+                    else:
+                        state["behavioral_insights"] = self._parse_insights(state, response)
+                    remaining[idx] -= 1
+                    if remaining[idx] == 0:
+                        state.update(self._compile_report(state))
+                        yield {"index": idx, "report": self._format_final_report(state)}
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
     
-    def _generate_behavioral_insights(self, state: DecisionAnalysisState) -> DecisionAnalysisState:
+    def _generate_behavioral_insights(self, state: DecisionAnalysisState) -> dict:
         """Generate behavioral and psychological insights using LLM"""
+        response = self._invoke_llm(self._insights_prompt(state))
+        return {"behavioral_insights": self._parse_insights(state, response)}
+    
+    def _insights_prompt(self, state: DecisionAnalysisState) -> str:
+        """Build the behavioral-insights prompt for a state"""
         prompt = PromptTemplate(
             input_variables=["persona_name", "persona_type", "stressor", "behavioral_tag", "selected_outcome"],
             template="""Behavioral Analysis for Gig Economy Persona:
@@ -397,22 +613,17 @@ Return valid JSON only."""
             behavioral_tag=state["selected_choice"].get("behavioral_tag"),
             selected_outcome=state["selected_choice"].get("outcome_narrative")
         )
-        
-        response = self.llm.invoke([HumanMessage(content=prompt_text)])
-        try:
-            raw_response = response.content.strip()
-            # Remove markdown code blocks if present
-            if raw_response.startswith("```"):
-                raw_response = raw_response.split("```")[1]
-                if raw_response.startswith("json"):
-                    raw_response = raw_response[4:]
-                raw_response = raw_response.strip()
-            
-            state["behavioral_insights"] = json.loads(raw_response)
-        except json.JSONDecodeError as e:
-            print(f"⚠️ Behavioral insights parsing failed: {str(e)}")
+        return prompt_text
+    
+    def _parse_insights(self, state: DecisionAnalysisState, response: str) -> dict:
+        """Turn the raw behavioral-insights LLM response into a dict, with a fallback structure"""
+        result = parse(response, BEHAVIORAL_INSIGHTS)
+        if result.value is not None:
+            behavioral_insights = result.value.model_dump(exclude_unset=True)
+        else:
+            logger.warning("Behavioral insights parsing failed: %s", result.error)
             # Fallback with simplified structure
-            state["behavioral_insights"] = {
+            behavioral_insights = {
                 "decision_archetype": state["selected_choice"].get("behavioral_tag", "Unknown"),
                 "vulnerability_indicators": [
                     "Reduced cash buffer after major expense",
@@ -453,10 +664,10 @@ Return valid JSON only."""
                 }
             }
             
-        return state
+        return behavioral_insights
     
-    def _compile_report(self, state: DecisionAnalysisState) -> DecisionAnalysisState:
-        """Compile final comprehensive report - validation step"""
+    def _compile_report(self, state: DecisionAnalysisState) -> dict:
+        """Compile final comprehensive report - validation step (joins the parallel branches)"""
         required_fields = [
             "persona_id", "event_id", "timestamp",
             "selected_choice_id", "selected_choice", "all_choices",
@@ -464,12 +675,13 @@ Return valid JSON only."""
             "second_order_effects", "behavioral_insights", "simulation_update"
         ]
         
+        updates = {}
         for field in required_fields:
             # Verify all required fields are populated
             if not state.get(field):
-                state[field] = {} if field not in ["all_choices", "timestamp"] else ([] if field == "all_choices" else "")
+                updates[field] = {} if field not in ["all_choices", "timestamp"] else ([] if field == "all_choices" else "")
         
-        return state
+        return updates
     
     def _format_final_report(self, state: DecisionAnalysisState) -> dict:
         """Format the final comprehensive report"""
@@ -534,3 +746,28 @@ Return valid JSON only."""
             summary += f"Key learning: {learning}"
         
         return summary
+
+
+_shared_agent = None
+_shared_lock = threading.Lock()
+
+
+def shared_agent() -> StrategistAgent:
+    """Return the process-wide StrategistAgent, building its workflow on first use"""
+    global _shared_agent
+    with _shared_lock:
+        if _shared_agent is None:
+            _shared_agent = StrategistAgent()
+        return _shared_agent
+
+
+def run_analysis_job(payload: dict, should_stop: Callable[[], bool]) -> dict:
+    """`jobs` handler for "strategist.analyze": payload holds the `analyze_decision` arguments
+
+    A failed workflow is reported to the queue as retryable; with the payload's
+    `run_id` the next attempt resumes from the last completed node.
+    """
+    report = shared_agent().analyze_decision(**payload, should_stop=should_stop)
+    if report.get("error"):
+        raise RetryableJobError(report["error"], result=report)
+    return report
@@ -0,0 +1,202 @@
+"""Shared parsing and validation of structured (JSON) LLM output.
+
+`extract_json` pulls the JSON object out of a raw completion in linear time:
+- a direct `json.loads` when the text (or a ```json fenced block) is pure JSON;
+- otherwise a single left-to-right scan that tracks brace depth and string
+  state and yields each balanced top-level `{...}` span, which is then parsed.
+  Every character is visited once, so huge or adversarial outputs (e.g.
+  thousands of unmatched braces) cannot trigger backtracking.
+
+Validators are built once at import as pydantic v2 models / `TypeAdapter`s:
+`PLAN` (agent plans), `ANALYSIS` (analysis_agent results), `CHOICE_ANALYSIS`
+and `BEHAVIORAL_INSIGHTS` (StrategistAgent reports). `parse(text, adapter)`
+combines extraction and validation.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Literal, NamedTuple, Optional, Tuple
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, TypeAdapter, ValidationError, model_validator
+from typing_extensions import Annotated
+
+_decoder = json.JSONDecoder()
+
+
+def _strip_fence(text: str) -> str:
+    """Return the body of the first ``` fenced block, or the text unchanged."""
+    start = text.find("```")
+    if start < 0:
+        return text
+    body_start = text.find("\n", start)
+    if body_start < 0:
+        return text
+    end = text.find("```", body_start)
+    return text[body_start + 1:end] if end >= 0 else text[body_start + 1:]
+
+
+def iter_object_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) of each balanced top-level {...} span, in one linear pass.
+
+    String state is only tracked inside an object, so quotes and apostrophes in
+    surrounding prose do not confuse the scan. If the text ends inside an
+    unclosed brace (truncated output, or a stray "{" in prose before the real
+    JSON), the shallowest complete objects inside it are yielded instead.
+    """
+    starts: List[int] = []
+    nested: List[Tuple[int, int, int]] = []  # (depth, start, end) inside the current unclosed object
+    in_string = False
+    escaped = False
+    find = text.find
+    i, n = find("{"), len(text)
+    if i < 0:
+        return
+    while i < n:
+        c = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            if starts:
+                in_string = True
+        elif c == "{":
+            starts.append(i)
+        elif c == "}" and starts:
+            start = starts.pop()
+            if starts:
+                nested.append((len(starts), start, i + 1))
+            else:
+                nested.clear()
+                yield start, i + 1
+                # Skip straight to the next candidate object
+                i = find("{", i + 1)
+                if i < 0:
+                    return
+                continue
+        i += 1
+    if starts and nested:
+        shallowest = min(d for d, _, _ in nested)
+        for d, start, end in nested:
+            if d == shallowest:
+                yield start, end
+
+
+def extract_json(text: str) -> Optional[Any]:
+    """Return the first JSON value found in `text` (preferring the whole text), or None."""
+    if not isinstance(text, str):
+        return None
+    stripped = text.strip()
+    if stripped.startswith("```"):
+        stripped = _strip_fence(stripped).strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.loads(stripped)
+        except ValueError:
+            pass
+    for start, end in iter_object_spans(text):
+        try:
+            return _decoder.decode(text[start:end])
+        except ValueError:
+            continue
+    return None
+
+
+class ParseResult(NamedTuple):
+    value: Any  # validated value, or None
+    data: Any  # extracted JSON before validation, or None
+    error: Optional[str]
+
+
+def parse(text: str, adapter: TypeAdapter) -> ParseResult:
+    """Extract JSON from `text` and validate it with a precompiled `adapter`."""
+    data = extract_json(text)
+    if data is None:
+        return ParseResult(None, None, "Invalid JSON: no JSON object found")
+    try:
+        return ParseResult(adapter.validate_python(data), data, None)
+    except ValidationError as ve:
+        return ParseResult(None, data, ve.json())
+
+
+# --- Schemas ---
+
+class LLMPlan(BaseModel):
+    action: Literal["CALL_TOOL", "RESPOND", "FINISH"]
+    tool: Optional[str] = None
+    tool_args: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    updated_profile_data: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    response: Optional[str] = ""
+
+    @model_validator(mode="after")
+    def check_tool_required_for_call(self):
+        if self.action == "CALL_TOOL" and not self.tool:
+            raise ValueError("'tool' is required when action == CALL_TOOL")
+        return self
+
+
+def _dict_or_empty(value: Any) -> Any:
+    return value if isinstance(value, dict) else {}
+
+
+def _dict_items(value: Any) -> Any:
+    return [q for q in value if isinstance(q, dict)] if isinstance(value, list) else []
+
+
+def _to_int(value: Any) -> Any:
+    # LLMs return scores as 6, "6" or 6.5; the report wants an int
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return value
+
+
+class AnalysisResult(BaseModel):
+    """analysis_agent output; malformed fields degrade to empty values instead of failing."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    updated_profile: Annotated[Dict[str, Any], BeforeValidator(_dict_or_empty)] = Field(default_factory=dict)
+    next_questions: Annotated[List[Dict[str, Any]], BeforeValidator(_dict_items)] = Field(default_factory=list)
+    finish: Annotated[bool, BeforeValidator(bool)] = False
+    explanation: Annotated[str, BeforeValidator(lambda v: "" if v is None else str(v))] = ""
+
+
+class ChoiceAnalysis(BaseModel):
+    """StrategistAgent choice-analysis fields produced by the LLM."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    psychological_consequence: Any = "N/A"
+    opportunity_cost: Any = "N/A"
+    sustainability_score: Annotated[int, BeforeValidator(_to_int)] = 5
+    urgency_vs_planning: Any = "N/A"
+    risk_assessment: Any = "N/A"
+
+    @model_validator(mode="before")
+    @classmethod
+    def _has_analysis_fields(cls, data: Any) -> Any:
+        # Any other JSON object (e.g. an agent plan) is not an analysis
+        if isinstance(data, dict) and not data.keys() & cls.model_fields.keys():
+            raise ValueError("no choice-analysis fields")
+        return data
+
+
+class BehavioralInsights(BaseModel):
+    """StrategistAgent behavioral insights; extra keys from the LLM are kept."""
+
+    model_config = ConfigDict(extra="allow")
+
+    decision_archetype: Any = None
+    vulnerability_indicators: Any = None
+    adaptive_capacity: Any = None
+    long_term_trajectory: Any = None
+    intervention_opportunities: Any = None
+    peer_comparison: Any = None
+
+
+PLAN = TypeAdapter(LLMPlan)
+ANALYSIS = TypeAdapter(AnalysisResult)
+CHOICE_ANALYSIS = TypeAdapter(ChoiceAnalysis)
+BEHAVIORAL_INSIGHTS = TypeAdapter(BehavioralInsights)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Backend modules are imported flat, as main_api does; keep test data out of backend/data
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="backend-tests-"))
+os.environ.setdefault("LLM_PROVIDER", "mock")
@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import agent_core
+from agent_core import QUESTIONS_READY, Agent, ResponseTextStream
+
+
+def feed_all(stream, text, size=3):
+    return "".join(stream.feed(text[i:i + size]) for i in range(0, len(text), size))
+
+
+def test_stream_decodes_response_across_chunks():
+    plan = json.dumps({"action": "RESPOND", "response": 'Save ₹1,000 "now"\nplease'})
+    stream = ResponseTextStream()
+    assert feed_all(stream, plan, size=1) == 'Save ₹1,000 "now"\nplease'
+
+
+def test_stream_ignores_nested_response_keys():
+    plan = json.dumps({"tool_args": {"response": "internal"}, "action": "RESPOND", "response": "visible"})
+    assert feed_all(ResponseTextStream(), plan) == "visible"
+
+
+def test_stream_holds_text_until_action_is_known():
+    stream = ResponseTextStream(hold_tool_calls=True)
+    assert stream.feed('{"response": "Hello') == ""
+    assert stream.feed('", "action": "RESPOND"}') == "Hello"
+    assert stream.emitted == "Hello"
+
+
+def test_stream_drops_text_of_tool_calls():
+    plan = json.dumps({"action": "CALL_TOOL", "tool": "report_generator", "response": "Let me check"})
+    stream = ResponseTextStream(hold_tool_calls=True)
+    assert feed_all(stream, plan) == ""
+    assert stream.text == "Let me check"
+
+
+def _streaming_agent(monkeypatch, replies):
+    async def fake_stream(messages, on_token=None, **kwargs):
+        content = replies.pop(0)
+        for i in range(0, len(content), 4):
+            on_token(content[i:i + 4])
+        return {"content": content}
+
+    monkeypatch.setattr(agent_core, "astream_chat", fake_stream)
+    events = []
+    return Agent(), events, lambda event, data: events.append((event, data))
+
+
+def _tokens(events):
+    return "".join(data["text"] for event, data in events if event == "token")
+
+
+def test_tool_call_streams_only_the_followup(monkeypatch):
+    plan = json.dumps({"action": "CALL_TOOL", "tool": "profile_store_get", "tool_args": {}, "response": "Checking"})
+    final = json.dumps({"action": "RESPOND", "response": "Here is your profile."})
+    agent, events, emit = _streaming_agent(monkeypatch, [plan, final])
+    result = asyncio.run(agent._ahandle({"user_profile": {}}, "context", emit))
+    assert result["response"] == "Here is your profile."
+    assert _tokens(events) == result["response"]
+
+
+def test_terminal_tool_streams_the_final_text(monkeypatch):
+    plan = json.dumps({"action": "CALL_TOOL", "tool": "analysis_agent", "tool_args": {}})
+    agent, events, emit = _streaming_agent(monkeypatch, [plan])
+    outputs = {"analysis_agent": {"next_questions": [{"key": "income.amount", "label": "Income?"}]}}
+    result = asyncio.run(agent._ahandle({"user_profile": {}}, "context", emit, outputs))
+    assert result["response"] == QUESTIONS_READY
+    assert _tokens(events) == QUESTIONS_READY
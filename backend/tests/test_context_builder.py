@@ -0,0 +1,47 @@
+import json
+
+from context_builder import CONTEXT_RECENT_MESSAGES, build_context, compact_profile, estimate_tokens, update_summary
+
+
+def session(n_messages, length=400):
+    return {
+        "user_profile": {"income": {"amount": 30000, "stability": None, "notes": ""}, "goals": {"short_term": "Emergency fund"}},
+        "messages": [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * length} for i in range(n_messages)],
+    }
+
+
+def test_compact_profile_splits_filled_and_missing():
+    filled, missing = compact_profile({"income": {"amount": 1, "stability": None, "notes": ""}, "debt": {"details": []}, "goals": {}})
+    assert filled == {"income": {"amount": 1}}
+    assert missing == ["income.stability", "income.notes", "debt.details", "goals"]
+
+
+def test_context_stays_within_token_budget():
+    for budget in (300, 600, 1500):
+        payload, metrics = build_context(session(40), "What next?", budget=budget)
+        assert estimate_tokens(payload) <= budget
+        assert metrics["prompt_tokens_est"] <= budget
+        state = json.loads(payload)["session_state"]
+        assert state["user_profile"] == {"income": {"amount": 30000}, "goals": {"short_term": "Emergency fund"}}
+        assert "income.stability" in state["missing_fields"]
+
+
+def test_trimming_drops_oldest_recent_messages_first():
+    payload, metrics = build_context(session(40), "hi", budget=600)
+    recent = json.loads(payload)["session_state"].get("recent_messages", [])
+    assert metrics["trimmed"] and len(recent) < CONTEXT_RECENT_MESSAGES
+    assert recent and recent[-1]["content"].startswith("message 39 ")
+
+    _, roomy = build_context(session(40), "hi", budget=100000)
+    assert not roomy["trimmed"] and roomy["recent_messages"] == CONTEXT_RECENT_MESSAGES
+    assert roomy["summarized_messages"] == 40 - CONTEXT_RECENT_MESSAGES
+
+
+def test_summary_is_extended_incrementally():
+    state = session(10, length=10)
+    first = update_summary(state, 4)
+    assert state["context_summary"]["covered"] == 4 and "message 3" in first and "message 4" not in first
+    assert update_summary(state, 4) == first
+    assert update_summary(state, 6).startswith(first)
+    # A shortened history rebuilds the summary
+    assert update_summary(state, 2) == " | ".join(f"{'user' if i % 2 == 0 else 'assistant'}: message {i} xxxxxxxxxx" for i in range(2))
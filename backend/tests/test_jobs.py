@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobQueue, RetryableJobError, UnknownJobKind
+
+started = threading.Event()
+
+
+def echo(payload, should_stop):
+    return {"echo": payload}
+
+
+def fail(payload, should_stop):
+    raise RuntimeError("handler failed")
+
+
+flaky_calls = []
+
+
+def flaky(payload, should_stop):
+    flaky_calls.append(payload)
+    if len(flaky_calls) <= payload["failures"]:
+        raise RetryableJobError("transient", result={"partial": True})
+    return {"calls": len(flaky_calls)}
+
+
+def wait_for_stop(payload, should_stop):
+    started.set()
+    while not should_stop():
+        time.sleep(0.01)
+    return {"stopped": False}
+
+
+@pytest.fixture
+def queue_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "HANDLERS", {"echo": "test_jobs:echo", "fail": "test_jobs:fail", "wait": "test_jobs:wait_for_stop", "flaky": "test_jobs:flaky"})
+    monkeypatch.setattr(jobs, "JOB_POLL_S", 0.01)
+    return str(tmp_path / "jobs.db")
+
+
+def wait_status(queue, job_id, statuses, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {queue.get(job_id)['status']}")
+
+
+def test_jobs_run_to_completion_or_failure(queue_path):
+    queue = JobQueue(queue_path, workers=2)
+    queue.start()
+    try:
+        ok = queue.submit("echo", {"x": 1})
+        bad = queue.submit("fail", {})
+        assert wait_status(queue, ok, {"done"})["result"] == {"echo": {"x": 1}}
+        failed = wait_status(queue, bad, {"failed"})
+        assert failed["error"] == "handler failed"
+    finally:
+        queue.stop()
+    assert queue.stats()["by_status"] == {"done": 1, "failed": 1}
+
+
+def test_retryable_failures_are_requeued(queue_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    queue = JobQueue(queue_path, workers=1)
+    queue.start()
+    try:
+        flaky_calls.clear()
+        retried = queue.submit("flaky", {"failures": 1})
+        done = wait_status(queue, retried, {"done", "failed"})
+        assert (done["status"], done["attempts"], done["result"]) == ("done", 2, {"calls": 2})
+
+        flaky_calls.clear()
+        exhausted = queue.submit("flaky", {"failures": 5})
+        failed = wait_status(queue, exhausted, {"done", "failed"})
+        assert (failed["status"], failed["attempts"], failed["error"]) == ("failed", 2, "transient")
+        assert failed["result"] == {"partial": True}
+    finally:
+        queue.stop()
+    assert queue.stats()["requeued"] == 2
+
+
+def test_unknown_kind_is_rejected(queue_path):
+    with pytest.raises(UnknownJobKind):
+        JobQueue(queue_path, workers=0).submit("nope", {})
+
+
+def test_cancel_queued_and_running_jobs(queue_path):
+    queue = JobQueue(queue_path, workers=1)
+    queued = queue.submit("echo", {})
+    assert queue.cancel(queued)["status"] == "cancelled"
+    assert queue.cancel("missing") is None
+
+    started.clear()
+    queue.start()
+    try:
+        running = queue.submit("wait", {})
+        assert started.wait(5)
+        queue.cancel(running)
+        assert wait_status(queue, running, {"cancelled"})["cancel_requested"]
+    finally:
+        queue.stop()
+
+
+def _abandon(queue, job_id, age):
+    """Simulate a worker that claimed the job and then died `age` seconds ago."""
+    row = queue._claim()
+    assert row["job_id"] == job_id
+    with queue._conn() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ?, worker = 'dead:1' WHERE job_id = ?", (time.time() - age, job_id))
+    queue._running.discard(job_id)
+
+
+def test_expired_lease_is_requeued_then_failed(queue_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_LEASE_S", 10)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    queue = JobQueue(queue_path, workers=0)
+    job_id = queue.submit("echo", {})
+
+    _abandon(queue, job_id, age=5)
+    queue._maintain()
+    assert queue.get(job_id)["status"] == "running"  # lease not expired yet
+
+    with queue._conn() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time() - 20, job_id))
+    queue._maintain()
+    job = queue.get(job_id)
+    assert job["status"] == "queued" and job["attempts"] == 1
+    assert queue.stats()["requeued"] == 1
+
+    _abandon(queue, job_id, age=20)
+    queue._maintain()
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and job["error"] == "worker lost" and job["attempts"] == 2
+
+
+def test_expired_lease_of_cancelled_job_is_cancelled(queue_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_LEASE_S", 10)
+    queue = JobQueue(queue_path, workers=0)
+    job_id = queue.submit("echo", {})
+    _abandon(queue, job_id, age=20)
+    queue.cancel(job_id)
+    queue._maintain()
+    assert queue.get(job_id)["status"] == "cancelled"
+
+
+def test_finished_jobs_are_purged(queue_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_FINISHED", 2)
+    queue = JobQueue(queue_path, workers=0)
+    ids = [queue.submit("echo", {}) for _ in range(4)]
+    for job_id in ids:
+        queue.cancel(job_id)
+    queue._maintain()
+    assert len(queue.list("cancelled")) == 2
+    assert queue.stats()["purged"] == 2
+
+
+def test_queue_is_created_lazily(monkeypatch):
+    monkeypatch.setattr(jobs, "_job_queue", None)
+    assert jobs.job_stats() == {"workers": 0}
+    assert jobs._job_queue is None
+    assert jobs.get_job_queue() is jobs.get_job_queue()
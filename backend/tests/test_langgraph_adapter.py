@@ -0,0 +1,28 @@
+import asyncio
+
+import langgraph_adapter
+from langgraph_adapter import aexecute_tool, execute_tool, get_tool_graph
+
+
+def test_compiled_graph_is_reused(monkeypatch, caplog):
+    graph = get_tool_graph()
+    assert graph is not None
+    builds = []
+    monkeypatch.setattr(langgraph_adapter, "build_tool_graph", lambda: builds.append(1))
+
+    session = {"user_profile": {"income": {"amount": 30000}}}
+    assert execute_tool("profile_store_get", {}, session)
+    assert execute_tool("calculator", {"op": "sum", "numbers": [2, 3]}, session) == {"result": 5}
+    asyncio.run(aexecute_tool("profile_store_get", {}, session))
+    assert get_tool_graph() is graph
+    assert builds == []
+    assert "falling back" not in caplog.text
+
+
+def test_unknown_tools_and_direct_dispatch(monkeypatch):
+    assert execute_tool("nope", {}, {}) == {"error": "Unknown tool: nope"}
+    session = {"user_profile": {"income": {"amount": 30000}}}
+    via_graph = execute_tool("profile_store_get", {}, session)
+    monkeypatch.setattr(langgraph_adapter, "TOOL_DISPATCH", "direct")
+    assert get_tool_graph() is None
+    assert execute_tool("profile_store_get", {}, session) == via_graph
@@ -0,0 +1,50 @@
+import llm_cache
+from llm_cache import ResponseCache, cache_key
+
+MESSAGES = [{"role": "system", "content": "You are helpful."}, {"role": "user", "content": "Plan my  budget\n"}]
+
+
+def test_cache_key_is_stable_and_normalizes_whitespace():
+    key = cache_key("m", {"temperature": 0.0}, MESSAGES)
+    assert key == cache_key("m", {"temperature": 0.0}, [dict(m) for m in MESSAGES])
+    assert key == cache_key("m", {"temperature": 0.0}, [MESSAGES[0], {"role": "user", "content": "Plan my budget"}])
+    assert len(key) == 64
+    assert key != cache_key("other", {"temperature": 0.0}, MESSAGES)
+    assert key != cache_key("m", {"temperature": 0.7}, MESSAGES)
+    assert key != cache_key("m", {"temperature": 0.0}, [MESSAGES[0], {"role": "assistant", "content": "Plan my budget"}])
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put("a", "x")
+    cache.put("b", "y", ttl=5)
+    now[0] += 10
+    assert cache.get("a") == "x"
+    assert cache.get("b") is None
+    now[0] += 60
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["expired"] == 2 and stats["hits_memory"] == 1 and stats["entries"] == 0
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    cache = ResponseCache(max_entries=1, ttl=60, disk_dir=str(tmp_path), max_disk_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    reopened = ResponseCache(max_entries=1, ttl=60, disk_dir=str(tmp_path), max_disk_entries=2)
+    assert reopened.get("a") is None
+    assert reopened.get("b") == "B" and reopened.get("c") == "C"
+    assert reopened.stats()["hits_disk"] == 2
@@ -0,0 +1,45 @@
+import threading
+
+import llm_client
+from llm_client import client_stats, get_llm
+
+
+def test_registry_returns_one_client_per_key():
+    first = get_llm("registry-test-model", 0)
+    before = client_stats()
+    assert get_llm("registry-test-model", 0.0) is first
+    assert client_stats()["reused"] == before["reused"] + 1
+    assert client_stats()["created"] == before["created"]
+
+    assert get_llm("registry-test-model", 0.7) is not first
+    assert get_llm("registry-test-model", 0, api_key="other") is not first
+    assert get_llm("registry-test-model-2", 0) is not first
+
+
+def test_concurrent_lookups_share_one_client():
+    results = []
+    barrier = threading.Barrier(8)
+
+    def lookup():
+        barrier.wait()
+        results.append(get_llm("registry-test-concurrent", 0))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8 and all(r is results[0] for r in results)
+
+
+def test_unavailable_provider_is_remembered(monkeypatch):
+    calls = []
+
+    def broken(model, temperature, api_key=None):
+        calls.append(model)
+        raise RuntimeError("no API key")
+
+    monkeypatch.setattr(llm_client, "_build_provider_llm", broken)
+    assert get_llm("registry-test-broken", 0) is None
+    assert get_llm("registry-test-broken", 0) is None
+    assert calls == ["registry-test-broken"]
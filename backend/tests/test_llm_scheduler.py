@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import DeadlineExceeded, LLMScheduler, PrioritySlots, TokenBucket, is_retryable
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def flaky(failures, status=503):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ProviderError(status)
+        return "ok"
+
+    return fn, calls
+
+
+def test_retryable_statuses():
+    assert is_retryable(ProviderError(429))
+    assert is_retryable(ProviderError(503))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ProviderError(409))
+    assert not is_retryable(ProviderError(400))
+    assert not is_retryable(ValueError())
+
+
+def test_run_retries_transient_failures():
+    scheduler = LLMScheduler(max_concurrency=2, max_retries=2, backoff_base_ms=1, backoff_cap_ms=2)
+    fn, calls = flaky(2)
+    assert scheduler.run(fn) == "ok"
+    assert len(calls) == 3
+    assert scheduler.stats()["retries"] == 2
+
+
+def test_conflict_is_not_retried():
+    scheduler = LLMScheduler(max_concurrency=2, max_retries=3, backoff_base_ms=1, backoff_cap_ms=2)
+    fn, calls = flaky(1, status=409)
+    with pytest.raises(ProviderError):
+        scheduler.run(fn)
+    assert len(calls) == 1
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_run_gives_up_after_max_retries():
+    scheduler = LLMScheduler(max_concurrency=1, max_retries=1, backoff_base_ms=1, backoff_cap_ms=2)
+    fn, calls = flaky(5)
+    with pytest.raises(ProviderError):
+        scheduler.run(fn)
+    assert len(calls) == 2
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_run_enforces_deadline_on_blocking_call():
+    scheduler = LLMScheduler(max_concurrency=1)
+    release = threading.Event()
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run(lambda: release.wait(5), deadline=0.1)
+    assert time.monotonic() - start < 1
+    # The abandoned call keeps its slot until it returns
+    assert scheduler.stats()["in_flight"] == 1
+    release.set()
+    for _ in range(100):
+        if scheduler.stats()["in_flight"] == 0:
+            break
+        time.sleep(0.01)
+    assert scheduler.stats()["in_flight"] == 0
+    assert scheduler.stats()["deadline_exceeded"] == 1
+
+
+def test_arun_enforces_deadline():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def main():
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.arun(slow, deadline=0.05)
+
+    asyncio.run(main())
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_queued_call_rejected_when_no_slot_frees_up():
+    scheduler = LLMScheduler(max_concurrency=1)
+    release = threading.Event()
+    holder = threading.Thread(target=lambda: scheduler.run(lambda: release.wait(5)))
+    holder.start()
+    while scheduler.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run(lambda: "late", deadline=0.05)
+    release.set()
+    holder.join(5)
+
+
+def test_slots_serve_interactive_before_batch():
+    slots = PrioritySlots(1)
+    assert slots.acquire(0, 1)
+    order = []
+
+    def wait(priority, name):
+        assert slots.acquire(priority, 5)
+        order.append(name)
+        slots.release()
+
+    batch = threading.Thread(target=wait, args=(1, "batch"))
+    batch.start()
+    while slots.queued() < 1:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=wait, args=(0, "interactive"))
+    interactive.start()
+    while slots.queued() < 2:
+        time.sleep(0.001)
+    slots.release()
+    batch.join(5)
+    interactive.join(5)
+    assert order == ["interactive", "batch"]
+
+
+def test_token_bucket_reservations():
+    bucket = TokenBucket(per_minute=60)  # one token per second, capacity 60
+    assert bucket.reserve(60, max_wait=0) == 0.0
+    assert bucket.reserve(1, max_wait=0.1) is None
+    wait = bucket.reserve(1, max_wait=2)
+    assert 0.9 < wait <= 1.0
+    assert TokenBucket(per_minute=0).reserve(1000, max_wait=0) == 0.0
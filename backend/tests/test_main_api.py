@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main_api
+
+
+@pytest.fixture
+def client():
+    with TestClient(main_api.app) as c:
+        yield c
+
+
+def chat(client, **body):
+    res = client.post("/chat", json=body)
+    assert res.status_code == 200
+    return res.json()
+
+
+def test_profile_delta_responses(client):
+    first = chat(client, user_input="")
+    sid, version = first["session_id"], first["profile_version"]
+    assert first["profile_delta"] is False
+
+    second = chat(client, session_id=sid, answers={"income.amount": "30k"}, profile_version=version)
+    assert second["profile_delta"] is True
+    assert second["updated_profile"] == {"income": {"amount": 30000}}
+
+    third = chat(client, session_id=sid, answers={"income.stability": "Seasonal"}, profile_version=version)
+    assert third["profile_delta"] is True
+    assert third["updated_profile"] == {"income": {"amount": 30000, "stability": "Seasonal"}}
+
+    full = chat(client, session_id=sid, answers={"debt.has_debt": "no"})
+    assert full["profile_delta"] is False
+    assert full["updated_profile"]["income"] == {"amount": 30000, "stability": "Seasonal", "notes": ""}
+
+
+def test_bare_replies_are_planned_once_per_turn(client):
+    from question_planner import planner_stats
+
+    before = planner_stats()
+    first = chat(client, user_input="")
+    sid = first["session_id"]
+    assert first["new_questions"][0]["key"] == "income.amount"
+
+    second = chat(client, session_id=sid, user_input="Seasonal")
+    assert second["updated_profile"]["income"]["stability"] == "Seasonal"
+    third = chat(client, session_id=sid, user_input="30k")
+    assert third["updated_profile"]["income"]["amount"] == 30000
+
+    after = planner_stats()
+    assert after["plans"] - before["plans"] == 3
+    assert after["direct_turns"] - before["direct_turns"] == 3
+
+
+def test_simulation_paths_are_bounded(client):
+    from projection_engine import MAX_PATHS
+
+    item = {"persona_id": "p", "persona_data": {}, "event_id": "e", "event_data": {}, "selected_choice_id": "c"}
+    assert client.post("/strategist/jobs", json={**item, "simulation_paths": MAX_PATHS + 1}).status_code == 422
+    assert client.post("/strategist/jobs", json={**item, "simulation_paths": -1}).status_code == 422
+
+
+def test_replayed_turn_keeps_its_session_keys(client):
+    import asyncio
+
+    from profile_patch import apply_update, pending_patches
+    from question_planner import ASKED_KEY
+    from report_engine import REPORT_HASH_KEY
+
+    sid = chat(client, user_input="")["session_id"]
+    cache = main_api.session_cache
+    turn = asyncio.run(cache.aget(sid))
+    # Another writer saves first, so this turn's save conflicts and is replayed
+    other = asyncio.run(cache.aget(sid))
+    apply_update(other, {"income": {"amount": 30000}})
+    asyncio.run(cache.aput(sid, other))
+
+    apply_update(turn, {"income": {"stability": "Seasonal"}})
+    turn[ASKED_KEY] = ["debt.has_debt"]
+    turn[REPORT_HASH_KEY] = "turn-report"
+    messages = [{"role": "user", "content": "Seasonal"}, {"role": "assistant", "content": "Thanks"}]
+    turn["messages"].extend(messages)
+    saved, patches = asyncio.run(main_api._save_turn(sid, turn, pending_patches(turn), messages))
+    assert saved is not turn and [p["version"] for p in patches] == [2]
+
+    stored = asyncio.run(cache.areload(sid))
+    assert stored[ASKED_KEY] == ["debt.has_debt"]
+    assert stored[REPORT_HASH_KEY] == "turn-report"
+    assert stored["user_profile"]["income"]["amount"] == 30000
+    assert stored["user_profile"]["income"]["stability"] == "Seasonal"
+    assert stored["messages"][-2:] == messages
@@ -0,0 +1,66 @@
+from profile_patch import (
+    PENDING_KEY,
+    VERSION_KEY,
+    apply_update,
+    deep_merge,
+    delta,
+    folded_changes,
+    mark_persisted,
+    pending_patches,
+)
+
+
+def test_deep_merge_reports_changed_paths():
+    target = {"income": {"amount": 1, "notes": ""}, "debt": {"details": ["a"]}}
+    changes = deep_merge(target, {"income": {"amount": 2, "notes": ""}, "debt": {"details": ["b"]}, "goals": {"x": 1}})
+    assert changes == [(["income", "amount"], 2), (["debt", "details"], ["b"]), (["goals"], {"x": 1})]
+    assert target == {"income": {"amount": 2, "notes": ""}, "debt": {"details": ["b"]}, "goals": {"x": 1}}
+
+
+def test_apply_update_versions_and_skips_noops():
+    session = {"user_profile": {"income": {"amount": None}}}
+    first = apply_update(session, {"income": {"amount": 30000}})
+    assert first == {"version": 1, "changes": [[["income", "amount"], 30000]]}
+    assert apply_update(session, {"income": {"amount": 30000}}) is None
+    assert apply_update(session, None) is None
+    apply_update(session, {"assets": {"savings": 5}})
+    assert session[VERSION_KEY] == 2
+    assert [p["version"] for p in pending_patches(session)] == [1, 2]
+    mark_persisted(session)
+    assert PENDING_KEY not in session
+
+
+def test_delta_brings_an_old_profile_up_to_date():
+    old = {"income": {"amount": None, "stability": None}, "goals": {}}
+    session = {"user_profile": {"income": {"amount": None, "stability": None}, "goals": {}}}
+    apply_update(session, {"income": {"amount": 1}})
+    apply_update(session, {"goals": {"short_term": "bike"}})
+    apply_update(session, {"income": {"amount": 2, "stability": "Seasonal"}})
+    changes = delta(pending_patches(session))
+    assert changes == {"income": {"amount": 2, "stability": "Seasonal"}, "goals": {"short_term": "bike"}}
+    deep_merge(old, changes)
+    assert old == session["user_profile"]
+
+
+def test_patches_rebase_onto_a_newer_profile():
+    # Another writer changed a different field; replaying this turn's patches keeps both
+    mine = {"user_profile": {"income": {"amount": None}, "assets": {"savings": None}}}
+    patch = apply_update(mine, {"income": {"amount": 30000}})
+    latest = {"user_profile": {"income": {"amount": None}, "assets": {"savings": 5000}}, VERSION_KEY: 3}
+    rebased = apply_update(latest, delta([patch]))
+    assert latest["user_profile"] == {"income": {"amount": 30000}, "assets": {"savings": 5000}}
+    assert rebased["version"] == 4
+
+
+def test_folded_changes_do_not_overlap():
+    patches = [
+        {"version": 1, "changes": [[["income", "new"], {"deep": [1]}], [["goals", "a"], 1]]},
+        {"version": 2, "changes": [[["income", "new", "deep2"], 3]]},
+        {"version": 3, "changes": [[["goals"], {"b": 2}]]},
+        {"version": 4, "changes": [[["goals", "c"], 3]]},
+    ]
+    assert folded_changes(patches) == [
+        (["income", "new"], {"deep": [1], "deep2": 3}),
+        (["goals"], {"b": 2, "c": 3}),
+    ]
+    assert patches[0]["changes"][0][1] == {"deep": [1]}
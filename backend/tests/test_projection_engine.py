@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from projection_engine import health_score, outlook, project, project_choices, simulate, volatility_model
+
+# Ramesh (persona_001, delivery partner) facing "The Biryani Party"
+RAMESH = {"income": 22000, "savings": 12000, "debt": 0, "fixed_expenses": 14000}
+PARTY = [
+    {"id": "c1", "text": "Join the party", "financial_impact": -1200},
+    {"id": "c2", "text": "Skip and eat at home", "financial_impact": 0},
+    {"id": "c3", "text": "Join but use BNPL", "financial_impact": 0, "future_liability": 1300},
+]
+
+BEFORE = {"savings": 20000, "debt": 5000, "income": 30000, "fixed_expenses": 22000}
+CHOICES = [
+    {"id": "spend", "financial_impact": -15000, "future_liability": 0},
+    {"id": "borrow", "financial_impact": 0, "future_liability": 1500},
+]
+VOLATILE = volatility_model({"income_volatility": "High (Daily Payouts)"})
+
+
+def test_outlooks_for_a_known_persona():
+    trajectories = project_choices([(RAMESH, PARTY)])[0]
+    join, skip, bnpl = (trajectories[c] for c in ("c1", "c2", "c3"))
+
+    assert [outlook(join, m)["savings"] for m in (3, 6, 12)] == [8400, 4800, 0]
+    assert [outlook(join, m)["cumulative_impact"] for m in (3, 6, 12)] == [-3600, -7200, -14400]
+    assert [outlook(join, m)["health"] for m in (3, 6, 12)] == pytest.approx([44.0909, 35.9091, 25.0], abs=1e-4)
+    assert join["recovery_months"] == 1
+
+    assert outlook(skip, 12) == {"cumulative_impact": 0, "savings": 12000, "debt": 0, "health": 50.0, "debt_accumulation": 0}
+    assert skip["recovery_months"] == 0
+
+    assert [outlook(bnpl, m)["debt"] for m in (3, 6, 12)] == [3900, 7800, 15600]
+    assert [outlook(bnpl, m)["debt_accumulation"] for m in (3, 6, 12)] == [3900, 7800, 15600]
+    assert [outlook(bnpl, m)["health"] for m in (3, 6, 12)] == pytest.approx([41.1364, 32.2727, 25.0], abs=1e-4)
+    assert outlook(bnpl, 13) is None
+
+
+def test_vectorized_rows_match_single_row_projections():
+    other = {"income": 30000, "savings": 20000, "debt": 5000, "fixed_expenses": 22000}
+    batch = project_choices([(RAMESH, PARTY), (other, PARTY[:1]), ({}, [])], horizon=6)
+    assert batch[0] == project_choices([(RAMESH, PARTY)], horizon=6)[0]
+    assert batch[1] == project_choices([(other, PARTY[:1])], horizon=6)[0]
+    assert batch[2] == {}
+    assert len(batch[0]["c1"]["savings"]) == 7
+
+
+def test_liability_is_clamped_at_zero():
+    out = project(savings=1000, debt=2000, income=10000, fixed_expenses=5000, impact=-600, liability=-500, horizon=3)
+    assert out["debt"].tolist() == [[2000, 2000, 2000, 2000]]
+    # Savings never go below zero either
+    assert out["savings"].tolist() == [[1000, 400, 0, 0]]
+    assert out["recovery_months"].tolist() == [1]
+
+
+def test_health_score():
+    income = np.array([20000, 20000, 20000, 0])
+    savings = np.array([20000, 5000, 0, 5000])
+    debt = np.array([0, 5000, 40000, 0])
+    # savings ratio caps at 50, debt ratio bottoms out at 0, no income scores 0
+    assert health_score(savings, income, debt).tolist() == [50.0, 25.0, 0.0, 0.0]
+
+
+def test_report_trajectory_for_a_known_persona():
+    from strategist_agent import shared_agent
+
+    persona = {"financial_baseline": {"avg_monthly_income": 22000, "savings_balance": 12000, "debt_total": 0, "fixed_expenses": 14000}}
+    report = shared_agent().analyze_decision("persona_001", persona, "evt_002_peer_pressure", {"title": "The Biryani Party", "choices": PARTY}, "c1")
+    trajectory = report["financial_trajectory"]
+    assert trajectory["before"] == RAMESH
+    assert trajectory["3_month_projection"] == {"cumulative_impact": -3600, "trend": "negative"}
+    assert trajectory["6_month_projection"] == {"projected_savings": 4800, "debt_trajectory": 0, "financial_health_score": pytest.approx(35.9091, abs=1e-4)}
+    assert trajectory["12_month_projection"] == {"projected_savings": 0, "debt_trajectory": 0, "financial_health_score": 25.0}
+
+
+def test_simulate_is_reproducible_for_a_seed():
+    first = simulate(BEFORE, CHOICES, VOLATILE, n_paths=500, seed=7)
+    assert first == simulate(BEFORE, CHOICES, VOLATILE, n_paths=500, seed=7)
+    assert first != simulate(BEFORE, CHOICES, VOLATILE, n_paths=500, seed=8)
+
+
+def test_simulate_percentile_bands_are_ordered():
+    out = simulate(BEFORE, CHOICES, VOLATILE, horizon=6, n_paths=1000, seed=1)
+    assert set(out) == {"spend", "borrow"}
+    for bands in out.values():
+        for name in ("savings", "debt", "health"):
+            rows = np.array([bands[name][p] for p in ("p5", "p25", "p50", "p75", "p95")])
+            assert rows.shape == (5, 7)
+            assert (np.diff(rows, axis=0) >= 0).all()
+        assert 0 <= bands["probability_savings_depleted"] <= 1
+
+
+def test_simulate_depletion_probability_bounds():
+    calm = {"income_cv": 0.0, "expense_cv": 0.0, "shock_probability": 0.0, "shock_size": 0.0}
+    broke = simulate({**BEFORE, "savings": 0}, [{"id": "a", "financial_impact": -1000}], calm, n_paths=50, seed=0)
+    assert broke["a"]["probability_savings_depleted"] == 1.0
+    safe = simulate(BEFORE, [{"id": "a", "financial_impact": 500}], calm, n_paths=50, seed=0)
+    assert safe["a"]["probability_savings_depleted"] == 0.0
+    # With no volatility every path is the deterministic projection
+    assert safe["a"]["savings"]["p5"] == safe["a"]["savings"]["p95"] == [20000 + 500 * t for t in range(13)]
+    assert simulate(BEFORE, [], calm) == {}
+
+
+def test_initial_state_clamps_simulation_paths():
+    from projection_engine import MAX_PATHS
+    from strategist_agent import shared_agent
+
+    event = {"choices": [{"id": "c"}]}
+    agent = shared_agent()
+    assert agent._initial_state("p", {}, "e", event, "c", 10 ** 9)["simulation_paths"] == MAX_PATHS
+    assert agent._initial_state("p", {}, "e", event, "c", -5)["simulation_paths"] == 0
+    assert agent._initial_state("p", {}, "e", event, "c", None)["simulation_paths"] == 0
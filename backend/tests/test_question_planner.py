@@ -0,0 +1,91 @@
+import pytest
+
+import question_planner
+from question_planner import match_reply, parse_value, plan, planner_stats
+
+
+def empty_profile():
+    return {
+        "income": {"amount": None, "stability": None, "notes": ""},
+        "debt": {"has_debt": None, "details": [], "status": "incomplete"},
+        "assets": {"savings": None, "investments": [], "liquidity": None},
+        "goals": {"short_term": None, "long_term": None},
+        "psychology": {"risk_tolerance": None, "spending_habits": None},
+    }
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [("30000", 30000), ("30k", 30000), ("1.5 lakh", 150000), ("₹40,000", 40000), ("Rs. 2 cr", 20000000), (12.5, 12.5), ("-5", None), (-5, None), ("lots", None), (True, None)],
+)
+def test_parse_number(raw, expected):
+    assert parse_value("income.amount", raw) == expected
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [("Seasonal", "Seasonal"), ("seasonal", "Seasonal"), ("2", "Variable / gig work"), ("gig", "Variable / gig work"), ("fix", "Fixed salary"), ("5", None), ("s", None), ("", None)],
+)
+def test_parse_select(raw, expected):
+    assert parse_value("income.stability", raw) == expected
+
+
+@pytest.mark.parametrize("raw, expected", [("yes", True), ("Nope.", False), ("haan", True), (False, False), ("maybe", None)])
+def test_parse_yes_no(raw, expected):
+    assert parse_value("debt.has_debt", raw) is expected
+
+
+def test_parse_text_and_unknown_keys():
+    assert parse_value("goals.short_term", "  Build   an emergency fund ") == "Build an emergency fund"
+    assert parse_value("debt.details", "Bike loan 40k; Phone EMI") == ["Bike loan 40k", "Phone EMI"]
+    assert parse_value("goals.short_term", "   ") is None
+    assert parse_value("not.a.question", "30k") is None
+
+
+def test_match_reply_tries_every_asked_question():
+    asked = ["income.amount", "income.stability"]
+    assert match_reply("30k", asked) == {"income.amount": "30k"}
+    assert match_reply("Seasonal", asked) == {"income.stability": "Seasonal"}
+    assert match_reply("I get paid on the 1st", asked) is None
+    assert match_reply("30k", None) is None
+    assert match_reply("30k", ["unknown.key"]) is None
+
+
+def test_match_reply_free_text_for_a_single_text_question():
+    assert match_reply("Buy a house", ["goals.long_term", "psychology.risk_tolerance"]) == {"goals.long_term": "Buy a house"}
+    assert match_reply("medium", ["goals.long_term", "psychology.risk_tolerance"]) == {"psychology.risk_tolerance": "medium"}
+    assert match_reply("What counts as long-term?", ["goals.long_term"]) is None
+    # With two text questions the reply is ambiguous and goes to the agent
+    assert match_reply("Buy a house", ["goals.short_term", "goals.long_term"]) is None
+
+
+def test_plan_follows_catalog_order_and_conditions():
+    profile = empty_profile()
+    first = plan(profile)
+    assert [q["key"] for q in first.questions] == ["income.amount", "income.stability"]
+    assert all("when" not in q for q in first.questions)
+    assert "debt.details" not in first.missing
+    assert not first.needs_analysis
+
+    profile["income"].update(amount=30000, stability="Seasonal")
+    profile["debt"]["has_debt"] = True
+    assert [q["key"] for q in plan(profile).questions] == ["debt.details", "assets.savings"]
+
+
+def test_plan_hands_off_to_analysis_when_complete():
+    profile = empty_profile()
+    for key in [q["key"] for q in question_planner.CATALOG]:
+        section, field = key.split(".")
+        profile[section][field] = ["x"] if key == "debt.details" else "x"
+    done = plan(profile)
+    assert done.needs_analysis and done.questions == [] and done.missing == [] and done.completeness == 1.0
+
+
+def test_plan_without_count_leaves_stats_alone():
+    before = planner_stats()
+    plan(empty_profile(), count=False)
+    assert planner_stats() == before
+    plan(empty_profile())
+    after = planner_stats()
+    assert after["plans"] == before["plans"] + 1
+    assert after["planned_questions"] == before["planned_questions"] + 2
@@ -0,0 +1,49 @@
+import copy
+
+from report_engine import build_report, render_text, report_stats
+
+PROFILE = {
+    "income": {"amount": 31337, "stability": "Seasonal", "notes": ""},
+    "debt": {"has_debt": False, "details": [], "status": "complete"},
+    "assets": {"savings": 40000, "investments": [], "liquidity": "1-3 months"},
+    "goals": {"short_term": "Build an emergency fund", "long_term": None},
+    "psychology": {"risk_tolerance": "Low", "spending_habits": None},
+}
+
+
+def built_sections(before):
+    return report_stats()["sections_built"] - before["sections_built"]
+
+
+def test_unchanged_profile_reuses_every_section():
+    before = report_stats()
+    first = build_report(PROFILE)
+    assert built_sections(before) == 3
+
+    before = report_stats()
+    again = build_report(copy.deepcopy(PROFILE))
+    assert built_sections(before) == 0
+    assert again["hash"] == first["hash"]
+    assert all(again["sections"][name] is first["sections"][name] for name in first["sections"])
+    assert render_text(again) is render_text(first)
+
+
+def test_only_sections_reading_changed_inputs_are_rebuilt():
+    first = build_report(PROFILE)
+
+    goals = copy.deepcopy(PROFILE)
+    goals["goals"]["long_term"] = "Buy a house"
+    before = report_stats()
+    report = build_report(goals)
+    # mirror reads the whole profile, lesson reads goals; diagnosis is reused
+    assert built_sections(before) == 2
+    assert report["sections"]["diagnosis"] is first["sections"]["diagnosis"]
+    assert report["hash"] != first["hash"]
+
+    savings = copy.deepcopy(PROFILE)
+    savings["assets"]["savings"] = 1000
+    before = report_stats()
+    report = build_report(savings)
+    # lesson depends on the diagnosis, so it is rebuilt with it
+    assert built_sections(before) == 3
+    assert report["sections"]["diagnosis"]["content"]["resilience"] == "fragile"
@@ -0,0 +1,40 @@
+import pytest
+
+import storage
+from session_cache import SessionCache
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    (tmp_path / "sessions").mkdir()
+    (tmp_path / "reports").mkdir()
+    backend = storage.JsonFileBackend(str(tmp_path / "sessions"), str(tmp_path / "reports"))
+    monkeypatch.setattr(storage, "_backend", backend)
+    return backend
+
+
+def test_get_returns_a_private_copy(backend):
+    cache = SessionCache()
+    cache.put("s1", {"user_profile": {"income": {"amount": 1}}, "messages": []})
+    session = cache.get("s1")
+    session["user_profile"]["income"]["amount"] = 2
+    session["messages"].append({"role": "user", "content": "hi"})
+    assert cache.get("s1")["user_profile"]["income"]["amount"] == 1
+    assert cache.get("s1")["messages"] == []
+
+
+def test_failed_save_evicts_cached_copy(backend, monkeypatch):
+    cache = SessionCache()
+    cache.put("s1", {"user_profile": {}, "messages": []})
+    session = cache.get("s1")
+    session["user_profile"]["goals"] = {"short_term": "bike"}
+
+    def fail(session_id, session):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(backend, "save_session", fail)
+        with pytest.raises(OSError):
+            cache.put("s1", session)
+    assert cache.stats()["entries"] == 0
+    assert "goals" not in cache.get("s1")["user_profile"]
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_do_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", fn)))
+    leader.start()
+    started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(flight.do("k", fn)))
+    waiter.start()
+    while flight.stats()["coalesced"] == 0:
+        pass
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [("value", False), ("value", True)]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_ado_shares_result_and_error():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*(flight.ado("k", fn) for _ in range(5)))
+        assert results == [(42, False)] + [(42, True)] * 4
+        errors = await asyncio.gather(*(flight.ado("e", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors)
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await waiter == ("done", True)
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_cancelled_waiter_does_not_cancel_leader():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.ado("k", fn))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        assert await leader == ("done", False)
+
+    asyncio.run(main())
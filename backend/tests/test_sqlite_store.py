@@ -0,0 +1,98 @@
+import threading
+
+import pytest
+
+from profile_patch import apply_update
+from sqlite_store import SqliteBackend, import_json_dir
+from storage import REVISION_KEY, JsonFileBackend, VersionConflict
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SqliteBackend(str(tmp_path / "store.db"))
+
+
+def new_session():
+    return {"user_profile": {"income": {"amount": None}, "goals": {}}, "messages": []}
+
+
+def test_save_and_load_round_trip(backend):
+    session = new_session()
+    session["messages"].append({"role": "user", "content": "hi"})
+    backend.save_session("s1", session)
+    apply_update(session, {"income": {"amount": 30000}, "goals": {"short_term": "bike"}})
+    session["messages"].append({"role": "assistant", "content": "hello"})
+    backend.save_session("s1", session)
+
+    loaded = backend.load_session("s1")
+    assert loaded["user_profile"] == {"income": {"amount": 30000}, "goals": {"short_term": "bike"}}
+    assert [m["content"] for m in loaded["messages"]] == ["hi", "hello"]
+    assert loaded[REVISION_KEY] == 2
+    assert backend.load_revision("s1") == 2
+    assert [p["version"] for p in backend.load_profile_patches("s1", 0)] == [1]
+
+
+def test_stale_revision_is_rejected(backend):
+    backend.save_session("s1", new_session())
+    first, second = backend.load_session("s1"), backend.load_session("s1")
+    backend.save_session("s1", first)
+    with pytest.raises(VersionConflict):
+        backend.save_session("s1", second)
+
+
+def test_only_one_concurrent_creator_wins(backend):
+    results = []
+    barrier = threading.Barrier(8)
+
+    def create():
+        barrier.wait()
+        try:
+            backend.save_session("new", new_session())
+            results.append("saved")
+        except VersionConflict:
+            results.append("conflict")
+
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == ["conflict"] * 7 + ["saved"]
+
+
+def test_creating_from_a_stale_revision_is_rejected(backend):
+    session = new_session()
+    session[REVISION_KEY] = 2
+    with pytest.raises(VersionConflict):
+        backend.save_session("gone", session)
+
+
+def test_import_json_dir(backend, tmp_path):
+    sessions, reports = tmp_path / "sessions", tmp_path / "reports"
+    sessions.mkdir()
+    reports.mkdir()
+    source = JsonFileBackend(str(sessions), str(reports))
+    session = new_session()
+    session["messages"].append({"role": "user", "content": "hi"})
+    source.save_session("s1", session)
+    source.save_session("s1", session)
+    source.save_report("s1", {"report": "text"})
+
+    assert import_json_dir(backend, str(sessions), str(reports)) == {"sessions": 1, "reports": 1, "failed": 0}
+    assert backend.load_session("s1")["messages"] == [{"role": "user", "content": "hi"}]
+    assert backend.load_report("s1")["report"] == "text"
+
+
+def test_overlapping_patches_round_trip(backend):
+    session = new_session()
+    backend.save_session("s1", session)
+    # One turn can create a section and then write into it
+    apply_update(session, {"income": {"new.key": {"deep": [1, 2]}}})
+    apply_update(session, {"income": {"new.key": {"deep2": 3}}})
+    apply_update(session, {"goals": {"short_term": "bike"}})
+    apply_update(session, {"goals": {"short_term": {"what": "bike", "when": 2027}}})
+    apply_update(session, {"goals": {"short_term": {"when": 2028}}})
+    expected = session["user_profile"]
+    backend.save_session("s1", session)
+    assert backend.load_session("s1")["user_profile"] == expected
+    assert expected["income"]["new.key"] == {"deep": [1, 2], "deep2": 3}
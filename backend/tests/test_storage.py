@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+import storage
+from profile_patch import apply_update
+from storage import JsonFileBackend, VersionConflict, write_lock
+
+
+@pytest.fixture
+def backend(tmp_path):
+    (tmp_path / "sessions").mkdir()
+    (tmp_path / "reports").mkdir()
+    return JsonFileBackend(str(tmp_path / "sessions"), str(tmp_path / "reports"))
+
+
+def new_session():
+    return {"user_profile": {"income": {"amount": None}}, "messages": []}
+
+
+def test_save_and_load_round_trip(backend):
+    session = new_session()
+    apply_update(session, {"income": {"amount": 30000}})
+    session["messages"].append({"role": "user", "content": "hi"})
+    backend.save_session("s1", session)
+    assert session[storage.REVISION_KEY] == 1
+
+    loaded = backend.load_session("s1")
+    assert loaded["user_profile"] == {"income": {"amount": 30000}}
+    assert loaded["messages"] == [{"role": "user", "content": "hi"}]
+    assert backend.load_revision("s1") == 1
+    assert backend.load_revision("missing") is None
+
+
+def test_stale_revision_is_rejected(backend):
+    backend.save_session("s1", new_session())
+    first, second = backend.load_session("s1"), backend.load_session("s1")
+    first["messages"].append({"role": "user", "content": "first"})
+    backend.save_session("s1", first)
+    second["messages"].append({"role": "user", "content": "second"})
+    with pytest.raises(VersionConflict):
+        backend.save_session("s1", second)
+    assert [m["content"] for m in backend.load_session("s1")["messages"]] == ["first"]
+
+
+@pytest.mark.parametrize("flock", [True, False], ids=["fcntl", "no-fcntl"])
+def test_only_one_concurrent_creator_wins(backend, monkeypatch, flock):
+    if not flock:
+        monkeypatch.setattr(storage, "fcntl", None)
+        monkeypatch.setattr(storage, "_local_write_locks", [threading.Lock() for _ in range(storage.SESSION_LOCK_STRIPES)])
+    results = []
+    barrier = threading.Barrier(8)
+
+    def create(i):
+        session = new_session()
+        session["messages"].append({"role": "user", "content": f"writer {i}"})
+        barrier.wait()
+        try:
+            backend.save_session("new", session)
+            results.append("saved")
+        except VersionConflict:
+            results.append("conflict")
+
+    threads = [threading.Thread(target=create, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(results) == ["conflict"] * 7 + ["saved"]
+    assert len(backend.load_session("new")["messages"]) == 1
+
+
+def test_creating_from_a_stale_revision_is_rejected(backend):
+    session = new_session()
+    session[storage.REVISION_KEY] = 3
+    with pytest.raises(VersionConflict):
+        backend.save_session("gone", session)
+
+
+def test_write_lock_is_exclusive():
+    inside = []
+    overlaps = []
+
+    def worker():
+        for _ in range(20):
+            with write_lock("s1"):
+                inside.append(1)
+                if len(inside) > 1:
+                    overlaps.append(1)
+                time.sleep(0.0005)
+                inside.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not overlaps
+
+
+def test_write_lock_without_fcntl_is_process_local(monkeypatch):
+    monkeypatch.setattr(storage, "fcntl", None)
+    monkeypatch.setattr(storage, "_local_write_locks", [threading.Lock() for _ in range(storage.SESSION_LOCK_STRIPES)])
+    with write_lock("s1"):
+        lock = storage._local_write_locks[storage._stripe("s1")]
+        assert lock.locked()
+    assert not lock.locked()
+
+
+def test_uncommitted_log_tail_is_ignored_and_overwritten(backend):
+    session = new_session()
+    session["messages"].append({"role": "user", "content": "one"})
+    backend.save_session("s1", session)
+    log_path = backend._log_path("s1")
+    # An interrupted save: one complete line and a truncated one past the committed length
+    with open(log_path, "ab") as f:
+        f.write(b'{"role":"user","content":"lost"}\n{"role": "us')
+
+    loaded = backend.load_session("s1")
+    assert [m["content"] for m in loaded["messages"]] == ["one"]
+
+    loaded["messages"].append({"role": "assistant", "content": "two"})
+    backend.save_session("s1", loaded)
+    with open(log_path, "rb") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert [m["content"] for m in backend.load_session("s1")["messages"]] == ["one", "two"]
+
+
+def test_shortened_history_restarts_the_log(backend):
+    session = new_session()
+    session["messages"] = [{"role": "user", "content": str(i)} for i in range(3)]
+    backend.save_session("s1", session)
+    session["messages"] = session["messages"][:1]
+    backend.save_session("s1", session)
+    assert [m["content"] for m in backend.load_session("s1")["messages"]] == ["0"]
+
+
+def test_backends_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        storage.StorageBackend()
+
+    class Partial(storage.StorageBackend):
+        def load_session(self, session_id):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+import mock_llm
+from llm_cache import response_cache
+from strategist_agent import StrategistAgent
+
+PERSONA = {
+    "name": "Ravi",
+    "occupation": "Delivery rider",
+    "financial_baseline": {"avg_monthly_income": 30000, "savings_balance": 20000, "debt_total": 5000, "fixed_expenses": 22000},
+}
+EVENT = {
+    "title": "Bike repair",
+    "choices": [
+        {"id": "pay", "text": "Pay from savings", "financial_impact": -8000},
+        {"id": "loan", "text": "Borrow from a lender", "financial_impact": 0, "future_liability": 900},
+    ],
+}
+
+
+@pytest.fixture
+def provider_calls(monkeypatch):
+    calls = []
+    predict = mock_llm.MockChatModel.predict_messages
+
+    def counting(self, messages, *args, **kwargs):
+        calls.append(messages)
+        return predict(self, messages, *args, **kwargs)
+
+    monkeypatch.setattr(mock_llm.MockChatModel, "predict_messages", counting)
+    response_cache.clear()
+    return calls
+
+
+def test_repeated_analysis_is_served_from_the_cache(provider_calls):
+    agent = StrategistAgent()
+    first = agent.analyze_decision("ravi", PERSONA, "repair", EVENT, "pay")
+    assert len(provider_calls) == 2  # analysis and behavioral insights
+    second = agent.analyze_decision("ravi", PERSONA, "repair", EVENT, "pay")
+    assert len(provider_calls) == 2
+    assert second["immediate_analysis"] == first["immediate_analysis"]
+    assert second["behavioral_analysis"] == first["behavioral_analysis"]
+
+
+def test_failed_job_resumes_without_repeating_completed_nodes(tmp_path, monkeypatch):
+    import jobs
+    import llm_client
+    import strategist_agent
+
+    agent = StrategistAgent()
+    calls = {}
+    for name in ("_extract_context", "_calculate_second_order", "_build_decision_tree", "_generate_behavioral_insights", "_analyze_choice"):
+        method = getattr(agent, name)
+
+        def counted(state, name=name, method=method):
+            calls[name] = calls.get(name, 0) + 1
+            if name == "_analyze_choice" and calls[name] == 1:
+                raise llm_client.LLMUnavailable("provider down")
+            return method(state)
+
+        setattr(agent, name, counted)
+    agent.workflow = agent._build_workflow()
+    monkeypatch.setattr(strategist_agent, "_shared_agent", agent)
+    monkeypatch.setattr(jobs, "JOB_POLL_S", 0.01)
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+
+    queue = jobs.JobQueue(str(tmp_path / "jobs.db"), workers=1)
+    queue.start()
+    try:
+        payload = {"persona_id": "ravi", "persona_data": PERSONA, "event_id": "repair", "event_data": EVENT, "selected_choice_id": "pay", "run_id": agent.new_run_id()}
+        job_id = queue.submit("strategist.analyze", payload)
+        deadline = time.monotonic() + 10
+        while queue.get(job_id)["status"] not in ("done", "failed") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        job = queue.get(job_id)
+    finally:
+        queue.stop()
+
+    assert (job["status"], job["attempts"]) == ("done", 2)
+    assert "error" not in job["result"]
+    assert job["result"]["immediate_analysis"]
+    assert calls == {"_extract_context": 1, "_calculate_second_order": 1, "_build_decision_tree": 1, "_generate_behavioral_insights": 1, "_analyze_choice": 2}
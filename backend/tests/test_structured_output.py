@@ -0,0 +1,70 @@
+import json
+import time
+
+from structured_output import ANALYSIS, CHOICE_ANALYSIS, PLAN, extract_json, iter_object_spans, parse
+
+PLAN_JSON = json.dumps({"action": "RESPOND", "tool": None, "tool_args": {}, "updated_profile_data": {}, "response": "Hi {there}"})
+
+
+def test_extracts_plain_fenced_and_wrapped_json():
+    expected = json.loads(PLAN_JSON)
+    assert extract_json(PLAN_JSON) == expected
+    assert extract_json(f"```json\n{PLAN_JSON}\n```") == expected
+    assert extract_json(f"Sure! Here's the plan: {PLAN_JSON} Let me know.") == expected
+
+
+def test_braces_and_quotes_in_prose_and_strings():
+    text = "It's {not json} but this is: " + json.dumps({"response": 'a "}" inside', "n": {"x": 1}})
+    assert extract_json(text) == {"response": 'a "}" inside', "n": {"x": 1}}
+
+
+def test_no_json_returns_none():
+    assert extract_json("no json here") is None
+    assert extract_json("") is None
+    assert extract_json(None) is None
+    result = parse("plain text", PLAN)
+    assert result.value is None and result.data is None and result.error
+
+
+def test_truncated_output_falls_back_to_inner_objects():
+    text = '{"action": "RESPOND", "updated_profile_data": {"income": {"amount": 1}}, "response": "cut of'
+    assert extract_json(text) == {"income": {"amount": 1}}
+
+
+def test_unbalanced_braces_are_linear():
+    text = "{" * 200_000 + PLAN_JSON
+    start = time.perf_counter()
+    assert extract_json(text) == json.loads(PLAN_JSON)
+    assert time.perf_counter() - start < 2
+    text = "}" * 200_000 + "{" * 200_000
+    start = time.perf_counter()
+    assert extract_json(text) is None
+    assert time.perf_counter() - start < 2
+
+
+def test_huge_completion():
+    big = {"action": "RESPOND", "response": "x" * 1_000_000}
+    text = "prefix " + json.dumps(big) + " suffix"
+    start = time.perf_counter()
+    assert extract_json(text) == big
+    assert time.perf_counter() - start < 2
+    assert list(iter_object_spans("a {} b {}")) == [(2, 4), (7, 9)]
+
+
+def test_plan_validation():
+    assert parse(PLAN_JSON, PLAN).value.response == "Hi {there}"
+    missing_tool = parse(json.dumps({"action": "CALL_TOOL"}), PLAN)
+    assert missing_tool.value is None and "tool" in missing_tool.error
+    assert parse(json.dumps({"action": "SHOUT"}), PLAN).value is None
+
+
+def test_lenient_schemas():
+    analysis = parse(json.dumps({"next_questions": [{"key": "a"}, "junk"], "updated_profile": [], "finish": 1}), ANALYSIS).value
+    assert analysis.next_questions == [{"key": "a"}]
+    assert analysis.updated_profile == {}
+    assert analysis.finish is True
+
+    choice = parse(json.dumps({"sustainability_score": "6.5", "risk_assessment": "low"}), CHOICE_ANALYSIS).value
+    assert choice.sustainability_score == 6
+    assert choice.opportunity_cost == "N/A"
+    assert parse(PLAN_JSON, CHOICE_ANALYSIS).value is None
@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import time
+
+from tracing import current_trace, registry, render_prometheus, span, start_trace, traced
+
+
+def test_nested_spans_finish_inside_their_parent():
+    trace = contextvars.copy_context().run(_nested)
+    outer, inner_a, inner_b = (next(s for s in trace.spans if s.name == n) for n in ("test.outer", "test.a", "test.b"))
+    # Spans are recorded in finish order: children before their parent
+    assert [s.name for s in trace.spans] == ["test.a", "test.b", "test.outer"]
+    assert outer.start <= inner_a.start <= inner_b.start
+    assert outer.duration >= inner_a.duration + inner_b.duration
+    assert inner_a.attributes == {"cache_hit": 1}
+    assert trace.server_timing().startswith("test_a_x;dur=")
+
+
+def _nested():
+    trace = start_trace()
+    with span("test.outer"):
+        with span("test.a", step="x") as s:
+            s.set(cache_hit=1)
+            time.sleep(0.002)
+        traced("test.b")(time.sleep)(0.002)
+    return trace
+
+
+def test_traces_are_isolated_per_task():
+    async def handle(name):
+        trace = start_trace()
+        with span(f"test.{name}"):
+            await asyncio.sleep(0.01)
+        return [s.name for s in trace.spans]
+
+    async def main():
+        return await asyncio.gather(handle("first"), handle("second"))
+
+    assert asyncio.run(main()) == [["test.first"], ["test.second"]]
+    assert current_trace() is None
+
+
+def test_spans_feed_histograms_and_counters():
+    registry.reset()
+    with span("test.llm", model="m") as s:
+        s.set(prompt_tokens=12)
+    with span("test.llm", model="m"):
+        pass
+    text = render_prometheus()
+    assert 'stage_duration_seconds_count{model="m",stage="test.llm"} 2' in text
+    assert 'llm_prompt_tokens_total{model="m",stage="test.llm"} 12' in text
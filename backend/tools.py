@@ -1,6 +1,9 @@
 from typing import Any, Dict, List
 import json
-from llm_client import chat
+from llm_client import chat, achat
+from profile_patch import apply_update
+from report_engine import build_report, render_json, render_text
+from structured_output import ANALYSIS, parse
 
 
 def profile_store_get(session_state: Dict[str, Any]) -> Dict[str, Any]:
@@ -8,15 +11,9 @@ def profile_store_get(session_state: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def profile_store_update(session_state: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
-    profile = session_state.setdefault("user_profile", {})
-    # shallow merge for top-level keys
-    for k, v in update.items():
-        if k in profile and isinstance(profile[k], dict) and isinstance(v, dict):
-            profile[k].update(v)
-        else:
-            profile[k] = v
-    session_state["user_profile"] = profile
-    return profile
+    # Deep merge, recorded as a versioned patch so storage writes only the changed paths
+    apply_update(session_state, update)
+    return session_state.get("user_profile", {})
 
 
 def calculator_tool(args: Dict[str, Any]) -> Dict[str, Any]:
@@ -77,6 +74,30 @@ def question_generator(args: Dict[str, Any]) -> Dict[str, Any]:
     return {"question": q}
 
 
+ANALYSIS_SYSTEM_PROMPT = (
+    "You are a financial analysis assistant. Receive a JSON user profile and return\n"
+    "a JSON object with keys: updated_profile (partial updates), next_questions (array of question objects),\n"
+    "finish (boolean) to indicate whether to stop asking more questions, and explanation (short string).\n"
+    "Only return JSON. Keep it concise and machine-readable."
+)
+
+
+def _analysis_messages(args: Dict[str, Any]) -> List[Dict[str, Any]]:
+    profile = args.get("profile", {})
+    rounds = int(args.get("rounds", 1))
+    user_msg = json.dumps({"profile": profile, "rounds": rounds})
+    return [{"role": "system", "content": ANALYSIS_SYSTEM_PROMPT}, {"role": "user", "content": user_msg}]
+
+
+def _parse_analysis(content: str) -> Dict[str, Any]:
+    # Extract the JSON object (tolerating prose and code fences) and normalise its fields
+    result = parse(content, ANALYSIS)
+    if result.value is None:
+        # Fallback heuristic: ask for structured questions based on keys missing
+        return {"updated_profile": {}, "next_questions": [], "finish": True, "explanation": "LLM returned non-JSON"}
+    return result.value.model_dump()
+
+
 def analysis_agent(args: Dict[str, Any]) -> Dict[str, Any]:
     """Call the LLM to analyze a profile and suggest profile updates and next questions.
 
@@ -84,48 +105,29 @@ def analysis_agent(args: Dict[str, Any]) -> Dict[str, Any]:
     Returns structured JSON:
     {"updated_profile": {...}, "next_questions": [...], "finish": bool, "explanation": str}
     """
-    profile = args.get("profile", {})
-    rounds = int(args.get("rounds", 1))
-
-    system = (
-        "You are a financial analysis assistant. Receive a JSON user profile and return\n"
-        "a JSON object with keys: updated_profile (partial updates), next_questions (array of question objects),\n"
-        "finish (boolean) to indicate whether to stop asking more questions, and explanation (short string).\n"
-        "Only return JSON. Keep it concise and machine-readable."
-    )
+    try:
+        res = chat(_analysis_messages(args))
+        return _parse_analysis(res.get("content", ""))
+    except Exception as e:
+        return {"updated_profile": {}, "next_questions": [], "finish": True, "explanation": str(e)}
 
-    user_msg = json.dumps({"profile": profile, "rounds": rounds})
 
+async def aanalysis_agent(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Async variant of `analysis_agent`; same arguments and return shape."""
     try:
-        res = chat([{"role": "system", "content": system}, {"role": "user", "content": user_msg}])
-        content = res.get("content", "")
-        # Attempt to extract JSON
-        try:
-            j = json.loads(content)
-        except Exception:
-            import re
-
-            m = re.search(r"(\{.*\})", content, re.DOTALL)
-            if m:
-                j = json.loads(m.group(1))
-            else:
-                # Fallback heuristic: ask for structured questions based on keys missing
-                j = {"updated_profile": {}, "next_questions": [], "finish": True, "explanation": "LLM returned non-JSON"}
-
-        # Ensure keys exist
-        return {
-            "updated_profile": j.get("updated_profile", {}),
-            "next_questions": j.get("next_questions", []),
-            "finish": bool(j.get("finish", False)),
-            "explanation": j.get("explanation", ""),
-        }
+        res = await achat(_analysis_messages(args))
+        return _parse_analysis(res.get("content", ""))
     except Exception as e:
         return {"updated_profile": {}, "next_questions": [], "finish": True, "explanation": str(e)}
 
 
-def report_generator(profile: Dict[str, Any]) -> Dict[str, Any]:
-    # Minimal report generator — in production, call an LLM or templating engine
-    mirror = json.dumps(profile, indent=2)
-    diagnosis = "Based on the data, an initial diagnosis would be prepared here."
-    lesson = "Actionable lesson: prioritize emergency savings, reduce high-interest debt."
-    return {"report": f"The Mirror:\n{mirror}\n\nThe Diagnosis:\n{diagnosis}\n\nThe Lesson:\n{lesson}"}
+def report_generator(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the Mirror/Diagnosis/Lesson report for args["profile"].
+
+    Sections are cached by their inputs (see `report_engine`), so repeating the
+    call for an unchanged profile rebuilds nothing. Returns the compact text under
+    "report", the structured form under "report_json" and the report hash.
+    """
+    profile = args.get("profile") if isinstance(args.get("profile"), dict) else args
+    report = build_report(profile)
+    return {"report": render_text(report), "report_json": render_json(report), "report_hash": report["hash"]}
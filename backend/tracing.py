@@ -0,0 +1,190 @@
+"""Lightweight per-stage latency tracing.
+
+`span(name, **labels)` times a block of code. Every finished span:
+- is observed into a process-wide Prometheus-style histogram keyed by the span
+  name and labels (exported by `render_prometheus`, served on `/metrics`);
+- is appended to the current request's `Trace`, if one was started with
+  `start_trace()` (used for the optional `Server-Timing` response header).
+
+Spans can carry attributes (token counts, cache hits, ...) via `Span.set`;
+numeric attributes named in `COUNTED_ATTRIBUTES` are also summed into counters.
+The current trace lives in a contextvar, so concurrent requests never mix spans.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "1") not in ("0", "false", "False")
+TIMING_HEADER = os.environ.get("TRACING_TIMING_HEADER", "0") in ("1", "true", "True")
+
+# Latency buckets in seconds, from in-memory tool calls to slow LLM chains
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Span attributes that are also accumulated as counters: attribute -> metric name
+COUNTED_ATTRIBUTES = {
+    "prompt_tokens": "llm_prompt_tokens_total",
+    "completion_tokens": "llm_completion_tokens_total",
+    "cache_hit": "llm_cache_hits_total",
+    "coalesced": "llm_coalesced_total",
+}
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Span:
+    __slots__ = ("name", "labels", "attributes", "start", "duration")
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.attributes: Dict[str, Any] = {}
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+class Trace:
+    """Spans finished while handling one request."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def server_timing(self) -> str:
+        """Render as a `Server-Timing` header value (one entry per span, in finish order)."""
+        with self._lock:
+            spans = list(self.spans)
+        parts = []
+        for s in spans:
+            name = s.name.replace(".", "_")
+            if s.labels:
+                name += "_" + "_".join(str(v) for v in s.labels.values())
+            parts.append(f"{name};dur={s.duration * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[LabelKey, List[float]] = {}  # bucket counts..., sum, count
+        self._counters: Dict[LabelKey, float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0.0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {k: list(v) for k, v in self._histograms.items()}, dict(self._counters)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = _Registry()
+
+
+def start_trace() -> Trace:
+    """Start collecting spans for the current request/task context."""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **labels: Any) -> Iterator[Span]:
+    """Time the enclosed block as stage `name`; labels become histogram labels."""
+    s = Span(name, {k: str(v) for k, v in labels.items()})
+    try:
+        yield s
+    finally:
+        s.duration = time.perf_counter() - s.start
+        if TRACING_ENABLED:
+            registry.observe("stage_duration_seconds", {"stage": name, **s.labels}, s.duration)
+            for attr, metric in COUNTED_ATTRIBUTES.items():
+                value = s.attributes.get(attr)
+                if isinstance(value, (int, float)) and value:
+                    registry.inc(metric, {"stage": name, **s.labels}, float(value))
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add(s)
+
+
+def traced(name: str, **labels: Any):
+    """Decorator form of `span` for plain functions (e.g. LangGraph nodes)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus() -> str:
+    """Render all histograms and counters in the Prometheus text exposition format."""
+    histograms, counters = registry.snapshot()
+    lines: List[str] = []
+    for metric in sorted({k[0] for k in histograms}):
+        lines.append(f"# TYPE {metric} histogram")
+        for (name, labels), h in sorted(histograms.items()):
+            if name != metric:
+                continue
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f"{metric}_bucket{_labels_text(labels, (('le', repr(bound)),))} {int(count)}")
+            lines.append(f"{metric}_bucket{_labels_text(labels, (('le', '+Inf'),))} {int(h[-1])}")
+            lines.append(f"{metric}_sum{_labels_text(labels)} {h[-2]:.6f}")
+            lines.append(f"{metric}_count{_labels_text(labels)} {int(h[-1])}")
+    for metric in sorted({k[0] for k in counters}):
+        lines.append(f"# TYPE {metric} counter")
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f"{metric}{_labels_text(labels)} {value:g}")
+    return "\n".join(lines) + "\n"